@@ -1,106 +1,529 @@
 import os
+from datetime import datetime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from dotenv import load_dotenv
-from flask import Flask
+from flask import Flask, Response, request, send_file, stream_with_context
+from werkzeug.sansio.http import is_resource_modified
 import psycopg2
+import psycopg2.errors
 from psycopg2 import sql
-from sqlalchemy import create_engine
-import json
-import dataset_scrapper
+import city_registry
+import compression
+import connection_pool
+import pagination
 import queries
+import request_metrics
+import response_cache
+import serializer
+import spatial_index
+import table_filters
+import table_export
 
 load_dotenv()
 app = Flask(__name__)
-url = os.getenv("DATABASE_URL")
-url_alchemy = os.getenv("SQLALCHEMY_URL")
-engine = create_engine(url_alchemy)
 current_cwd = os.getcwd()
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4'
+STREAM_FETCH_SIZE = 2000
+EXPORT_FETCH_SIZE = table_export.EXPORT_BATCH_SIZE
+DEFAULT_DEPARTURES_LIMIT = 10
+MAX_DEPARTURES_LIMIT = 100
+
+
+registry = city_registry.CityRegistry(current_cwd, check_interval=float(
+    os.getenv('CITY_CONFIG_CHECK_INTERVAL', city_registry.DEFAULT_CHECK_INTERVAL)))
+city_registry.install_reload_signal(registry)
 
 
 def get_city_dict(city_name) -> dict:
-    data = dataset_scrapper.read_json(current_cwd)
-    for city in data:
-        if city['city_name'] == city_name:
-            return city
+    return registry.get_by_name(city_name)
+
+
+def load_feed_version(city_id: int):
+    """ Returns (version, loaded_at) of the city written by main_scrapper,
+     (0, None) if city was not loaded yet, None if feed_version table doesn't exist
+    """
+    try:
+        with connection_pool.get_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql.SQL(queries.GET_FEED_VERSION), (city_id,))
+                row = cursor.fetchone()
+    except psycopg2.ProgrammingError:
+        return None
+    return (0, None) if row is None else tuple(row)
+
+
+cache = response_cache.ResponseCache(int(os.getenv('RESPONSE_CACHE_MAX_BYTES', response_cache.DEFAULT_MAX_BYTES)))
+feed_versions = response_cache.FeedVersions(load_feed_version,
+                                            float(os.getenv('FEED_VERSION_TTL', response_cache.DEFAULT_VERSION_TTL)))
+
+
+def json_response(body: bytes, status: int = 200, encoding: str = None) -> Response:
+    response = Response(body, status, mimetype=JSON_MIMETYPE)
+    if encoding is not None:
+        response.content_encoding = encoding
+    return response
+
+
+@app.before_request
+def start_request_metrics():
+    if request_metrics.ENABLED:
+        request_metrics.start_request(request.url_rule.rule if request.url_rule is not None else 'unmatched')
+
+
+# registered before compress_response, so it runs after it (after_request functions run in reverse order)
+# and counts bytes of compressed body
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    """ Records phases, rows and response bytes of the request when its body was sent (streamed bodies too) """
+    timer = request_metrics.get_current()
+    if timer is None:
+        return response
+    if response.content_length is not None:
+        timer.response_bytes = response.content_length
+    elif response.is_streamed:
+        response.response = request_metrics.count_bytes(response.response, timer)
+    status = response.status_code
+    response.call_on_close(lambda: request_metrics.finish_request(timer, status))
+    return response
+
+
+@app.after_request
+def compress_response(response: Response) -> Response:
+    """ Compresses JSON responses with the best encoding from Accept-Encoding header,
+     streamed responses are compressed chunk by chunk. Responses already compressed by the handler are left as they are
+    """
+    if response.status_code == 304 or response.mimetype in (JSON_MIMETYPE, NDJSON_MIMETYPE):
+        response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or response.content_encoding or \
+            response.mimetype not in (JSON_MIMETYPE, NDJSON_MIMETYPE):
+        return response
+    encoding = compression.choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compression.compress_stream(response.response, encoding)
+    else:
+        body = response.get_data()
+        if len(body) < compression.MIN_SIZE:
+            return response
+        with request_metrics.phase('compress'):
+            response.set_data(compression.compress(body, encoding))
+    response.content_encoding = encoding
+    return response
 
 
 @app.get("/mpk/")
 def get_cities():
-    with psycopg2.connect(url) as connection:
+    with connection_pool.get_pool().connection() as connection:
         with connection.cursor() as cursor:
             cursor.execute(sql.SQL(queries.GET_ALL_CITIES))
-            r = []
-            column = [column[0] for column in cursor.description]
-            for row in cursor.fetchall():
-                r.append(dict(zip(column, row)))
-    return json.dumps(r), 200
+            rows = cursor.fetchall()
+            column = serializer.get_columns(cursor.description)
+    with request_metrics.phase('serialize'):
+        return json_response(serializer.encode_rows(column, rows))
 
 
-@app.get("/routes/<string:city_name>")
-def get_city_routes(city_name):
+def get_page_query(args, city_id: int, table_name: str, fields: list = None, conditions: sql.Composable = None,
+                   condition_params: list = ()):
+    """ Returns (query, params, limit) of one page of the table ordered by its natural key.
+     Page size is given by *limit* parameter, next page starts after the opaque *after* cursor.
+     Key columns are always selected, they are needed for the cursor
+    """
+    key_columns = queries.TABLE_KEY_COLUMNS[table_name]
+    limit = pagination.parse_limit(args.get('limit'))
+    after = args.get('after')
+    after_values = None if after is None else pagination.decode_cursor(after, key_columns)
+    if fields is not None:
+        fields = fields + [column for column in key_columns if column not in fields]
+    query = pagination.build_page_query(table_name, fields, key_columns, after_values, conditions)
+    return query, [city_id] + list(condition_params) + (after_values or []) + [limit], limit
+
+
+def encode_page(table_name: str, rows: list, column: list, limit: int, shape: str) -> bytes:
+    with request_metrics.phase('serialize'):
+        next_cursor = pagination.get_next_cursor(rows, column, queries.TABLE_KEY_COLUMNS[table_name], limit)
+        return serializer.dumps(serializer.rows_to_body(column, rows, shape, next=next_cursor))
+
+
+def get_table_page(city_id: int, table_name: str, shape: str = serializer.RECORDS_SHAPE, fields: list = None,
+                   conditions: sql.Composable = None, condition_params: list = ()) -> bytes:
+    """ Returns one page of the table read with server-side cursor """
+    query, params, limit = get_page_query(request.args, city_id, table_name, fields, conditions, condition_params)
+    with connection_pool.get_pool().connection() as connection:
+        with connection.cursor(name=f'{table_name}_page') as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchmany(limit)
+            column = serializer.get_columns(cursor.description)
+    return encode_page(table_name, rows, column, limit, shape)
+
+
+def get_table_json(query: sql.Composable, params: list, shape: str = serializer.RECORDS_SHAPE) -> bytes:
+    with connection_pool.get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            column = serializer.get_columns(cursor.description)
+    with request_metrics.phase('serialize'):
+        return serializer.encode_rows(column, rows, shape)
+
+
+def wants_stream(req=request) -> bool:
+    """ Streaming is opt-in, with *Accept: application/x-ndjson* header or *stream* parameter """
+    return req.accept_mimetypes.best == NDJSON_MIMETYPE or \
+        req.args.get('stream', '').lower() in ('1', 'true')
+
+
+def get_stream_framing(column: list, shape: str, ndjson: bool):
+    """ Returns (head, separator, tail) of streamed body, rows encoded by serializer.encode_rows_chunk
+     are put between head and tail. In columns shape column names are sent once (first line of ndjson)
+    """
+    columns_shape = shape == serializer.COLUMNS_SHAPE
+    if ndjson:
+        return (serializer.dumps(column) + b'\n' if columns_shape else b''), b'\n', b''
+    if columns_shape:
+        return b'{"columns":' + serializer.dumps(column) + b',"rows":[', b',', b']}'
+    return b'[', b',', b']'
+
+
+def stream_table(table_name: str, query: sql.Composable, params: list,
+                 shape: str = serializer.RECORDS_SHAPE) -> Response:
+    """ Streams whole table as it is fetched with server-side cursor, rows are never held in memory all at once.
+     Returns newline delimited json for *Accept: application/x-ndjson*, chunked json array otherwise.
+     In columns shape column names are sent once (first line of ndjson) and rows are sent as arrays
+    """
+    ndjson = request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+    def generate():
+        with connection_pool.get_pool().connection() as connection:
+            with connection.cursor(name=f'{table_name}_stream') as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                column = serializer.get_columns(cursor.description)
+                head, separator, tail = get_stream_framing(column, shape, ndjson)
+                first = True
+                if head:
+                    yield head
+                while rows:
+                    with request_metrics.phase('serialize'):
+                        chunk = serializer.encode_rows_chunk(column, rows, shape, separator)
+                    if ndjson:
+                        yield chunk + b'\n'
+                    else:
+                        yield chunk if first else separator + chunk
+                    first = False
+                    rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                if tail:
+                    yield tail
+
+    return Response(stream_with_context(generate()),
+                    mimetype=NDJSON_MIMETYPE if ndjson else JSON_MIMETYPE)
+
+
+def get_feed_etag(city_id: int, feed_version) -> str:
+    return f'{city_id}-{feed_version[0]}'
+
+
+def set_validators(response: Response, city_id: int, feed_version) -> Response:
+    """ Adds ETag and Last-Modified headers derived from feed version of the city """
+    if feed_version is not None and feed_version[1] is not None:
+        response.set_etag(get_feed_etag(city_id, feed_version), weak=True)
+        response.last_modified = feed_version[1]
+        response.cache_control.no_cache = True
+    return response
+
+
+def check_not_modified(city_id: int, feed_version, req=request) -> bool:
+    """ Returns True if client's If-None-Match / If-Modified-Since matches current feed version of the city """
+    if feed_version is None or feed_version[1] is None:
+        return False
+    return not is_resource_modified(http_if_none_match=req.headers.get('If-None-Match'),
+                                    http_if_modified_since=req.headers.get('If-Modified-Since'),
+                                    etag=get_feed_etag(city_id, feed_version), last_modified=feed_version[1])
+
+
+def parse_date(value: str):
+    """ Parses YYYY-MM-DD date, raises ValueError for incorrect date """
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'Incorrect date {value}, expected YYYY-MM-DD')
+
+
+def parse_table_request(args, table_name: str, date_condition: str = None):
+    """ Parses query parameters of table endpoint, raises ValueError for incorrect parameters
+
+    Returns
+    -------
+    result
+        (paginated, shape, fields, conditions, condition_params) tuple
+
+    """
+    paginated = 'limit' in args or 'after' in args
+    shape = serializer.parse_shape(args.get('shape'))
+    fields = table_filters.parse_fields(args.get('fields'), table_name)
+    conditions, condition_params = table_filters.build_conditions(table_filters.parse_filters(args, table_name))
+    if date_condition is not None and args.get('date'):
+        conditions += sql.SQL(date_condition).format(table_name=sql.Identifier(table_name))
+        condition_params.append(parse_date(args['date']))
+    return paginated, shape, fields, conditions, condition_params
+
+
+def get_cache_key(args, table_name: str, city_id: int) -> tuple:
+    return table_name, city_id, tuple(sorted(args.items(multi=True)))
+
+
+def get_cached_body(cache_key: tuple, version, encoding: str):
+    """ Returns (body, encoding) from cache, body compressed with *encoding* if it is cached,
+     uncompressed body (with None encoding) otherwise and (None, None) on miss
+    """
+    if version is None:
+        return None, None
+    if encoding is not None:
+        body = cache.get(cache_key + (encoding,), version)
+        if body is not None:
+            return body, encoding
+    return cache.get(cache_key, version), None
+
+
+def cache_body(cache_key: tuple, version, encoding: str, body: bytes, cached: bool = False):
+    """ Caches serialized body (unless it is already *cached*), compresses it with *encoding*
+     and caches compressed body too. Returns (body, encoding), encoding is None if body was too small to compress
+    """
+    if version is not None and not cached:
+        cache.put(cache_key, version, body)
+    if encoding is None or len(body) < compression.MIN_SIZE:
+        return body, None
+    body = compression.compress(body, encoding, None if version is None else compression.CACHED_LEVELS[encoding])
+    if version is not None:
+        cache.put(cache_key + (encoding,), version, body)
+    return body, encoding
+
+
+def get_table_response(city_name: str, table_name: str, query: str, date_condition: str = None):
+    """ Returns table of the city. Serialized responses are cached until main_scrapper loads new feed of the city,
+     clients sending ETag or Last-Modified of current feed get 304 without reading the table.
+     *fields* parameter selects columns and whitelisted filter parameters (queries.TABLE_FILTERS) select rows.
+     With *date* parameter *date_condition* returns only records of services running on that date,
+     with *shape=columns* rows are returned as arrays with column names listed once.
+     Compressed bodies are cached next to uncompressed ones, so every encoding is computed once per feed version
+    """
     city = get_city_dict(city_name)
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
     city_id = city['city_id']
     try:
-        with psycopg2.connect(url) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(sql.SQL(queries.GET_ROUTE_TABLE), (city_id,))
-                r = []
-                column = [column[0] for column in cursor.description]
-                for row in cursor.fetchall():
-                    r.append(dict(zip(column, row)))
-        return json.dumps(r), 200
+        paginated, shape, fields, conditions, condition_params = parse_table_request(request.args, table_name,
+                                                                                     date_condition)
+        query = table_filters.build_table_query(query, fields, conditions)
+        params = [city_id] + condition_params
+        feed_version = feed_versions.get(city_id)
+        if check_not_modified(city_id, feed_version):
+            return set_validators(Response(status=304), city_id, feed_version)
+        if wants_stream():
+            return set_validators(stream_table(table_name, query, params, shape), city_id, feed_version)
+        cache_key = get_cache_key(request.args, table_name, city_id)
+        version = None if feed_version is None else feed_version[0]
+        encoding = compression.choose_encoding(request.accept_encodings)
+        body, body_encoding = get_cached_body(cache_key, version, encoding)
+        if body_encoding is None:
+            cached = body is not None
+            if not cached and paginated:
+                body = get_table_page(city_id, table_name, shape, fields, conditions, condition_params)
+            elif not cached:
+                body = get_table_json(query, params, shape)
+            body, body_encoding = cache_body(cache_key, version, encoding, body, cached)
+        return set_validators(json_response(body, encoding=body_encoding), city_id, feed_version)
+    except ValueError as e:
+        return {"message": str(e)}, 400
     except KeyError:
-        return {"message": f"City {city_name} with table routes not found"}, 404
+        return {"message": f"City {city_name} with table {table_name} not found"}, 404
+
+
+@app.get("/routes/<string:city_name>")
+def get_city_routes(city_name):
+    return get_table_response(city_name, 'routes', queries.GET_ROUTE_TABLE)
 
 
 @app.get("/trips/<string:city_name>")
 def get_city_trips(city_name):
-    city = get_city_dict(city_name)
-    city_id = city['city_id']
-    try:
-        with psycopg2.connect(url) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(sql.SQL(queries.GET_TRIPS_TABLE), (city_id,))
-                r = []
-                column = [column[0] for column in cursor.description]
-                for row in cursor.fetchall():
-                    r.append(dict(zip(column, row)))
-        return json.dumps(r), 200
-    except KeyError:
-        return {"message": f"City {city_name} with table trips not found"}, 404
+    return get_table_response(city_name, 'trips', queries.GET_TRIPS_TABLE, queries.SERVICE_DATE_CONDITION)
 
 
 @app.get("/stops/<string:city_name>")
 def get_city_stops(city_name):
+    return get_table_response(city_name, 'stops', queries.GET_STOPS_TABLE)
+
+
+def load_stop_locations(city_id: int) -> list:
+    with connection_pool.get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(sql.SQL(queries.GET_STOP_LOCATIONS), (city_id,))
+            column = [column[0] for column in cursor.description]
+            return [dict(zip(column, row)) for row in cursor.fetchall()]
+
+
+stop_indexes = spatial_index.StopIndexCache(load_stop_locations)
+
+
+@app.get("/stops/<string:city_name>/nearby")
+def get_city_nearby_stops(city_name):
+    """ Returns stops closest to *lat*, *lon* within *radius* meters, found in grid index of city stops.
+     Index is built on first request and again after main_scrapper loads new feed of the city
+    """
     city = get_city_dict(city_name)
-    city_id = city['city_id']
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
+    try:
+        lat, lon = spatial_index.parse_point(request.args['lat'], request.args['lon'])
+        radius, limit = spatial_index.parse_search(request.args.get('radius'), request.args.get('limit'))
+    except (KeyError, ValueError):
+        return {"message": "Parameters lat and lon are required and have to be valid coordinates, "
+                           "radius has to be a positive number and limit a positive integer"}, 400
+    feed_version = feed_versions.get(city['city_id'])
+    index = stop_indexes.get(city['city_id'], None if feed_version is None else feed_version[0])
+    r = [dict(stop, distance=round(distance, 1)) for distance, stop in index.nearest(lat, lon, radius, limit)]
+    with request_metrics.phase('serialize'):
+        return json_response(serializer.dumps(r))
+
+
+def parse_gtfs_time(value: str) -> str:
+    """ Converts H:MM or H:MM:SS time to zero padded HH:MM:SS used by GTFS stop_times,
+     hours can be greater than 23 for trips after midnight. Raises ValueError for incorrect time
+    """
+    parts = [int(part) for part in value.split(':')]
+    if len(parts) == 2:
+        parts.append(0)
+    if len(parts) != 3 or min(parts) < 0 or parts[1] > 59 or parts[2] > 59:
+        raise ValueError(f'Incorrect time {value}')
+    return '{:02d}:{:02d}:{:02d}'.format(*parts)
+
+
+def get_city_now(city: dict) -> datetime:
+    """ Returns current time in *timezone* of the city (agency_timezone of its feed), raises ValueError
+     if the city has no valid timezone in cities.json
+    """
+    try:
+        return datetime.now(ZoneInfo(city['timezone']))
+    except (KeyError, ValueError, ZoneInfoNotFoundError):
+        raise ValueError(f'City {city["city_name"]} has no valid timezone, parameters date and at are required')
+
+
+def parse_departures_args(args, city: dict) -> dict:
+    """ Returns time, date and limit parameters of GET_DEPARTURES query. Missing *date* and *at* default to
+     current date and time of the city. Raises ValueError for incorrect values
+    """
+    now = None if args.get('at') and args.get('date') else get_city_now(city)
+    at = parse_gtfs_time(args.get('at') or now.strftime('%H:%M:%S'))
+    date = parse_date(args.get('date') or now.strftime('%Y-%m-%d'))
+    limit = int(args.get('limit', DEFAULT_DEPARTURES_LIMIT))
+    if limit < 1:
+        raise ValueError(f'Incorrect limit {limit}, expected positive integer')
+    return {'time': at, 'date': date, 'limit': min(limit, MAX_DEPARTURES_LIMIT)}
+
+
+@app.get("/departures/<string:city_name>/<string:stop_id>")
+def get_stop_departures(city_name, stop_id):
+    """ Returns next departures from the stop, starting at *date* (today by default) and *at* time (now by default),
+     in timezone of the city. Only trips of services running on that date (or the day before, for trips after midnight)
+     are returned, read from (city_id, stop_id, departure_time) index of stop_times joined with trips, routes
+     and service_dates
+    """
+    city = get_city_dict(city_name)
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
     try:
-        with psycopg2.connect(url) as connection:
+        params = parse_departures_args(request.args, city)
+        shape = serializer.parse_shape(request.args.get('shape'))
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    try:
+        with connection_pool.get_pool().connection() as connection:
             with connection.cursor() as cursor:
-                cursor.execute(sql.SQL(queries.GET_STOPS_TABLE), (city_id,))
-                r = []
-                column = [column[0] for column in cursor.description]
-                for row in cursor.fetchall():
-                    r.append(dict(zip(column, row)))
-        return json.dumps(r), 200
-    except KeyError:
-        return {"message": f"City {city_name} with table stops not found"}, 404
+                cursor.execute(sql.SQL(queries.GET_DEPARTURES), dict(params, city_id=city['city_id'], stop_id=stop_id))
+                rows = cursor.fetchall()
+                column = serializer.get_columns(cursor.description)
+    except psycopg2.errors.UndefinedTable:
+        return {"message": f"Departures of city {city_name} are not available yet"}, 503
+    with request_metrics.phase('serialize'):
+        return json_response(serializer.encode_rows(column, rows, shape))
 
 
 @app.get("/stop_times/<string:city_name>")
 def get_city_stop_times(city_name):
+    return get_table_response(city_name, 'stop_times', queries.GET_STOP_TIMES_TABLE)
+
+
+def export_table(city_id: int, table_name: str, path: str, export_format: str):
+    """ Writes table of the city to export file, rows are fetched with server-side cursor batch by batch """
+    with connection_pool.get_pool().connection() as connection:
+        with connection.cursor(name=f'{table_name}_export') as cursor:
+            cursor.execute(sql.SQL(queries.GET_EXPORT_TABLE).format(table_name=sql.Identifier(table_name)),
+                           (city_id,))
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+
+            def batches():
+                batch = rows
+                while batch:
+                    yield batch
+                    batch = cursor.fetchmany(EXPORT_FETCH_SIZE)
+
+            table_export.write_export(path, cursor.description, batches(), export_format)
+
+
+@app.get("/export/<string:city_name>/<string:table_name>")
+def get_table_export(city_name, table_name):
+    """ Returns whole table of the city as Arrow IPC file (default) or Parquet file (*format=parquet*).
+     File is generated once per feed version and kept in export_files directory
+    """
     city = get_city_dict(city_name)
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
+    if table_name not in table_export.EXPORT_TABLES:
+        return {"message": f"City {city_name} with table {table_name} not found"}, 404
+    export_format = request.args.get('format', 'arrow')
+    if export_format not in table_export.EXPORT_FORMATS:
+        return {"message": f"Format {export_format} is not supported"}, 400
+    if not table_export.is_available():
+        return {"message": "Export requires pyarrow package"}, 501
     city_id = city['city_id']
-    try:
-        with psycopg2.connect(url) as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(sql.SQL(queries.GET_STOP_TIMES_TABLE), (city_id,))
-                r = []
-                column = [column[0] for column in cursor.description]
-                for row in cursor.fetchall():
-                    r.append(dict(zip(column, row)))
-        return json.dumps(r), 200
-    except KeyError:
-        return {"message": f"City {city_name} with table stop_times not found"}, 404
+    feed_version = feed_versions.get(city_id)
+    if check_not_modified(city_id, feed_version):
+        return set_validators(Response(status=304), city_id, feed_version)
+    version = 0 if feed_version is None else feed_version[0]
+    path = table_export.get_export_path(current_cwd, city_name, table_name, version, export_format)
+    with table_export.get_lock(path):
+        if feed_version is None or not os.path.exists(path):
+            export_table(city_id, table_name, path, export_format)
+            table_export.delete_other_versions(current_cwd, city_name, table_name, path)
+    response = send_file(path, mimetype=table_export.EXPORT_FORMATS[export_format][1],
+                         download_name=os.path.basename(path), etag=False)
+    return set_validators(response, city_id, feed_version)
+
+
+@app.get("/pool/stats")
+def get_pool_stats():
+    return connection_pool.get_pool().stats(), 200
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return cache.stats(), 200
+
+
+@app.get("/metrics")
+def get_metrics():
+    """ Returns request metrics (with API_METRICS=1), pool and cache stats in Prometheus text format """
+    body = request_metrics.metrics.to_prometheus() + \
+        request_metrics.render_gauges('db_pool', connection_pool.get_pool().stats()) + \
+        request_metrics.render_gauges('response_cache', cache.stats())
+    return Response(body, mimetype=PROMETHEUS_MIMETYPE)
+
+
+@app.errorhandler(connection_pool.PoolTimeoutError)
+def handle_pool_timeout(e):
+    return {"message": str(e)}, 503
 
 
 @app.get('/')
@@ -0,0 +1,321 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+import aiopg
+import psycopg2
+import psycopg2.errors
+from psycopg2 import sql
+from quart import Quart, Response, request, send_file
+import app as flask_app
+import compression
+import connection_pool
+import queries
+import request_metrics
+import response_cache
+import serializer
+import spatial_index
+import table_export
+import table_filters
+
+# same routes as app.py served by ASGI server (see hypercorn.toml), database is queried with aiopg,
+# so requests waiting for Postgres don't hold a thread each
+app = Quart(__name__)
+STREAM_FETCH_SIZE = flask_app.STREAM_FETCH_SIZE
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', connection_pool.DEFAULT_TIMEOUT))
+
+feed_versions = response_cache.FeedVersions(None, float(os.getenv('FEED_VERSION_TTL',
+                                                                  response_cache.DEFAULT_VERSION_TTL)))
+stop_indexes = spatial_index.StopIndexCache(None)
+_pool = None
+
+
+@app.before_serving
+async def open_pool():
+    global _pool
+    _pool = await aiopg.create_pool(connection_pool.url,
+                                    minsize=int(os.getenv('DB_POOL_MIN_SIZE', connection_pool.DEFAULT_MIN_SIZE)),
+                                    maxsize=int(os.getenv('DB_POOL_MAX_SIZE', connection_pool.DEFAULT_MAX_SIZE)))
+
+
+@app.after_serving
+async def close_pool():
+    _pool.close()
+    await _pool.wait_closed()
+
+
+@asynccontextmanager
+async def connection():
+    """ Borrows connection from the pool, waits for free connection up to DB_POOL_TIMEOUT seconds """
+    try:
+        conn = await asyncio.wait_for(_pool.acquire(), POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise connection_pool.PoolTimeoutError(f'No free database connection after {POOL_TIMEOUT} seconds')
+    try:
+        yield conn
+    finally:
+        await _pool.release(conn)
+
+
+async def fetch_all(query: sql.Composable, params=None):
+    """ Returns (column names, rows) of the query """
+    async with connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params)
+            return serializer.get_columns(cursor.description), await cursor.fetchall()
+
+
+async def get_feed_version(city_id: int):
+    """ Returns (version, loaded_at) of the city like app.load_feed_version, read at most once per FEED_VERSION_TTL """
+    found, version = feed_versions.get_fresh(city_id)
+    if found:
+        return version
+    try:
+        _, rows = await fetch_all(sql.SQL(queries.GET_FEED_VERSION), (city_id,))
+        version = (0, None) if not rows else tuple(rows[0])
+    except psycopg2.ProgrammingError:
+        version = None
+    feed_versions.set(city_id, version)
+    return version
+
+
+def json_response(body: bytes, status: int = 200, encoding: str = None) -> Response:
+    response = Response(body, status, mimetype=flask_app.JSON_MIMETYPE)
+    if encoding is not None:
+        response.content_encoding = encoding
+    return response
+
+
+@app.after_request
+async def compress_response(response: Response) -> Response:
+    """ Compresses JSON responses like app.compress_response, streamed responses are compressed by stream_table """
+    if response.status_code == 304 or response.mimetype in (flask_app.JSON_MIMETYPE, flask_app.NDJSON_MIMETYPE):
+        response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or response.content_encoding or response.mimetype != flask_app.JSON_MIMETYPE:
+        return response
+    encoding = compression.choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    body = await response.get_data()
+    if len(body) < compression.MIN_SIZE:
+        return response
+    response.set_data(await asyncio.to_thread(compression.compress, body, encoding))
+    response.content_encoding = encoding
+    return response
+
+
+@app.get("/mpk/")
+async def get_cities():
+    column, rows = await fetch_all(sql.SQL(queries.GET_ALL_CITIES))
+    return json_response(serializer.encode_rows(column, rows))
+
+
+def stream_table(table_name: str, query: sql.Composable, params: list, shape: str) -> Response:
+    """ Streams whole table like app.stream_table, rows are fetched from cursor declared in a transaction
+     (psycopg2 named cursors are not available in asynchronous mode)
+    """
+    ndjson = request.accept_mimetypes.best == flask_app.NDJSON_MIMETYPE
+    encoding = compression.choose_encoding(request.accept_encodings)
+    cursor_name = sql.Identifier(f'{table_name}_stream')
+
+    async def generate():
+        async with connection() as conn:
+            async with conn.cursor() as cursor:
+                async with cursor.begin():
+                    await cursor.execute(sql.SQL(queries.DECLARE_CURSOR).format(cursor_name=cursor_name, query=query),
+                                         params)
+                    fetch = sql.SQL(queries.FETCH_CURSOR).format(cursor_name=cursor_name)
+                    await cursor.execute(fetch, (STREAM_FETCH_SIZE,))
+                    rows = await cursor.fetchall()
+                    column = serializer.get_columns(cursor.description)
+                    head, separator, tail = flask_app.get_stream_framing(column, shape, ndjson)
+                    first = True
+                    if head:
+                        yield head
+                    while rows:
+                        chunk = serializer.encode_rows_chunk(column, rows, shape, separator)
+                        if ndjson:
+                            yield chunk + b'\n'
+                        else:
+                            yield chunk if first else separator + chunk
+                        first = False
+                        await cursor.execute(fetch, (STREAM_FETCH_SIZE,))
+                        rows = await cursor.fetchall()
+                    if tail:
+                        yield tail
+
+    body = generate() if encoding is None else compression.compress_async_stream(generate(), encoding)
+    response = Response(body, mimetype=flask_app.NDJSON_MIMETYPE if ndjson else flask_app.JSON_MIMETYPE)
+    if encoding is not None:
+        response.content_encoding = encoding
+    return response
+
+
+async def get_table_response(city_name: str, table_name: str, query: str, date_condition: str = None):
+    """ Returns table of the city like app.get_table_response, sharing its response cache """
+    city = flask_app.get_city_dict(city_name)
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
+    city_id = city['city_id']
+    try:
+        paginated, shape, fields, conditions, condition_params = flask_app.parse_table_request(
+            request.args, table_name, date_condition)
+        query = table_filters.build_table_query(query, fields, conditions)
+        params = [city_id] + condition_params
+        feed_version = await get_feed_version(city_id)
+        if flask_app.check_not_modified(city_id, feed_version, request):
+            return flask_app.set_validators(Response('', status=304), city_id, feed_version)
+        if flask_app.wants_stream(request):
+            return flask_app.set_validators(stream_table(table_name, query, params, shape), city_id, feed_version)
+        cache_key = flask_app.get_cache_key(request.args, table_name, city_id)
+        version = None if feed_version is None else feed_version[0]
+        encoding = compression.choose_encoding(request.accept_encodings)
+        body, body_encoding = flask_app.get_cached_body(cache_key, version, encoding)
+        if body_encoding is None:
+            cached = body is not None
+            if not cached and paginated:
+                page_query, page_params, limit = flask_app.get_page_query(request.args, city_id, table_name, fields,
+                                                                          conditions, condition_params)
+                column, rows = await fetch_all(page_query, page_params)
+                body = await asyncio.to_thread(flask_app.encode_page, table_name, rows, column, limit, shape)
+            elif not cached:
+                column, rows = await fetch_all(query, params)
+                body = await asyncio.to_thread(serializer.encode_rows, column, rows, shape)
+            body, body_encoding = await asyncio.to_thread(flask_app.cache_body, cache_key, version, encoding, body,
+                                                          cached)
+        return flask_app.set_validators(json_response(body, encoding=body_encoding), city_id, feed_version)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    except KeyError:
+        return {"message": f"City {city_name} with table {table_name} not found"}, 404
+
+
+@app.get("/routes/<string:city_name>")
+async def get_city_routes(city_name):
+    return await get_table_response(city_name, 'routes', queries.GET_ROUTE_TABLE)
+
+
+@app.get("/trips/<string:city_name>")
+async def get_city_trips(city_name):
+    return await get_table_response(city_name, 'trips', queries.GET_TRIPS_TABLE, queries.SERVICE_DATE_CONDITION)
+
+
+@app.get("/stops/<string:city_name>")
+async def get_city_stops(city_name):
+    return await get_table_response(city_name, 'stops', queries.GET_STOPS_TABLE)
+
+
+@app.get("/stops/<string:city_name>/nearby")
+async def get_city_nearby_stops(city_name):
+    """ Returns stops closest to *lat*, *lon* like app.get_city_nearby_stops """
+    city = flask_app.get_city_dict(city_name)
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
+    try:
+        lat, lon = spatial_index.parse_point(request.args['lat'], request.args['lon'])
+        radius, limit = spatial_index.parse_search(request.args.get('radius'), request.args.get('limit'))
+    except (KeyError, ValueError):
+        return {"message": "Parameters lat and lon are required and have to be valid coordinates, "
+                           "radius has to be a positive number and limit a positive integer"}, 400
+    feed_version = await get_feed_version(city['city_id'])
+    version = None if feed_version is None else feed_version[0]
+    index = stop_indexes.get_cached(city['city_id'], version)
+    if index is None:
+        column, rows = await fetch_all(sql.SQL(queries.GET_STOP_LOCATIONS), (city['city_id'],))
+        index = stop_indexes.put(city['city_id'], version, [dict(zip(column, row)) for row in rows])
+    r = [dict(stop, distance=round(distance, 1)) for distance, stop in index.nearest(lat, lon, radius, limit)]
+    return json_response(serializer.dumps(r))
+
+
+@app.get("/departures/<string:city_name>/<string:stop_id>")
+async def get_stop_departures(city_name, stop_id):
+    """ Returns next departures from the stop like app.get_stop_departures """
+    city = flask_app.get_city_dict(city_name)
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
+    try:
+        params = flask_app.parse_departures_args(request.args, city)
+        shape = serializer.parse_shape(request.args.get('shape'))
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    try:
+        column, rows = await fetch_all(sql.SQL(queries.GET_DEPARTURES),
+                                       dict(params, city_id=city['city_id'], stop_id=stop_id))
+    except psycopg2.errors.UndefinedTable:
+        return {"message": f"Departures of city {city_name} are not available yet"}, 503
+    return json_response(serializer.encode_rows(column, rows, shape))
+
+
+@app.get("/stop_times/<string:city_name>")
+async def get_city_stop_times(city_name):
+    return await get_table_response(city_name, 'stop_times', queries.GET_STOP_TIMES_TABLE)
+
+
+@app.get("/export/<string:city_name>/<string:table_name>")
+async def get_table_export(city_name, table_name):
+    """ Returns export file like app.get_table_export. Files are written in a worker thread
+     with synchronous connection pool, they are generated once per feed version
+    """
+    city = flask_app.get_city_dict(city_name)
+    if city is None:
+        return {"message": f"City {city_name} not found"}, 404
+    if table_name not in table_export.EXPORT_TABLES:
+        return {"message": f"City {city_name} with table {table_name} not found"}, 404
+    export_format = request.args.get('format', 'arrow')
+    if export_format not in table_export.EXPORT_FORMATS:
+        return {"message": f"Format {export_format} is not supported"}, 400
+    if not table_export.is_available():
+        return {"message": "Export requires pyarrow package"}, 501
+    city_id = city['city_id']
+    feed_version = await get_feed_version(city_id)
+    if flask_app.check_not_modified(city_id, feed_version, request):
+        return flask_app.set_validators(Response('', status=304), city_id, feed_version)
+    version = 0 if feed_version is None else feed_version[0]
+    path = table_export.get_export_path(flask_app.current_cwd, city_name, table_name, version, export_format)
+
+    def export():
+        with table_export.get_lock(path):
+            if feed_version is None or not os.path.exists(path):
+                flask_app.export_table(city_id, table_name, path, export_format)
+                table_export.delete_other_versions(flask_app.current_cwd, city_name, table_name, path)
+
+    await asyncio.to_thread(export)
+    response = await send_file(path, mimetype=table_export.EXPORT_FORMATS[export_format][1])
+    return flask_app.set_validators(response, city_id, feed_version)
+
+
+def pool_stats() -> dict:
+    return {'min_size': _pool.minsize, 'max_size': _pool.maxsize, 'open': _pool.size, 'idle': _pool.freesize}
+
+
+@app.get("/pool/stats")
+async def get_pool_stats():
+    return pool_stats(), 200
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return flask_app.cache.stats(), 200
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """ Returns pool and cache stats in Prometheus text format, request metrics are recorded by app.py only """
+    body = request_metrics.render_gauges('db_pool', pool_stats()) + \
+        request_metrics.render_gauges('response_cache', flask_app.cache.stats())
+    return Response(body, mimetype=flask_app.PROMETHEUS_MIMETYPE)
+
+
+@app.errorhandler(connection_pool.PoolTimeoutError)
+async def handle_pool_timeout(e):
+    return {"message": str(e)}, 503
+
+
+@app.get('/')
+async def home():
+    return {'message': 'Hello, world!'}
+
+
+if __name__ == '__main__':
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+    asyncio.run(serve(app, Config.from_toml(os.path.join(flask_app.current_cwd, 'hypercorn.toml'))))
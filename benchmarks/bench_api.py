@@ -0,0 +1,266 @@
+""" API benchmark: seeds Postgres with a synthetic city and measures latency of the API endpoints under load.
+
+Usage:
+    python benchmarks/bench_api.py --rows 100000 --concurrency 16 --requests 2000 --output bench_api.json
+    python benchmarks/bench_api.py --server async_app --headers "Accept-Encoding: gzip"
+    python benchmarks/bench_api.py --url http://localhost:8000 --skip-seed
+
+The benchmark city is loaded as *--city-id* into the Postgres from DATABASE_URL and deleted after the run.
+Unless *--url* is given, the server is started by the benchmark (gunicorn for app.py, hypercorn for async_app.py)
+in a directory with cities.json containing only the benchmark city, and its RSS (with worker processes)
+is sampled while every endpoint is measured.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+import bench_ingest
+import synthetic_gtfs
+
+PROJECT_PATH = bench_ingest.PROJECT_PATH
+DEFAULT_ENDPOINTS = ['/mpk/', '/routes/{city}', '/trips/{city}', '/stops/{city}', '/stop_times/{city}?limit=1000']
+DEFAULT_PORT = 8765
+SERVER_START_TIMEOUT = 30
+RSS_SAMPLE_INTERVAL = 0.2
+PERCENTILES = [50, 95, 99]
+
+
+def seed_city(work_dir: str, city: dict, stop_times_rows: int):
+    """ Generates feed of the benchmark city and loads it like main_scrapper does """
+    import database_updater
+    import main_scrapper
+    os.makedirs(bench_ingest.get_zip_dir(work_dir), exist_ok=True)
+    synthetic_gtfs.generate_feed(os.path.join(bench_ingest.get_zip_dir(work_dir), f"{city['city_name']}.zip"),
+                                 stop_times_rows)
+    database_updater.create_tables()
+    database_updater.create_indexes()
+    database_updater.sync_cities_table([city])
+    if not main_scrapper.update_city_tables_from_zip(work_dir, city, swap_partitions=False, delta=False):
+        raise RuntimeError('Loading benchmark city failed')
+
+
+def get_server_command(server: str, port: int) -> list:
+    if server == 'async_app':
+        return [sys.executable, '-m', 'hypercorn', '--config', os.path.join(PROJECT_PATH, 'hypercorn.toml'),
+                '--bind', f'127.0.0.1:{port}', 'async_app:app']
+    return [sys.executable, '-m', 'gunicorn', '-c', os.path.join(PROJECT_PATH, 'gunicorn.conf.py'),
+            '--bind', f'127.0.0.1:{port}', 'app:app']
+
+
+def start_server(server: str, port: int, work_dir: str, city: dict) -> subprocess.Popen:
+    """ Starts API server in *work_dir* with cities.json of the benchmark city and waits until it responds """
+    with open(os.path.join(work_dir, 'cities.json'), 'w', encoding='utf-8') as write_obj:
+        json.dump([dict(city, url='', direct_link=True)], write_obj)
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_PATH,
+                                                                            os.getenv('PYTHONPATH')])))
+    process = subprocess.Popen(get_server_command(server, port), cwd=work_dir, env=environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'Server did not respond in {SERVER_START_TIMEOUT} seconds')
+
+
+def get_process_tree_rss(pid: int) -> int:
+    """ Returns RSS in bytes of the process and its children (server workers), None if it can't be read """
+    try:
+        import psutil
+    except ImportError:
+        return _get_proc_tree_rss(pid)
+    try:
+        process = psutil.Process(pid)
+        return sum(child.memory_info().rss for child in [process] + process.children(recursive=True))
+    except psutil.Error:
+        return None
+
+
+def _get_proc_tree_rss(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status', encoding='ascii') as status:
+            rss = next(int(line.split()[1]) * 1024 for line in status if line.startswith('VmRSS:'))
+        with open(f'/proc/{pid}/task/{pid}/children', encoding='ascii') as children:
+            child_pids = [int(child) for child in children.read().split()]
+    except (OSError, StopIteration):
+        return None
+    return rss + sum(_get_proc_tree_rss(child) or 0 for child in child_pids)
+
+
+class RssSampler(threading.Thread):
+    """ Samples RSS of the server every RSS_SAMPLE_INTERVAL seconds and remembers the peak """
+
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = get_process_tree_rss(self.pid)
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop_event.wait(RSS_SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def get_percentile(sorted_values: list, percentile: float) -> float:
+    """ Returns nearest-rank percentile of sorted values """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * percentile // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_load(base_url: str, path: str, requests: int, concurrency: int, headers: dict) -> dict:
+    """ Sends *requests* GET requests to the path from *concurrency* threads, every thread keeps one connection
+
+    Returns
+    -------
+    result
+        Dictionary with number of requests, errors, throughput, latency percentiles in milliseconds and bytes received
+
+    """
+    url = urllib.parse.urlsplit(base_url)
+    latencies = []
+    counters = {'errors': 0, 'bytes': 0}
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def worker():
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            start = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                ok = response.status in (200, 304)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+                body, ok = b'', False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                    counters['bytes'] += len(body)
+                else:
+                    counters['errors'] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    result = {'requests': requests, 'errors': counters['errors'], 'seconds': round(elapsed, 4),
+              'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+              'bytes_per_response': round(counters['bytes'] / len(latencies)) if latencies else None}
+    for percentile in PERCENTILES:
+        value = get_percentile(latencies, percentile)
+        result[f'p{percentile}_ms'] = None if value is None else round(value * 1000, 2)
+    return result
+
+
+def parse_headers(values: list) -> dict:
+    headers = {}
+    for value in values or []:
+        name, _, header_value = value.partition(':')
+        headers[name.strip()] = header_value.strip()
+    return headers
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Measure API endpoints under concurrent load')
+    parser.add_argument('--rows', type=int, default=100000, help='number of stop_times rows of the synthetic city')
+    parser.add_argument('--city-id', type=int, default=bench_ingest.BENCH_CITY_ID)
+    parser.add_argument('--city-name', default=bench_ingest.BENCH_CITY_NAME)
+    parser.add_argument('--server', choices=['app', 'async_app'], default='app', help='server started by benchmark')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--url', help='measure already running server instead of starting one')
+    parser.add_argument('--skip-seed', action='store_true', help='use benchmark city already in the database')
+    parser.add_argument('--keep-data', action='store_true', help="don't delete benchmark city after the run")
+    parser.add_argument('--endpoints', nargs='+', default=DEFAULT_ENDPOINTS,
+                        help='paths to measure, {city} is replaced with the city name')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=500, help='number of measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=10, help='requests per endpoint sent before measuring')
+    parser.add_argument('--headers', nargs='+', help='request headers, for example "Accept-Encoding: gzip"')
+    parser.add_argument('--output', help='write results to json file instead of stdout')
+    args = parser.parse_args(argv)
+
+    city = {'city_id': args.city_id, 'city_name': args.city_name}
+    headers = parse_headers(args.headers)
+    work_dir = tempfile.mkdtemp(prefix='bench_api_')
+    server = None
+    report = {'benchmark': 'api', 'started_at': datetime.now(timezone.utc).isoformat(),
+              'commit': bench_ingest.get_git_commit(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'server': 'external' if args.url else args.server,
+              'stop_times_rows': None if args.skip_seed else args.rows, 'concurrency': args.concurrency,
+              'headers': headers, 'endpoints': []}
+    try:
+        if not args.skip_seed:
+            seed_city(work_dir, city, args.rows)
+        base_url = args.url
+        if base_url is None:
+            server = start_server(args.server, args.port, work_dir, city)
+            base_url = f'http://127.0.0.1:{args.port}'
+        for endpoint in args.endpoints:
+            path = endpoint.format(city=city['city_name'])
+            run_load(base_url, path, args.warmup, min(args.concurrency, max(args.warmup, 1)), headers)
+            sampler = None if server is None else RssSampler(server.pid)
+            if sampler is not None:
+                sampler.start()
+            result = run_load(base_url, path, args.requests, args.concurrency, headers)
+            if sampler is not None:
+                sampler.stop()
+                result['server_peak_rss_bytes'] = sampler.peak
+            report['endpoints'].append(dict(endpoint=path, **result))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if not args.skip_seed and not args.keep_data:
+            try:
+                bench_ingest.delete_benchmark_records(args.city_id)
+            except Exception as e:
+                print(f'Error when deleting benchmark records: {e}', file=sys.stderr)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as write_obj:
+            write_obj.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
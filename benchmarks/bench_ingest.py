@@ -0,0 +1,239 @@
+""" Ingest benchmark: generates synthetic GTFS feeds and measures every stage of main_scrapper on them.
+
+Usage:
+    python benchmarks/bench_ingest.py --rows 10000 100000 1000000 --output bench_ingest.json
+    python benchmarks/bench_ingest.py --rows 10000 --skip-database
+
+Every stage runs in its own process, so peak RSS reported for a stage is the peak of that stage only
+(including the interpreter and imported modules). Database stages need DATABASE_URL of a local Postgres
+with the feed tables created; records are loaded as city *--city-id* and deleted after the run.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+PROJECT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_PATH)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic_gtfs  # noqa: E402
+from instrumentation import get_peak_rss  # noqa: E402
+
+BENCH_CITY_NAME = 'Benchmark'
+BENCH_CITY_ID = 9999
+DATABASE_STAGES = ['staging', 'final_insert', 'streaming_ingest']
+# tables with records of the benchmark city besides feed tables
+CITY_TABLES = ['service_dates', 'feed_version', 'cities']
+
+
+def get_zip_dir(project_path: str) -> str:
+    # dataset_scrapper builds paths of project directories this way
+    return project_path + '\\zip_files'
+
+
+def get_csv_dir(project_path: str) -> str:
+    return project_path + '\\csv_files'
+
+
+def get_csv_path(project_path: str, table_name: str) -> str:
+    return os.path.join(get_csv_dir(project_path), f'{BENCH_CITY_NAME}-{table_name}.csv')
+
+
+def stage_result(stage: str, rows: int, seconds: float) -> dict:
+    return {'stage': stage, 'rows': rows, 'seconds': round(seconds, 4),
+            'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None}
+
+
+def run_unzip(project_path: str, city: dict, feed_rows: int) -> list:
+    import dataset_scrapper
+    dataset_scrapper.create_unzipped_folder(project_path, city['city_name'])
+    start = time.perf_counter()
+    if not dataset_scrapper.unzip_file(project_path, city['city_name']):
+        raise RuntimeError('unzip failed')
+    return [stage_result('unzip', feed_rows, time.perf_counter() - start)]
+
+
+def run_txt_to_csv(project_path: str, city: dict, feed_rows: int) -> list:
+    import dataset_scrapper
+    import queries
+    start = time.perf_counter()
+    for table in queries.TABLE_LIST:
+        if not dataset_scrapper.save_txt_to_csv_with_city_id_and_date(project_path, city, table['table_name']):
+            raise RuntimeError(f"conversion of {table['table_name']} failed")
+    return [stage_result('txt_to_csv', feed_rows, time.perf_counter() - start)]
+
+
+def run_column_pruning(project_path: str, city: dict, feed_rows: int) -> list:
+    import database_updater
+    import queries
+    start = time.perf_counter()
+    for table in queries.TABLE_LIST:
+        database_updater.delete_unnecessary_columns_in_csv(get_csv_path(project_path, table['table_name']),
+                                                           table['important_columns'])
+    return [stage_result('column_pruning', feed_rows, time.perf_counter() - start)]
+
+
+def run_csv_read(project_path: str, city: dict, feed_rows: int) -> list:
+    """ Reads pruned csv files row by row, like the csv fallback of main_scrapper.update_tables """
+    import database_updater
+    import queries
+    rows = 0
+    start = time.perf_counter()
+    for table in queries.TABLE_LIST:
+        with open(get_csv_path(project_path, table['table_name']), 'r', encoding='utf-8-sig', newline='') as read_obj:
+            rows += sum(1 for _ in database_updater.read_csv_rows(read_obj, table['important_columns'])[1])
+    return [stage_result('csv_read', rows, time.perf_counter() - start)]
+
+
+def run_staging_and_insert(project_path: str, city: dict, feed_rows: int) -> list:
+    """ COPY pruned csv files to staging tables, then replace records of the city, in one transaction """
+    import psycopg2
+    from psycopg2 import sql
+    import database_updater
+    import queries
+    staged = inserted = 0
+    staging_seconds = insert_seconds = 0.0
+    with psycopg2.connect(database_updater.url) as connection:
+        with connection.cursor() as cursor:
+            for table in queries.TABLE_LIST:
+                table_name = table['table_name']
+                with open(get_csv_path(project_path, table_name), 'r', encoding='utf-8-sig', newline='') as read_obj:
+                    reader = csv.reader(read_obj)
+                    columns = next(reader, [])
+                    start = time.perf_counter()
+                    cursor.execute(database_updater.get_staging_table_query(table_name))
+                    staged += database_updater.copy_rows_to_table(cursor, f'temp_{table_name}', columns, reader)
+                    staging_seconds += time.perf_counter() - start
+                start = time.perf_counter()
+                cursor.execute(sql.SQL(queries.DELETE_OLD_RECORDS).format(table_name=sql.Identifier(table_name)),
+                               (city['city_id'],))
+                cursor.execute(sql.SQL(table['insert_query']), (city['city_id'],))
+                inserted += max(cursor.rowcount, 0)
+                insert_seconds += time.perf_counter() - start
+    return [stage_result('staging', staged, staging_seconds), stage_result('final_insert', inserted, insert_seconds)]
+
+
+def run_streaming_ingest(project_path: str, city: dict, feed_rows: int) -> list:
+    """ Default path of main_scrapper, tables are streamed from zip file to COPY """
+    import main_scrapper
+    start = time.perf_counter()
+    if not main_scrapper.update_city_tables_from_zip(project_path, city, swap_partitions=False, delta=False):
+        raise RuntimeError('streaming ingest failed')
+    return [stage_result('streaming_ingest', feed_rows, time.perf_counter() - start)]
+
+
+def delete_benchmark_records(city_id: int):
+    import psycopg2
+    from psycopg2 import sql
+    import database_updater
+    import queries
+    with psycopg2.connect(database_updater.url) as connection:
+        with connection.cursor() as cursor:
+            for table_name in [table['table_name'] for table in queries.TABLE_LIST] + CITY_TABLES:
+                cursor.execute('SAVEPOINT cleanup')
+                try:
+                    cursor.execute(sql.SQL(queries.DELETE_OLD_RECORDS).format(
+                        table_name=sql.Identifier(table_name)), (city_id,))
+                except psycopg2.ProgrammingError:
+                    cursor.execute('ROLLBACK TO SAVEPOINT cleanup')
+
+
+def run_stage(function_name: str, project_path: str, city: dict, feed_rows: int) -> list:
+    """ Runs stage in a worker process and adds peak RSS of the process to the results """
+    with contextlib.redirect_stdout(sys.stderr):
+        results = globals()[function_name](project_path, city, feed_rows)
+    peak_rss = get_peak_rss()
+    for result in results:
+        result['peak_rss_bytes'] = peak_rss
+    return results
+
+
+# every stage reads files written by the stages before it
+STAGE_FUNCTIONS = [('unzip', 'run_unzip'), ('txt_to_csv', 'run_txt_to_csv'),
+                   ('column_pruning', 'run_column_pruning'), ('csv_read', 'run_csv_read'),
+                   ('staging', 'run_staging_and_insert'), ('streaming_ingest', 'run_streaming_ingest')]
+
+
+def run_benchmark(stop_times_rows: int, work_dir: str, city_id: int = BENCH_CITY_ID,
+                  skip_database: bool = False) -> dict:
+    """ Generates feed with given number of stop_times rows and runs every stage on it
+
+    Returns
+    -------
+    result
+        Dictionary with feed size and list of stage results (stage, rows, seconds, rows_per_second, peak_rss_bytes)
+
+    """
+    project_path = os.path.join(work_dir, f'project_{stop_times_rows}')
+    os.makedirs(get_zip_dir(project_path), exist_ok=True)
+    os.makedirs(get_csv_dir(project_path), exist_ok=True)
+    city = {'city_id': city_id, 'city_name': BENCH_CITY_NAME}
+    start = time.perf_counter()
+    size = synthetic_gtfs.generate_feed(os.path.join(get_zip_dir(project_path), f'{BENCH_CITY_NAME}.zip'),
+                                        stop_times_rows)
+    feed_rows = sum(size.values())
+    results = [dict(stage_result('generate', feed_rows, time.perf_counter() - start), peak_rss_bytes=None)]
+    context = multiprocessing.get_context('spawn')
+    for stage, function_name in STAGE_FUNCTIONS:
+        if skip_database and stage in DATABASE_STAGES:
+            continue
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                results.extend(pool.submit(run_stage, function_name, project_path, city, feed_rows).result())
+            except Exception as e:
+                results.append({'stage': stage, 'error': str(e)})
+    if not skip_database:
+        try:
+            delete_benchmark_records(city_id)
+        except Exception as e:
+            print(f'Error when deleting benchmark records: {e}', file=sys.stderr)
+    shutil.rmtree(project_path, ignore_errors=True)
+    return {'stop_times_rows': stop_times_rows, 'feed_rows': size, 'stages': results}
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=PROJECT_PATH, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Measure ingest stages on synthetic GTFS feeds')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                        help='number of stop_times rows of generated feeds')
+    parser.add_argument('--skip-database', action='store_true', help='run only stages which do not need Postgres')
+    parser.add_argument('--city-id', type=int, default=BENCH_CITY_ID, help='city_id of loaded benchmark records')
+    parser.add_argument('--work-dir', help='directory for generated files, temporary directory by default')
+    parser.add_argument('--output', help='write results to json file instead of stdout')
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bench_ingest_')
+    report = {'benchmark': 'ingest', 'started_at': datetime.now(timezone.utc).isoformat(),
+              'commit': get_git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'runs': [run_benchmark(rows, work_dir, args.city_id, args.skip_database)
+                       for rows in args.rows]}
+    if args.work_dir is None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as write_obj:
+            write_obj.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
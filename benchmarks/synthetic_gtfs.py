@@ -0,0 +1,116 @@
+import csv
+import io
+import math
+import random
+import zipfile
+
+DEFAULT_STOPS_PER_TRIP = 30
+TRIPS_PER_ROUTE = 100
+SERVICES = [('weekday', [1, 1, 1, 1, 1, 0, 0]), ('saturday', [0, 0, 0, 0, 0, 1, 0]), ('sunday', [0, 0, 0, 0, 0, 0, 1])]
+HEADSIGNS = ['Centrum', 'Dworzec Glowny', 'Osiedle Polnoc', 'Port Lotniczy', 'Zajezdnia', 'Stadion', 'Uniwersytet']
+
+# tables have the columns of real feeds, some of them are dropped by the loader
+COLUMNS = {'routes': ['route_id', 'agency_id', 'route_short_name', 'route_long_name', 'route_desc', 'route_type',
+                      'route_color'],
+           'trips': ['route_id', 'service_id', 'trip_id', 'trip_headsign', 'direction_id', 'shape_id',
+                     'wheelchair_accessible'],
+           'stops': ['stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon', 'zone_id'],
+           'stop_times': ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'stop_headsign',
+                          'pickup_type', 'drop_off_type'],
+           'calendar': ['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+                        'start_date', 'end_date'],
+           'calendar_dates': ['service_id', 'date', 'exception_type']}
+
+
+def format_gtfs_time(seconds: int) -> str:
+    """ Returns HH:MM:SS time, hours are greater than 23 for trips after midnight """
+    return '{:02d}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+def get_feed_size(stop_times_rows: int, stops_per_trip: int = DEFAULT_STOPS_PER_TRIP) -> dict:
+    """ Returns number of rows of every table of feed with given number of stop_times rows """
+    trips = max(1, math.ceil(stop_times_rows / stops_per_trip))
+    return {'routes': max(1, math.ceil(trips / TRIPS_PER_ROUTE)),
+            'trips': trips,
+            'stops': max(stops_per_trip * 2, stop_times_rows // 500),
+            'stop_times': stop_times_rows,
+            'calendar': len(SERVICES),
+            'calendar_dates': len(SERVICES) * 2}
+
+
+def _write_table(zip_file: zipfile.ZipFile, table_name: str, rows):
+    """ Writes rows to *table_name*.txt member of the zip file as they are generated """
+    with zip_file.open(table_name + '.txt', 'w') as raw:
+        with io.TextIOWrapper(raw, encoding='utf-8', newline='') as text:
+            writer = csv.writer(text)
+            writer.writerow(COLUMNS[table_name])
+            writer.writerows(rows)
+
+
+def generate_feed(zip_path: str, stop_times_rows: int, stops_per_trip: int = DEFAULT_STOPS_PER_TRIP,
+                  seed: int = 0) -> dict:
+    """ Generates GTFS zip file with given number of stop_times rows, other tables are scaled accordingly.
+     Rows are written as they are generated, so feeds bigger than memory can be generated
+
+    Parameters
+    ----------
+    zip_path
+        Path of the created zip file
+    stop_times_rows
+        Number of rows in stop_times.txt
+    stops_per_trip
+        Number of stops of every trip
+    seed
+        Seed of random generator, the same seed gives the same feed
+
+    Returns
+    -------
+    result
+        Dictionary with number of rows of every table
+
+    """
+    size = get_feed_size(stop_times_rows, stops_per_trip)
+    generator = random.Random(seed)
+    stops = [(f'{number}', f'{number:05d}', f'Stop {number}', round(51.0 + generator.random() * 0.2, 6),
+              round(16.9 + generator.random() * 0.3, 6), 'A') for number in range(size['stops'])]
+
+    def routes():
+        for number in range(size['routes']):
+            yield f'{number}', '1', f'{number}', f'Route {number}', f'Route {number} description', 3, 'FF0000'
+
+    def trips():
+        for number in range(size['trips']):
+            yield (f'{number // TRIPS_PER_ROUTE}', SERVICES[number % len(SERVICES)][0], f'{number}_{number % 97}^+',
+                   HEADSIGNS[number % len(HEADSIGNS)], number % 2, f'shape_{number // TRIPS_PER_ROUTE}_{number % 2}',
+                   1)
+
+    def stop_times():
+        written = 0
+        for number in range(size['trips']):
+            trip_id = f'{number}_{number % 97}^+'
+            time = generator.randrange(4 * 3600, 23 * 3600)
+            first_stop = generator.randrange(len(stops))
+            for sequence in range(1, min(stops_per_trip, stop_times_rows - written) + 1):
+                departure = format_gtfs_time(time)
+                yield (trip_id, departure, departure, stops[(first_stop + sequence) % len(stops)][0], sequence,
+                       HEADSIGNS[number % len(HEADSIGNS)], 0, 0)
+                time += generator.randrange(60, 180)
+                written += 1
+
+    def calendar():
+        for service_id, days in SERVICES:
+            yield [service_id] + days + ['20240101', '20241231']
+
+    def calendar_dates():
+        for service_id, _ in SERVICES:
+            yield service_id, '20240501', 2
+            yield service_id, '20241111', 2
+
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+        _write_table(zip_file, 'routes', routes())
+        _write_table(zip_file, 'trips', trips())
+        _write_table(zip_file, 'stops', stops)
+        _write_table(zip_file, 'stop_times', stop_times())
+        _write_table(zip_file, 'calendar', calendar())
+        _write_table(zip_file, 'calendar_dates', calendar_dates())
+    return size
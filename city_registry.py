@@ -0,0 +1,80 @@
+import os
+import signal
+import threading
+import time
+
+import dataset_scrapper
+
+DEFAULT_CHECK_INTERVAL = 5
+
+
+class CityRegistry:
+    """ Cities from the config file kept in memory and indexed by name and by id.
+     Config is read again when its modification time changes (checked at most every *check_interval* seconds)
+     or when *reload* is called, for example from a signal handler
+    """
+
+    def __init__(self, project_path: str, config_name: str = 'cities.json',
+                 check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.project_path = project_path
+        self.config_name = config_name
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._by_name = {}
+        self._by_id = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self.reload()
+
+    def _get_mtime(self):
+        try:
+            return os.path.getmtime(os.path.join(self.project_path, self.config_name))
+        except OSError:
+            return None
+
+    def reload(self):
+        """ Reads config file and rebuilds indexes """
+        mtime = self._get_mtime()
+        data = dataset_scrapper.read_json(self.project_path, self.config_name)
+        by_name = {city['city_name']: city for city in data}
+        by_id = {city['city_id']: city for city in data}
+        with self._lock:
+            self._by_name, self._by_id = by_name, by_id
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._get_mtime() != self._mtime:
+            self.reload()
+
+    def get_by_name(self, city_name: str):
+        """ Returns city dictionary, None if there is no city with given name """
+        self._reload_if_changed()
+        return self._by_name.get(city_name)
+
+    def get_by_id(self, city_id: int):
+        """ Returns city dictionary, None if there is no city with given id """
+        self._reload_if_changed()
+        return self._by_id.get(city_id)
+
+    def cities(self) -> list:
+        self._reload_if_changed()
+        return list(self._by_id.values())
+
+
+def install_reload_signal(registry: CityRegistry, signal_name: str = 'SIGHUP') -> bool:
+    """ Reloads registry when process receives given signal.
+     Returns False if signal is not available on the platform or handler can't be installed from this thread
+    """
+    signal_number = getattr(signal, signal_name, None)
+    if signal_number is None:
+        return False
+    try:
+        signal.signal(signal_number, lambda signum, frame: registry.reload())
+    except ValueError:
+        return False
+    return True
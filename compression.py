@@ -0,0 +1,106 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+ZSTD = 'zstd'
+IDENTITY = 'identity'
+# bodies smaller than this are sent uncompressed
+MIN_SIZE = 1024
+# levels used when compressing on every request, cached bodies are compressed once per feed version with higher level
+LEVELS = {GZIP: 6, BROTLI: 5, ZSTD: 3}
+CACHED_LEVELS = {GZIP: 9, BROTLI: 9, ZSTD: 10}
+
+
+def get_available_encodings() -> list:
+    """ Returns encodings supported by installed packages, in order of preference """
+    encodings = []
+    if brotli is not None:
+        encodings.append(BROTLI)
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    encodings.append(GZIP)
+    return encodings
+
+
+def choose_encoding(accept_encodings) -> str:
+    """ Returns the best encoding accepted by the client, None if client doesn't accept any of available encodings
+
+    Parameters
+    ----------
+    accept_encodings
+        Parsed Accept-Encoding header (request.accept_encodings)
+
+    Returns
+    -------
+    result
+        Encoding name used in Content-Encoding header or None
+
+    """
+    return accept_encodings.best_match(get_available_encodings())
+
+
+def compress(body: bytes, encoding: str, level: int = None) -> bytes:
+    """ Compresses whole body with given encoding, *level* defaults to LEVELS of the encoding """
+    level = LEVELS[encoding] if level is None else level
+    if encoding == BROTLI:
+        return brotli.compress(body, quality=level)
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    compressor = zlib.compressobj(level, wbits=31)
+    return compressor.compress(body) + compressor.flush()
+
+
+class StreamCompressor:
+    """ Compresses body sent in chunks, every chunk is flushed so the client can read rows as they arrive """
+
+    def __init__(self, encoding: str, level: int = None):
+        level = LEVELS[encoding] if level is None else level
+        self.encoding = encoding
+        if encoding == BROTLI:
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == ZSTD:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = zlib.compressobj(level, wbits=31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == BROTLI:
+            return self._compressor.process(chunk) + self._compressor.flush()
+        if self.encoding == ZSTD:
+            return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == BROTLI:
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_stream(chunks, encoding: str):
+    """ Yields compressed chunks of the body """
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if chunk:
+            yield compressor.compress(chunk)
+    yield compressor.finish()
+
+
+async def compress_async_stream(chunks, encoding: str):
+    """ Yields compressed chunks of the body produced by async generator """
+    compressor = StreamCompressor(encoding)
+    async for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk)
+    yield compressor.finish()
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2 import pool
+import request_metrics
+
+load_dotenv()
+url = os.getenv("DATABASE_URL")
+
+DEFAULT_MIN_SIZE = 1
+DEFAULT_MAX_SIZE = 10
+DEFAULT_TIMEOUT = 5
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+
+class PoolTimeoutError(pool.PoolError):
+    """ Raised when no connection was released by other requests before timeout """
+
+
+class ConnectionPool:
+    """ Bounded, thread safe pool of psycopg2 connections.
+     Requests wait for free connection up to *timeout* seconds instead of opening new ones,
+     connections idle longer than *health_check_interval* seconds are checked with SELECT 1 before use.
+     Connections use *cursor_factory* for their cursors if it is given
+    """
+
+    def __init__(self, dsn: str, min_size: int = DEFAULT_MIN_SIZE, max_size: int = DEFAULT_MAX_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT, health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+                 cursor_factory=None):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        if cursor_factory is None:
+            self._pool = pool.ThreadedConnectionPool(min_size, max_size, dsn)
+        else:
+            self._pool = pool.ThreadedConnectionPool(min_size, max_size, dsn, cursor_factory=cursor_factory)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'discarded': 0, 'in_use': 0, 'wait_seconds_total': 0.0}
+
+    def _is_healthy(self, connection) -> bool:
+        if connection.closed:
+            return False
+        last_used = self._last_used.get(id(connection))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _get_healthy_connection(self):
+        connection = self._pool.getconn()
+        while not self._is_healthy(connection):
+            self._discard(connection)
+            connection = self._pool.getconn()
+        return connection
+
+    def _discard(self, connection):
+        self._last_used.pop(id(connection), None)
+        self._pool.putconn(connection, close=True)
+        with self._lock:
+            self._stats['discarded'] += 1
+
+    @contextmanager
+    def connection(self):
+        """ Borrows connection from the pool, commits on success and rolls back on exception,
+         like *with psycopg2.connect(url) as connection* does
+        """
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeoutError(f'No free database connection after {self.timeout} seconds')
+        try:
+            connection = self._get_healthy_connection()
+        except Exception:
+            self._slots.release()
+            raise
+        wait = time.monotonic() - start
+        request_metrics.record_phase('connection', wait)
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_seconds_total'] += wait
+        try:
+            with connection:
+                yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._discard(connection)
+            connection = None
+            raise
+        finally:
+            if connection is not None:
+                self._last_used[id(connection)] = time.monotonic()
+                self._pool.putconn(connection)
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """ Returns counters of the pool """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['min_size'] = self.min_size
+        stats['max_size'] = self.max_size
+        stats['idle'] = len(self._pool._pool)
+        stats['open'] = stats['idle'] + len(self._pool._used)
+        return stats
+
+    def close(self):
+        self._pool.closeall()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """ Returns pool shared by the whole process, creates it on first use.
+     Size is configured with DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+     and DB_POOL_HEALTH_CHECK_INTERVAL environment variables, cursors are timed with API_METRICS=1
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(url,
+                                       min_size=int(os.getenv('DB_POOL_MIN_SIZE', DEFAULT_MIN_SIZE)),
+                                       max_size=int(os.getenv('DB_POOL_MAX_SIZE', DEFAULT_MAX_SIZE)),
+                                       timeout=float(os.getenv('DB_POOL_TIMEOUT', DEFAULT_TIMEOUT)),
+                                       health_check_interval=float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL',
+                                                                             DEFAULT_HEALTH_CHECK_INTERVAL)),
+                                       cursor_factory=request_metrics.get_cursor_factory())
+    return _pool
@@ -2,16 +2,22 @@ import pandas as pd
 import os
 from psycopg2 import sql
 import psycopg2
-from sqlalchemy import create_engine
 from dotenv import load_dotenv
 import csv
+import io
+import time
+import psycopg2.errors
 
 import queries
 
 load_dotenv()
 url = os.getenv("DATABASE_URL")
-url_alchemy = os.getenv("SQLALCHEMY_URL")
-engine = create_engine(url_alchemy)
+# partition swaps wait at most SWAP_LOCK_TIMEOUT for their locks and are tried again SWAP_RETRIES times
+SWAP_LOCK_TIMEOUT = os.getenv('SWAP_LOCK_TIMEOUT', '5s')
+SWAP_RETRIES = int(os.getenv('SWAP_RETRIES', 5))
+SWAP_RETRY_DELAY = 2
+# key of advisory lock serializing partition swaps of all cities
+SWAP_ADVISORY_LOCK_ID = 7210001
 
 
 def delete_unnecessary_columns_in_csv(file_path: str, important_columns: list):
@@ -27,17 +33,16 @@ def delete_unnecessary_columns_in_csv(file_path: str, important_columns: list):
 
     """
     if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8-sig') as read_obj:
+        tmp_path = file_path + '.tmp'
+        with open(file_path, 'r', encoding='utf-8-sig') as read_obj, \
+                open(tmp_path, 'w', encoding='utf-8-sig',  newline='') as write_obj:
             reader = csv.DictReader(read_obj)
-            headers = reader.fieldnames
-            rows = list(reader)
-            columns_to_delete = list(set(headers) - set(important_columns))
-            for column in columns_to_delete:
-                headers.remove(column)
-        with open(file_path, 'w', encoding='utf-8-sig',  newline='') as write_obj:
+            headers = [header for header in reader.fieldnames or [] if header in important_columns]
             writer = csv.DictWriter(write_obj, fieldnames=headers,  extrasaction="ignore")
             writer.writeheader()
-            writer.writerows(rows)
+            for row in reader:
+                writer.writerow(row)
+        os.replace(tmp_path, file_path)
         return True
     else:
         raise OSError(f'Error when deleting columns from file {file_path}')
@@ -65,87 +70,643 @@ def get_df_from_csv(csv_path: str, city_name: str, table_name: str):
         raise OSError(f"{filename} does not exists")
 
 
-def create_temp_table(table_df: pd.DataFrame, table_name: str):
+def get_table_dict(table_name: str) -> dict:
+    """
+
+    Parameters
+    ----------
+    table_name
+
+    Returns
+    -------
+
+    """
+    for table in queries.TABLE_LIST:
+        if table.get('table_name') == table_name:
+            return table
+    else:
+        raise KeyError(f'No {table_name} table')
+
+
+class CsvRowStream:
+    """ File-like object turning iterable of rows into csv text, read by COPY ... FROM STDIN.
+     Only rows needed to fill requested size are kept in memory
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.row_count = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or self._buffer.tell() < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.row_count += 1
+        data = self._buffer.getvalue()
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+        else:
+            rest = ''
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffer.write(rest)
+        return data
+
+
+def copy_rows_to_table(cursor, table_name: str, columns: list, rows) -> int:
+    """ Streams rows to table with COPY ... FROM STDIN
+
+    Parameters
+    ----------
+    cursor
+        psycopg2 cursor
+    table_name
+        Name of the table rows are copied to
+    columns
+        List of columns in order of values in rows
+    rows
+        Iterable of rows, every row is a list of values
+
+    Returns
+    -------
+    result
+        Number of copied rows
+
     """
+    stream = CsvRowStream(rows)
+    copy_query = sql.SQL(queries.COPY_FROM_STDIN).format(
+        table_name=sql.Identifier(table_name),
+        columns=sql.SQL(', ').join(map(sql.Identifier, columns)))
+    cursor.copy_expert(copy_query, stream)
+    return stream.row_count
+
+
+def replace_city_records_from_rows(table_name: str, city_id: int, columns: list, rows) -> bool:
+    """ Deletes old records of the city and copies new rows to the table in one transaction
 
     Parameters
     ----------
-    table_df
     table_name
+        Name of the table
+    city_id
+        id of the city which records are replaced
+    columns
+        List of columns in order of values in rows
+    rows
+        Iterable of rows, every row is a list of values
 
     Returns
     -------
+    result
+        True if records were replaced, False if exception occurred
 
     """
-    name = f'temp_{table_name}'
     try:
-        table_df.to_sql(name=name, con=engine, if_exists='replace', index=False)
+        with psycopg2.connect(url) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql.SQL(queries.DELETE_OLD_RECORDS).format(
+                    table_name=sql.Identifier(table_name)), (city_id,))
+                copy_rows_to_table(cursor, table_name, columns, rows)
         return True
     except Exception as e:
-        print(f"Error when creating temporary tables: {e}")
+        print(f'Error has occurred when copying new records to {table_name}: {e}')
         return False
 
 
-def delete_old_records_from_table(table_name: str, city_id: int):
+def get_city_partition_name(table_name: str, city_id: int) -> str:
+    """ Returns name of the partition holding records of the city
+
+    Parameters
+    ----------
+    table_name
+        Name of the partitioned table
+    city_id
+        id of the city
+
+    Returns
+    -------
+    result
+        Name of the partition, for example stop_times_city_1
+
     """
+    return f'{table_name}_city_{city_id}'
+
+
+def check_table_is_partitioned(cursor, table_name: str) -> bool:
+    """ Checks if table is partitioned (by city_id)
 
     Parameters
     ----------
+    cursor
+        psycopg2 cursor
     table_name
+        Name of the table
+
+    Returns
+    -------
+    result
+        True if table is partitioned table
+
+    """
+    cursor.execute(sql.SQL(queries.CHECK_TABLE_IS_PARTITIONED), (table_name,))
+    return bool(cursor.fetchone()[0])
+
+
+class CityTablesSwap:
+    """ Replaces records of the city in all feed tables at once, so readers see either old
+     or new feed of the city, never new records of one table with old records of another.
+     New records of partitioned tables (LIST (city_id)) are copied to staging tables on a separate connection,
+     every staging table is created and loaded in its own committed transactions, so no lock on the parent table
+     is held while rows are copied. On commit all staging tables are swapped with city partitions in one short
+     transaction; swaps of different cities are serialized with advisory lock and parents are locked in fixed order,
+     so parallel loaders don't deadlock. Records of tables which aren't partitioned are replaced with DELETE and COPY
+     in the same transaction. If any table fails to load, nothing is changed
+
+    Usage::
+
+        with CityTablesSwap(city_id) as swap:
+            for table_name, columns, rows in tables:
+                swap.load(table_name, columns, rows)
+            loaded = swap.commit()
+    """
+
+    def __init__(self, city_id: int, lock_timeout: str = SWAP_LOCK_TIMEOUT, retries: int = SWAP_RETRIES):
+        self.city_id = city_id
+        self.lock_timeout = lock_timeout
+        self.retries = retries
+        self.failed = False
+        self.staged = []
+        self.row_counts = {}
+        self._connection = None
+        self._cursor = None
+        self._staging_connection = None
+
+    def __enter__(self):
+        try:
+            self._connection = psycopg2.connect(url)
+            self._cursor = self._connection.cursor()
+        except Exception as e:
+            print(f'Error has occurred when connecting to database: {e}')
+            self.failed = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.failed or exc_type is not None:
+            self._drop_staged()
+        for connection in (self._connection, self._staging_connection):
+            if connection is not None:
+                # closing without commit discards uncommitted changes
+                connection.close()
+
+    def _get_identifiers(self, table_name: str) -> dict:
+        partition = get_city_partition_name(table_name, self.city_id)
+        staging = partition + '_staging'
+        return {'table_name': sql.Identifier(table_name), 'partition': sql.Identifier(partition),
+                'staging': sql.Identifier(staging), 'constraint': sql.Identifier(staging + '_city_check'),
+                'city_id': sql.Literal(self.city_id)}
+
+    def _stage(self, table_name: str, columns: list, rows) -> int:
+        """ Creates staging table (short transaction, LIKE locks the parent) and copies rows to it """
+        if self._staging_connection is None:
+            self._staging_connection = psycopg2.connect(url)
+        identifiers = self._get_identifiers(table_name)
+        with self._staging_connection.cursor() as cursor:
+            cursor.execute(sql.SQL(queries.DROP_TABLE_IF_EXISTS).format(table_name=identifiers['staging']))
+            cursor.execute(sql.SQL(queries.CREATE_STAGING_PARTITION).format(**identifiers))
+            self._staging_connection.commit()
+            self.staged.append(table_name)
+            row_count = copy_rows_to_table(cursor, get_city_partition_name(table_name, self.city_id) + '_staging',
+                                           columns, rows)
+            # constraint lets ATTACH PARTITION skip scanning new records
+            cursor.execute(sql.SQL(queries.ADD_CITY_CHECK_CONSTRAINT).format(**identifiers))
+            self._staging_connection.commit()
+        return row_count
+
+    def _drop_staged(self):
+        """ Drops staging tables of failed load, errors are only printed """
+        if not self.staged or self._staging_connection is None:
+            return
+        try:
+            self._staging_connection.rollback()
+            with self._staging_connection.cursor() as cursor:
+                for table_name in self.staged:
+                    cursor.execute(sql.SQL(queries.DROP_TABLE_IF_EXISTS).format(
+                        table_name=self._get_identifiers(table_name)['staging']))
+            self._staging_connection.commit()
+            self.staged = []
+        except Exception as e:
+            print(f'Error has occurred when dropping staging tables of city {self.city_id}: {e}')
+
+    def load(self, table_name: str, columns: list, rows) -> bool:
+        """ Copies new rows of the table, they become visible on commit. Number of copied rows is kept
+         in *row_counts*
+
+        Returns
+        -------
+        result
+            True if rows were copied, False if exception occurred now or when loading previous table
+
+        """
+        if self.failed:
+            return False
+        try:
+            if check_table_is_partitioned(self._cursor, table_name):
+                self.row_counts[table_name] = self._stage(table_name, columns, rows)
+                return True
+            self._cursor.execute(sql.SQL(queries.DELETE_OLD_RECORDS).format(table_name=sql.Identifier(table_name)),
+                                 (self.city_id,))
+            self.row_counts[table_name] = copy_rows_to_table(self._cursor, table_name, columns, rows)
+            return True
+        except Exception as e:
+            print(f'Error has occurred when loading {table_name} of city {self.city_id}: {e}')
+            self.failed = True
+            return False
+
+    def _swap_staged(self):
+        """ Swaps staging tables with city partitions, waits at most lock_timeout for every lock """
+        self._cursor.execute(sql.SQL(queries.SET_LOCK_TIMEOUT).format(timeout=sql.Literal(self.lock_timeout)))
+        self._cursor.execute(sql.SQL(queries.ADVISORY_XACT_LOCK), (SWAP_ADVISORY_LOCK_ID,))
+        table_names = sorted(self.staged)
+        self._cursor.execute(sql.SQL(queries.LOCK_TABLES).format(
+            table_names=sql.SQL(', ').join(map(sql.Identifier, table_names))))
+        for table_name in table_names:
+            identifiers = self._get_identifiers(table_name)
+            self._cursor.execute(sql.SQL(queries.CREATE_CITY_PARTITION).format(**identifiers))
+            self._cursor.execute(sql.SQL(queries.DETACH_PARTITION).format(**identifiers))
+            self._cursor.execute(sql.SQL(queries.ATTACH_PARTITION).format(**identifiers))
+            self._cursor.execute(sql.SQL(queries.DROP_TABLE_IF_EXISTS).format(table_name=identifiers['partition']))
+            self._cursor.execute(sql.SQL(queries.RENAME_TABLE).format(**identifiers))
+
+    def commit(self) -> bool:
+        """ Swaps staging tables with city partitions and commits all tables at once.
+         Swap which doesn't get its locks in lock_timeout (for example because of long running streamed read)
+         is rolled back to savepoint and tried again up to *retries* times, records of not partitioned tables
+         copied before stay in the transaction
+
+        Returns
+        -------
+        result
+            True if new records of all loaded tables are visible, False if nothing was changed
+
+        """
+        if self.failed:
+            return False
+        try:
+            if self.staged:
+                for attempt in range(self.retries + 1):
+                    self._cursor.execute(queries.SAVEPOINT_SWAP)
+                    try:
+                        self._swap_staged()
+                        break
+                    except psycopg2.errors.LockNotAvailable:
+                        self._cursor.execute(queries.ROLLBACK_TO_SAVEPOINT_SWAP)
+                        if attempt == self.retries:
+                            raise
+                        time.sleep(SWAP_RETRY_DELAY * (attempt + 1))
+            self._connection.commit()
+            self.staged = []
+            return True
+        except Exception as e:
+            print(f'Error has occurred when swapping partitions of city {self.city_id}: {e}')
+            self.failed = True
+            return False
+
+
+def partition_tables_by_city(table_names: list = None) -> bool:
+    """ Converts feed tables to tables partitioned by LIST (city_id) with one partition per city,
+     so CityTablesSwap can swap partitions instead of deleting records. Tables which are already partitioned
+     or don't exist are skipped. Every table is converted in its own transaction, indexes are dropped
+     with the old table and created again on partitioned table by create_indexes
+
+    Parameters
+    ----------
+    table_names
+        Names of converted tables, all tables from queries.TABLE_LIST by default
+
+    Returns
+    -------
+    result
+        True if tables are partitioned, False if exception occurred
+
+    """
+    if table_names is None:
+        table_names = [table['table_name'] for table in queries.TABLE_LIST]
+    try:
+        with psycopg2.connect(url) as connection:
+            with connection.cursor() as cursor:
+                for table_name in table_names:
+                    cursor.execute(sql.SQL(queries.CHECK_TABLE_EXISTS), (table_name,))
+                    if not cursor.fetchone()[0] or check_table_is_partitioned(cursor, table_name):
+                        continue
+                    source = f'{table_name}_unpartitioned'
+                    identifiers = {'table_name': sql.Identifier(table_name), 'source': sql.Identifier(source)}
+                    cursor.execute(sql.SQL(queries.RENAME_TABLE).format(staging=identifiers['table_name'],
+                                                                        partition=identifiers['source']))
+                    cursor.execute(sql.SQL(queries.CREATE_PARTITIONED_TABLE).format(**identifiers))
+                    cursor.execute(sql.SQL(queries.CREATE_DEFAULT_PARTITION).format(
+                        table_name=identifiers['table_name'], partition=sql.Identifier(f'{table_name}_default')))
+                    cursor.execute(sql.SQL(queries.GET_TABLE_CITY_IDS).format(table_name=identifiers['source']))
+                    for city_id, in cursor.fetchall():
+                        cursor.execute(sql.SQL(queries.CREATE_CITY_PARTITION).format(
+                            table_name=identifiers['table_name'], city_id=sql.Literal(city_id),
+                            partition=sql.Identifier(get_city_partition_name(table_name, city_id))))
+                    cursor.execute(sql.SQL(queries.COPY_ALL_RECORDS).format(**identifiers))
+                    cursor.execute(sql.SQL(queries.DROP_TABLE_IF_EXISTS).format(table_name=identifiers['source']))
+                    connection.commit()
+        return True
+    except Exception as e:
+        print(f'Error has occurred when partitioning tables: {e}')
+        return False
+
+
+def create_tables() -> bool:
+    """ Creates calendar, calendar_dates and service_dates tables if they don't exist
+
+    Returns
+    -------
+    result
+        True if tables were created, False if exception occurred
+
+    """
+    try:
+        with psycopg2.connect(url) as connection:
+            with connection.cursor() as cursor:
+                for table_query in queries.CREATE_TABLES:
+                    cursor.execute(sql.SQL(table_query))
+        return True
+    except Exception as e:
+        print(f'Error has occurred when creating tables: {e}')
+        return False
+
+
+def refresh_service_dates(city_id: int) -> bool:
+    """ Computes again dates on which every service of the city runs from calendar and calendar_dates tables
+
+    Parameters
+    ----------
     city_id
+        id of the city
 
     Returns
     -------
+    result
+        True if service dates were computed, False if exception occurred
 
     """
     try:
         with psycopg2.connect(url) as connection:
             with connection.cursor() as cursor:
-                cursor.execute(sql.SQL(queries.DELETE_OLD_RECORDS).format(
-                    table_name=sql.Identifier(table_name)), (city_id,))
+                cursor.execute(sql.SQL(queries.DELETE_OLD_SERVICE_DATES), (city_id,))
+                cursor.execute(sql.SQL(queries.INSERT_SERVICE_DATES), {'city_id': city_id})
         return True
     except Exception as e:
-        print(f'Error occurred when deleting old records: {e}')
+        print(f'Error has occurred when computing service dates of city {city_id}: {e}')
         return False
 
 
-def get_table_dict(table_name: str) -> dict:
+def create_indexes(index_queries: list = None) -> bool:
+    """ Creates indexes used by the API if they don't exist
+
+    Parameters
+    ----------
+    index_queries
+        List of CREATE INDEX IF NOT EXISTS queries, defaults to queries.CREATE_INDEXES
+
+    Returns
+    -------
+    result
+        True if indexes were created, False if exception occurred
+
+    """
+    if index_queries is None:
+        index_queries = queries.CREATE_INDEXES
+    try:
+        with psycopg2.connect(url) as connection:
+            with connection.cursor() as cursor:
+                for index_query in index_queries:
+                    cursor.execute(sql.SQL(index_query))
+        return True
+    except Exception as e:
+        print(f'Error has occurred when creating indexes: {e}')
+        return False
+
+
+def bump_feed_version(city_id: int) -> bool:
+    """ Increases feed version of the city after its tables were successfully loaded,
+     API drops cached responses built from the previous version
+
+    Parameters
+    ----------
+    city_id
+        id of the loaded city
+
+    Returns
+    -------
+    result
+        True if version was increased, False if exception occurred
+
     """
+    try:
+        with psycopg2.connect(url) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql.SQL(queries.CREATE_FEED_VERSION_TABLE))
+                cursor.execute(sql.SQL(queries.BUMP_FEED_VERSION), (city_id,))
+        return True
+    except Exception as e:
+        print(f'Error has occurred when updating feed version of city {city_id}: {e}')
+        return False
+
+
+def sync_cities_table(cities: list) -> bool:
+    """ Writes cities from the config file to cities table, so /mpk/ endpoint lists the same cities
+     that API finds by name
+
+    Parameters
+    ----------
+    cities
+        List of city dictionaries read from config file
+
+    Returns
+    -------
+    result
+        True if cities were written, False if exception occurred
+
+    """
+    try:
+        with psycopg2.connect(url) as connection:
+            with connection.cursor() as cursor:
+                for city in cities:
+                    cursor.execute(sql.SQL(queries.UPSERT_CITY), (city['city_id'], city['city_name']))
+        return True
+    except Exception as e:
+        print(f'Error has occurred when updating cities table: {e}')
+        return False
+
+
+def apply_city_delta_from_rows(table_name: str, city_id: int, columns: list, rows):
+    """ Copies new rows of the city to temporary staging table and applies only differences to the table:
+     records missing from the feed are deleted, records with changed row hash are updated and new records inserted.
+     Records are matched by natural key from queries.TABLE_KEY_COLUMNS, date column is not compared
 
     Parameters
     ----------
     table_name
+        Name of the table
+    city_id
+        id of the city which records are updated
+    columns
+        List of columns in order of values in rows
+    rows
+        Iterable of rows, every row is a list of values
 
     Returns
     -------
+    result
+        Dictionary with number of inserted, updated and deleted records, None if exception occurred
 
     """
-    for table in queries.TABLE_LIST:
-        if table.get('table_name') == table_name:
-            return table
-    else:
-        raise KeyError(f'No {table_name} table')
+    key_columns = queries.TABLE_KEY_COLUMNS[table_name]
+    compared_columns = [column for column in columns if column not in key_columns + ['city_id', 'date']]
+    updated_columns = [column for column in columns if column not in key_columns + ['city_id']]
+    staging = f'delta_{table_name}'
+
+    def qualified(alias, column_list):
+        return sql.SQL(', ').join(sql.Identifier(alias, column) for column in column_list)
+
+    identifiers = {
+        'table_name': sql.Identifier(table_name),
+        'staging': sql.Identifier(staging),
+        'columns': sql.SQL(', ').join(map(sql.Identifier, columns)),
+        'staging_columns': qualified('s', columns),
+        'key_condition': sql.SQL(' AND ').join(
+            sql.SQL('{} = {}').format(sql.Identifier('t', column), sql.Identifier('s', column))
+            for column in key_columns),
+        'assignments': sql.SQL(', ').join(
+            sql.SQL('{} = {}').format(sql.Identifier(column), sql.Identifier('s', column))
+            for column in updated_columns),
+        'target_columns': qualified('t', compared_columns),
+    }
+    try:
+        with psycopg2.connect(url) as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql.SQL(queries.CREATE_DELTA_STAGING_TABLE).format(**identifiers))
+                copy_rows_to_table(cursor, staging, columns, rows)
+                cursor.execute(sql.SQL(queries.ANALYZE_TABLE).format(table_name=identifiers['staging']))
+                cursor.execute(sql.SQL(queries.DELETE_MISSING_RECORDS).format(**identifiers), (city_id,))
+                deleted = cursor.rowcount
+                cursor.execute(sql.SQL(queries.UPDATE_CHANGED_RECORDS).format(
+                    **dict(identifiers, staging_columns=qualified('s', compared_columns))), (city_id,))
+                updated = cursor.rowcount
+                cursor.execute(sql.SQL(queries.INSERT_MISSING_RECORDS).format(**identifiers), (city_id,))
+                inserted = cursor.rowcount
+        return {'inserted': inserted, 'updated': updated, 'deleted': deleted}
+    except Exception as e:
+        print(f'Error has occurred when applying changes to {table_name}: {e}')
+        return None
 
 
-def insert_new_records_to_table(table_name: str, city_id: int):
+def get_staging_table_query(table_name: str) -> sql.Composed:
+    """ Builds query creating temporary staging table temp_<table_name> with columns and types
+     from important_columns of queries.TABLE_LIST. Table is visible only in the session that created it
+     (it hides shared temp_<table_name> table, so insert queries can be used unchanged) and dropped on commit
+
+    Parameters
+    ----------
+    table_name
+        Name of the table
+
+    Returns
+    -------
+    result
+        CREATE TEMP TABLE query
+
     """
+    columns = get_table_dict(table_name)['important_columns']
+    column_definitions = sql.SQL(', ').join(
+        sql.SQL('{} {}').format(sql.Identifier(column), sql.SQL(queries.COLUMN_TYPES[column]))
+        for column in columns)
+    return sql.SQL(queries.CREATE_STAGING_TABLE).format(staging=sql.Identifier(f'temp_{table_name}'),
+                                                        column_definitions=column_definitions)
+
+
+def load_city_table_through_staging(table_name: str, city_id: int, columns: list, rows) -> bool:
+    """ Copies rows to session scoped staging table, deletes old records of the city
+     and inserts new ones from staging table in one transaction.
+     Loaders of different cities don't share staging tables, so they can run in parallel
 
     Parameters
     ----------
     table_name
+        Name of the table
     city_id
+        id of the city which records are replaced
+    columns
+        List of columns in order of values in rows
+    rows
+        Iterable of rows, every row is a list of values
 
     Returns
     -------
+    result
+        True if records were replaced, False if exception occurred
 
     """
     try:
         insert_query = get_table_dict(table_name)['insert_query']
         with psycopg2.connect(url) as connection:
             with connection.cursor() as cursor:
+                cursor.execute(get_staging_table_query(table_name))
+                copy_rows_to_table(cursor, f'temp_{table_name}', columns, rows)
+                cursor.execute(sql.SQL(queries.DELETE_OLD_RECORDS).format(
+                    table_name=sql.Identifier(table_name)), (city_id,))
                 cursor.execute(sql.SQL(insert_query), (city_id,))
         return True
     except Exception as e:
-        print(f'Error has occurred when inserting new records to {table_name}: {e}')
+        print(f'Error has occurred when loading {table_name} through staging table: {e}')
         return False
 
+
+def read_csv_rows(read_obj, important_columns: list = None) -> tuple:
+    """ Returns (columns, rows) of open csv file, rows are read lazily and contain only *important_columns*
+     (all columns if None)
+    """
+    reader = csv.reader(read_obj)
+    columns = next(reader, [])
+    if important_columns is None:
+        return columns, reader
+    positions = [position for position, column in enumerate(columns) if column in important_columns]
+    return [columns[position] for position in positions], ([row[position] for position in positions] for row in reader)
+
+
+def load_csv_through_staging(file_path: str, table_name: str, city_id: int, important_columns: list = None) -> bool:
+    """ Loads csv file through staging table. File is read row by row and streamed to COPY,
+     so memory doesn't grow with size of the file
+
+    Parameters
+    ----------
+    file_path
+        Path to csv file
+    table_name
+        Name of the table
+    city_id
+        id of the city which records are replaced
+    important_columns
+        Columns which are loaded, other columns of the file are skipped while reading.
+         All columns are loaded if None (file created by *delete_unnecessary_columns_in_csv*)
+
+    Returns
+    -------
+    result
+        True if records were replaced, False if file doesn't exist or exception occurred
+
+    """
+    if not os.path.exists(file_path):
+        print(f'File {file_path} not found')
+        return False
+    with open(file_path, 'r', encoding='utf-8-sig', newline='') as read_obj:
+        columns, rows = read_csv_rows(read_obj, important_columns)
+        return load_city_table_through_staging(table_name, city_id, columns, rows)
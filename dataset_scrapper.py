@@ -5,27 +5,35 @@ import requests
 from bs4 import BeautifulSoup
 import wget
 import zipfile
+import io
+import hashlib
 from datetime import datetime, timezone
 import csv
 
 SEC_IN_DAYS = 86400
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
 DEFAULT_CONFIG = """[
   {
     "city_id": 1,
     "city_name": "Wroclaw",
     "url": "https://www.wroclaw.pl/open-data/dataset/rozkladjazdytransportupublicznegoplik_data/resource/62b3f371-2375-4979-874c-05c6bbb9b09e",
-    "direct_link": false
+    "direct_link": false,
+    "timezone": "Europe/Warsaw"
   },
   {
     "city_id": 2,
     "city_name": "Poznan",
     "url": "https://www.ztm.poznan.pl/pl/dla-deweloperow/getGTFSFile",
-    "direct_link": true
+    "direct_link": true,
+    "timezone": "Europe/Warsaw"
   }
 ]
 """
 
 CORRECT_KEYS = {'city_id', 'city_name', 'url', 'direct_link'}
+# GTFS columns clashing with added city_id and date columns
+RENAMED_COLUMNS = {'calendar_dates': {'date': 'exception_date'}}
 
 
 def check_correct_dir_in_project(path: str, expected_dirs_list: list) -> bool:
@@ -481,7 +489,9 @@ def save_txt_to_csv_with_city_id_and_date(cwd: str, city_dict: dict, table_name:
                 open(outfile_path, 'w', encoding="utf8", newline='') as write_obj:
             csv_reader = csv.reader(read_obj)
             csv_writer = csv.writer(write_obj)
-            csv_writer.writerow(next(csv_reader) + ['city_id'] + ['date'])
+            renamed_columns = RENAMED_COLUMNS.get(table_name, {})
+            headers = [renamed_columns.get(header, header) for header in next(csv_reader)]
+            csv_writer.writerow(headers + ['city_id'] + ['date'])
             for row in csv_reader:
                 row.append(city_id)
                 row.append(date)
@@ -492,5 +502,213 @@ def save_txt_to_csv_with_city_id_and_date(cwd: str, city_dict: dict, table_name:
         return False
 
 
+def get_zip_member_name(zip_ref: zipfile.ZipFile, table_name: str) -> str:
+    """ Finds name of the member of the zip file holding given GTFS table
 
+    Parameters
+    ----------
+    zip_ref
+        Opened zip file
+    table_name
+        Name of the GTFS table, for example stop_times
+
+    Returns
+    -------
+    result
+        Name of the member inside zip file, empty string if table is not in archive
+
+    """
+    filename = table_name + '.txt'
+    for member in zip_ref.namelist():
+        if member.replace('\\', '/').split('/')[-1] == filename:
+            return member
+    return ''
+
+
+def iter_table_rows_from_zip(zip_path: str, table_name: str, columns: list, city_id, date: str,
+                             required: bool = True):
+    """ Yields rows of the table read straight from zip file, without extracting it.
+     Rows are projected to given columns, city_id and date columns are filled with given values,
+     columns missing from the file are left empty, columns from RENAMED_COLUMNS are renamed
+
+    Parameters
+    ----------
+    zip_path
+        Path to the zip file with GTFS feed
+    table_name
+        Name of the GTFS table, for example stop_times
+    columns
+        List of columns in order in which values should be returned
+    city_id
+        Value of city_id column
+    date
+        Value of date column
+    required
+        If False, table missing from zip file yields no rows instead of raising OSError
+
+    Returns
+    -------
+    result
+        Generator of lists with values of the row
+
+    """
+    added_values = {'city_id': str(city_id), 'date': date}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        member = get_zip_member_name(zip_ref, table_name)
+        if member == '':
+            if not required:
+                return
+            raise OSError(f'File {table_name}.txt not found in {zip_path}')
+        renamed_columns = RENAMED_COLUMNS.get(table_name, {})
+        with zip_ref.open(member) as binary_obj:
+            read_obj = io.TextIOWrapper(binary_obj, encoding='utf-8-sig', newline='')
+            csv_reader = csv.reader(read_obj)
+            headers = [renamed_columns.get(header.strip(), header.strip()) for header in next(csv_reader, [])]
+            positions = [headers.index(column) if column in headers else None for column in columns]
+            for row in csv_reader:
+                if not row:
+                    continue
+                yield [added_values[column] if column in added_values
+                       else (row[position] if position is not None and position < len(row) else '')
+                       for column, position in zip(columns, positions)]
+
+
+def get_feed_state_path(cwd: str, city_name: str) -> str:
+    return os.path.join(cwd + '\\zip_files', city_name + '.state.json')
+
+
+def read_feed_state(cwd: str, city_name: str) -> dict:
+    """ Reads ETag, Last-Modified and SHA-256 of the last downloaded feed of the city
+
+    Parameters
+    ----------
+    cwd
+        Current working directory
+    city_name
+        Name of the city
+
+    Returns
+    -------
+    result
+        Dictionary with etag, last_modified, sha256 and loaded keys, empty dictionary if state wasn't saved yet
+
+    """
+    state_path = get_feed_state_path(cwd, city_name)
+    if not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f'Error when reading feed state of {city_name}: {e}')
+        return {}
+
+
+def save_feed_state(cwd: str, city_name: str, state: dict) -> bool:
+    """ Saves feed state of the city
+
+    Parameters
+    ----------
+    cwd
+        Current working directory
+    city_name
+        Name of the city
+    state
+        Dictionary with etag, last_modified, sha256 and loaded keys
+
+    Returns
+    -------
+    result
+        True if state was saved, False if exception occurred
+
+    """
+    try:
+        with open(get_feed_state_path(cwd, city_name), 'w') as outfile:
+            json.dump(state, outfile)
+    except Exception as e:
+        print(f'Error when saving feed state of {city_name}: {e}')
+        return False
+    return True
+
+
+def mark_feed_loaded(cwd: str, city_name: str) -> bool:
+    """ Marks last downloaded feed of the city as loaded to database,
+     from now on the feed is downloaded again only if server reports it changed
 
+    Parameters
+    ----------
+    cwd
+        Current working directory
+    city_name
+        Name of the city
+
+    Returns
+    -------
+    result
+        True if state was saved, False if there is no state or exception occurred
+
+    """
+    state = read_feed_state(cwd, city_name)
+    if not state:
+        return False
+    state['loaded'] = True
+    return save_feed_state(cwd, city_name, state)
+
+
+def download_zip_if_changed(cwd: str, link: str, city_name: str):
+    """ Downloads zip file with conditional request (If-None-Match / If-Modified-Since) and compares
+     SHA-256 of the content with the last loaded feed
+
+    Parameters
+    ----------
+    cwd
+        Current working directory
+    link
+        String of the link file should be downloaded
+    city_name
+        name of the city for which link should be downloaded
+
+    Returns
+    -------
+    result
+        True if feed changed and should be loaded, False if feed is the same as the last loaded one,
+         None if link was empty or error has occurred when downloading
+
+    """
+    if not link:
+        print("Empty link, can't download")
+        return None
+    state = read_feed_state(cwd, city_name)
+    headers = {}
+    if state.get('loaded'):
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+    file_path = os.path.join(cwd + '\\zip_files', city_name + '.' + 'zip')
+    part_path = file_path + '.part'
+    try:
+        with requests.get(link, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as r:
+            if r.status_code == 304:
+                print(f'Feed of {city_name} not modified')
+                return False
+            r.raise_for_status()
+            sha256 = hashlib.sha256()
+            with open(part_path, 'wb') as outfile:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    outfile.write(chunk)
+            os.replace(part_path, file_path)
+            digest = sha256.hexdigest()
+            unchanged = state.get('loaded', False) and state.get('sha256') == digest
+            save_feed_state(cwd, city_name, {'etag': r.headers.get('ETag'),
+                                             'last_modified': r.headers.get('Last-Modified'),
+                                             'sha256': digest, 'loaded': unchanged})
+            if unchanged:
+                print(f'Feed of {city_name} has the same content as the last loaded one')
+            return not unchanged
+    except Exception as e:
+        print(f'Exception occurred when downloading: {e}')
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return None
@@ -0,0 +1,12 @@
+# production server of app.py: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 2))
+# every thread holds a database connection while it waits for Postgres, keep threads <= DB_POOL_MAX_SIZE
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', os.getenv('DB_POOL_MAX_SIZE', 10)))
+timeout = 60
+graceful_timeout = 10
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# set to path in node_exporter textfile collector directory to write pipeline metrics there after every run
+METRICS_FILE = os.getenv('PIPELINE_METRICS_FILE')
+JSON_LOGS = os.getenv('PIPELINE_JSON_LOGS', '1') != '0'
+METRIC_PREFIX = 'gtfs_pipeline_stage'
+LABELS = ('stage', 'city', 'table')
+
+
+def get_peak_rss() -> int:
+    """ Returns peak resident set size of this process in bytes since it started (not of the stage),
+     None if it can't be read on the platform
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_current_rss() -> int:
+    """ Returns resident set size of this process in bytes at the moment of the call, None if it can't be read """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as read_obj:
+            return int(read_obj.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class StageRecord:
+    """ Timing, status and counters (rows read and written, bytes downloaded, ...) of one run of a stage """
+
+    def __init__(self, stage: str, city: str = None, table: str = None):
+        self.stage = stage
+        self.city = city
+        self.table = table
+        self.status = 'ok'
+        self.counters = {}
+        self.started_at = time.time()
+        self.finished_at = None
+        self.duration = None
+        self.peak_rss = None
+        self.rss_delta = None
+
+    def add(self, counter: str, value: int = 1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def get_labels(self) -> dict:
+        return {label: getattr(self, label) for label in LABELS if getattr(self, label) is not None}
+
+    def to_dict(self) -> dict:
+        return dict(self.get_labels(), status=self.status,
+                    started_at=datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                    finished_at=datetime.fromtimestamp(self.finished_at, timezone.utc).isoformat(),
+                    duration_seconds=round(self.duration, 4), peak_rss_bytes=self.peak_rss,
+                    rss_delta_bytes=self.rss_delta, **self.counters)
+
+
+def count_rows(rows, record: StageRecord, counter: str = 'rows_read'):
+    """ Yields rows unchanged, adding every row to the counter of the record """
+    for row in rows:
+        record.add(counter)
+        yield row
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class PipelineMetrics:
+    """ Collects records of pipeline stages, logs every finished stage as JSON line
+     and renders the last run of every stage in Prometheus text format
+    """
+
+    def __init__(self, json_logs: bool = JSON_LOGS, stream=None):
+        self.json_logs = json_logs
+        self.stream = stream
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage: str, city: str = None, table: str = None):
+        """ Measures the block, yields StageRecord for counters and status. Exception raised in the block
+         marks the stage as failed and is re-raised
+        """
+        record = StageRecord(stage, city, table)
+        start_rss = get_current_rss()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record.status = 'failed'
+            raise
+        finally:
+            record.duration = time.perf_counter() - start
+            record.finished_at = time.time()
+            record.peak_rss = get_peak_rss()
+            end_rss = get_current_rss()
+            if start_rss is not None and end_rss is not None:
+                record.rss_delta = end_rss - start_rss
+            self.add_records([record])
+            self.log(record)
+
+    def add_records(self, records: list):
+        """ Adds records, also the ones collected in worker processes """
+        with self._lock:
+            self.records.extend(records)
+
+    def get_records_since(self, position: int) -> list:
+        with self._lock:
+            return self.records[position:]
+
+    def log(self, record: StageRecord):
+        if self.json_logs:
+            print(json.dumps(dict(event='pipeline_stage', **record.to_dict())), file=self.stream or sys.stdout,
+                  flush=True)
+
+    def to_prometheus(self) -> str:
+        """ Returns the last record of every stage, city and table in Prometheus text exposition format """
+        with self._lock:
+            last_records = {tuple(record.get_labels().items()): record for record in self.records}
+        samples = {}
+        for labels, record in last_records.items():
+            label_text = ','.join(f'{name}="{escape_label_value(value)}"' for name, value in labels)
+            values = {'duration_seconds': record.duration, 'success': int(record.status == 'ok'),
+                      'last_run_timestamp_seconds': record.finished_at, 'peak_rss_bytes': record.peak_rss,
+                      'rss_delta_bytes': record.rss_delta}
+            values.update(record.counters)
+            for name, value in values.items():
+                if value is not None:
+                    samples.setdefault(name, []).append(f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}')
+        lines = []
+        for name in sorted(samples):
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} gauge')
+            lines.extend(samples[name])
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def write_textfile(self, path: str) -> bool:
+        """ Writes metrics to the file atomically, so the collector never reads half written file """
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as write_obj:
+                write_obj.write(self.to_prometheus())
+            os.replace(path + '.tmp', path)
+            return True
+        except OSError as e:
+            print(f'Error when writing pipeline metrics: {e}')
+            return False
+
+
+metrics = PipelineMetrics()
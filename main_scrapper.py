@@ -1,11 +1,22 @@
 from dataset_scrapper import *
 from database_updater import *
+from instrumentation import metrics, count_rows, METRICS_FILE
 import os
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 
 DAYS_WHEN_FILE_IS_OLD = 1
+STREAMING_INGEST = True
+SWAP_CITY_PARTITIONS = True
+DELTA_UPDATES = False
+PARALLEL_PIPELINE = True
+CONDITIONAL_DOWNLOADS = True
+DOWNLOAD_WORKERS = int(os.getenv('PIPELINE_DOWNLOAD_WORKERS', 4))
+# one loader by default when partitions are swapped, concurrent swaps wait for each other's locks
+LOAD_WORKERS = int(os.getenv('PIPELINE_LOAD_WORKERS', 1 if SWAP_CITY_PARTITIONS else 2))
 EXPECTED_DIRS_IN_PROJECT = ['csv_files', 'zip_files']
-LIST_OF_TABLES = ['routes', 'trips', 'stops', 'stop_times']
+LIST_OF_TABLES = ['routes', 'trips', 'stops', 'stop_times', 'calendar', 'calendar_dates']
 
 """
 STEPS - set_up:
@@ -17,25 +28,28 @@ STEPS - set_up:
 6.delete old zip files
 7.if zip file from city was old, delete all files in directory unzipped 
 8.delete all csv files with old city name
+Every step of set_up, get_data and update_tables is measured by instrumentation.metrics (JSON log line per stage)
 """
 
 
 def set_up(project_path: str, config_name: str = 'cities.json'):
-    create_expected_dirs(project_path, EXPECTED_DIRS_IN_PROJECT)  # 1
-    if not check_json_config_exists(project_path, config_name):  # 2
-        create_default_json_config(project_path, config_name)  # 3
-    overwrite_incorrect_json_file(project_path, config_name)  # 4
-    zip_path = os.path.join(project_path, 'zip_files')
-    csv_path = os.path.join(project_path, 'csv_files')
-    zip_old_dict = check_file_age_in_directory(zip_path, DAYS_WHEN_FILE_IS_OLD, '.zip')  # 5
-    print(zip_old_dict)
-    delete_old_files(zip_old_dict)  # 6
-    for key, value in zip_old_dict.items():
-        if not value:
-            city_name = get_city_name_from_zip_filepath(key)
-            unzipped_path = os.path.join(project_path, ('zip_files\\unzipped_' + city_name))
-            delete_all_files_in_directory(unzipped_path, '.txt') # 7
-            delete_all_files_in_directory_beginning_with_name(csv_path, '.csv', city_name) # 8
+    with metrics.stage('set_up') as record:
+        create_expected_dirs(project_path, EXPECTED_DIRS_IN_PROJECT)  # 1
+        if not check_json_config_exists(project_path, config_name):  # 2
+            create_default_json_config(project_path, config_name)  # 3
+        overwrite_incorrect_json_file(project_path, config_name)  # 4
+        zip_path = os.path.join(project_path, 'zip_files')
+        csv_path = os.path.join(project_path, 'csv_files')
+        zip_old_dict = check_file_age_in_directory(zip_path, DAYS_WHEN_FILE_IS_OLD, '.zip')  # 5
+        record.add('zip_files', len(zip_old_dict))
+        record.add('old_zip_files', list(zip_old_dict.values()).count(False))
+        delete_old_files(zip_old_dict)  # 6
+        for key, value in zip_old_dict.items():
+            if not value:
+                city_name = get_city_name_from_zip_filepath(key)
+                unzipped_path = os.path.join(project_path, ('zip_files\\unzipped_' + city_name))
+                delete_all_files_in_directory(unzipped_path, '.txt') # 7
+                delete_all_files_in_directory_beginning_with_name(csv_path, '.csv', city_name) # 8
 
 
 """
@@ -47,48 +61,247 @@ STEPS - get_data
 4. create unzipped folder
 5. Unzip zip file 
 6. Create csv file for every table
+In streaming mode only steps 1-3 are done, tables are read straight from zip file by update_tables
 """
 
 
-def get_data(project_path: str,  list_of_tables: list, config_name: str = 'cities.json'):
-    data = read_json(project_path, config_name)  # 1
-    for city in data:  # 2
+def get_zip_file_state(project_path: str, city_name: str):
+    """ Returns modification time and size of zip file of the city, None if there is no file """
+    try:
+        stat = os.stat(os.path.join(project_path + '\\zip_files', city_name + '.zip'))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def download_stage(project_path: str, city: dict):
+    """ Measures download of the city, counting size of zip file if it was written during the stage """
+    before = get_zip_file_state(project_path, city['city_name'])
+    with metrics.stage('download', city['city_name']) as record:
+        yield record
+        after = get_zip_file_state(project_path, city['city_name'])
+        record.add('bytes_downloaded', after[1] if after is not None and after != before else 0)
+
+
+def download_city_zip(project_path: str, city: dict):
+    """ Returns True if zip file of the city is present, None if it couldn't be downloaded """
+    with download_stage(project_path, city) as record:
         zip_file = check_if_zip_file_exists(project_path, city['city_name'])  # 3
         if zip_file == '':  # 3.1
             link = get_zip_link(city['url'], city['direct_link'])
-            download_zip_from_url(project_path, link, city['city_name'])
-        create_unzipped_folder(project_path, city['city_name'])  # 4
-        unzip_file(project_path, city['city_name'])  # 5
-        for table in list_of_tables:  # 6
-            save_txt_to_csv_with_city_id_and_date(project_path, city, table)
+            result = download_zip_from_url(project_path, link, city['city_name']) or None
+        else:
+            result = True
+        if result is None:
+            record.status = 'failed'
+        return result
+
+
+def refresh_city_feed(project_path: str, city: dict):
+    """ Returns True if feed of the city changed since it was last loaded, False if it didn't,
+     None if it couldn't be downloaded
+    """
+    with download_stage(project_path, city) as record:
+        link = get_zip_link(city['url'], city['direct_link'])
+        result = download_zip_if_changed(project_path, link, city['city_name'])
+        if result is None:
+            record.status = 'failed'
+        return result
+
+
+def get_data(project_path: str,  list_of_tables: list, config_name: str = 'cities.json', streaming: bool = False):
+    with metrics.stage('get_data'):
+        data = read_json(project_path, config_name)  # 1
+        for city in data:  # 2
+            download_city_zip(project_path, city)  # 3
+            if streaming:
+                continue
+            with metrics.stage('unzip', city['city_name']) as record:
+                create_unzipped_folder(project_path, city['city_name'])  # 4
+                if not unzip_file(project_path, city['city_name']):  # 5
+                    record.status = 'failed'
+            for table in list_of_tables:  # 6
+                with metrics.stage('txt_to_csv', city['city_name'], table) as record:
+                    if not save_txt_to_csv_with_city_id_and_date(project_path, city, table):
+                        record.status = 'failed'
 
 
 """
 STEPS: update_table
 iterate over tables and cities
-1.Delete unimportant columns from csv
-2. Get df from csv
-3. Create temp table from df
-4. Delete old records
-5. Insert new records
+1. Read csv row by row, skipping unimportant columns
+2. COPY csv to session scoped staging table, delete old records and insert new records in one transaction
+3. Compute service dates and bump feed version of the city if all tables were loaded
+
+STEPS: update_tables_from_zip
+iterate over tables and cities
+1. Find zip file of the city
+2. Stream important columns of every table from zip file, adding city_id and date
+3. COPY new rows of every table to staging partition, then swap all staging tables with city partitions
+ in one transaction per city (or delete old records and COPY new rows of every table in one transaction,
+ or in delta mode COPY new rows to temporary table and apply only inserted, updated and deleted records)
+4. Compute service dates and bump feed version of the city if all tables were loaded
+ (and in delta mode anything changed)
 """
 
 
-def update_tables(project_path: str):
-    csv_path = os.path.join(project_path, 'csv_files')
-    for city in read_json(project_path):
+def update_city_tables_from_zip(project_path: str, city: dict, swap_partitions: bool = SWAP_CITY_PARTITIONS,
+                                delta: bool = DELTA_UPDATES) -> bool:
+    zip_file = check_if_zip_file_exists(project_path, city['city_name'])  # 1
+    if zip_file == '':
+        return False
+    date = str(datetime.now(timezone.utc))
+    results = []
+    changed_rows = 0
+    staged_rows = 0
+    swap = CityTablesSwap(city['city_id']) if swap_partitions and not delta else None
+    with swap if swap is not None else nullcontext():
         for table in queries.TABLE_LIST:
-            table_path = os.path.join(csv_path, (city['city_name'])+'-' + table['table_name'] + '.csv')
-            delete_unnecessary_columns_in_csv(table_path, table.get('important_columns'))
-            table_df = get_df_from_csv(csv_path, city['city_name'], table['table_name'])
-            create_temp_table(table_df, table['table_name'])
-            delete_old_records_from_table(table['table_name'], city['city_id'])
-            insert_new_records_to_table(table['table_name'], city['city_id'])
+            with metrics.stage('load_table', city['city_name'], table['table_name']) as record:
+                columns = table.get('important_columns')
+                rows = iter_table_rows_from_zip(zip_file, table['table_name'], columns, city['city_id'], date,
+                                                required=table['table_name'] not in queries.OPTIONAL_TABLES)  # 2
+                rows = count_rows(rows, record)
+                if delta:
+                    counts = apply_city_delta_from_rows(table['table_name'], city['city_id'], columns, rows)  # 3
+                    if counts is not None:
+                        for name, count in counts.items():
+                            record.add(f'rows_{name}', count)
+                        changed_rows += sum(counts.values())
+                    loaded = counts is not None
+                elif swap is not None:
+                    # rows become visible when all tables of the city are swapped
+                    loaded = swap.load(table['table_name'], columns, rows)
+                    if loaded:
+                        record.add('rows_written', swap.row_counts[table['table_name']])
+                        staged_rows += swap.row_counts[table['table_name']]
+                else:
+                    loaded = replace_city_records_from_rows(table['table_name'], city['city_id'], columns, rows)
+                    record.add('rows_written', record.counters.get('rows_read', 0))
+                if not loaded:
+                    record.status = 'failed'
+                results.append(loaded)
+        if swap is not None and all(results):
+            with metrics.stage('swap_city', city['city_name']) as record:
+                results.append(swap.commit())
+                if results[-1]:
+                    record.add('rows_swapped', staged_rows)
+                else:
+                    record.status = 'failed'
+    if not all(results):
+        return False
+    if delta and changed_rows == 0:
+        return True
+    with metrics.stage('finalize_city', city['city_name']) as record:
+        result = refresh_service_dates(city['city_id']) and bump_feed_version(city['city_id'])  # 4
+        if not result:
+            record.status = 'failed'
+        return result
+
+
+def load_city_with_metrics(project_path: str, city: dict):
+    """ Loads the city in worker process, returns result and stage records, so they can be reported by the parent """
+    position = len(metrics.records)
+    result = update_city_tables_from_zip(project_path, city)
+    return result, metrics.get_records_since(position)
+
+
+def update_tables_from_zip(project_path: str, swap_partitions: bool = SWAP_CITY_PARTITIONS):
+    for city in read_json(project_path):
+        update_city_tables_from_zip(project_path, city, swap_partitions)
+
+
+def update_tables(project_path: str, streaming: bool = False):
+    with metrics.stage('update_tables'):
+        create_tables()
+        if streaming and SWAP_CITY_PARTITIONS:
+            partition_tables_by_city()
+        create_indexes()
+        sync_cities_table(read_json(project_path))
+        if streaming:
+            return update_tables_from_zip(project_path)
+        csv_path = os.path.join(project_path, 'csv_files')
+        for city in read_json(project_path):
+            results = []
+            for table in queries.TABLE_LIST:
+                table_path = os.path.join(csv_path, (city['city_name'])+'-' + table['table_name'] + '.csv')
+                if table['table_name'] in queries.OPTIONAL_TABLES and not os.path.exists(table_path):
+                    continue
+                with metrics.stage('load_table', city['city_name'], table['table_name']) as record:
+                    record.add('bytes_read', os.path.getsize(table_path))
+                    loaded = load_csv_through_staging(table_path, table['table_name'], city['city_id'],
+                                                      table.get('important_columns'))  # 1, 2
+                    if not loaded:
+                        record.status = 'failed'
+                    results.append(loaded)
+            if all(results):
+                with metrics.stage('finalize_city', city['city_name']) as record:
+                    if not (refresh_service_dates(city['city_id']) and bump_feed_version(city['city_id'])):  # 3
+                        record.status = 'failed'
+
+
+"""
+STEPS: run_parallel_pipeline
+1. Create tables (partitioned by city when partitions are swapped) and indexes and write cities to cities table
+2. Download zip files of all cities in thread pool, with conditional downloads only feeds that changed since
+ the last load are downloaded, unchanged cities are skipped
+3. As soon as zip file of the city is downloaded, load its tables in process pool (streaming from zip)
+4. Failure of one city doesn't stop the others, result of every city is returned
+5. With conditional downloads mark loaded feed, so it isn't loaded again until it changes
+"""
+
+
+def run_parallel_pipeline(project_path: str, download_workers: int = DOWNLOAD_WORKERS,
+                          load_workers: int = LOAD_WORKERS, config_name: str = 'cities.json',
+                          conditional_downloads: bool = CONDITIONAL_DOWNLOADS) -> dict:
+    data = read_json(project_path, config_name)
+    create_tables()  # 1
+    if SWAP_CITY_PARTITIONS:
+        partition_tables_by_city()
+    create_indexes()
+    sync_cities_table(data)
+    download = refresh_city_feed if conditional_downloads else download_city_zip
+    results = {}
+    with ThreadPoolExecutor(max_workers=download_workers) as download_pool, \
+            ProcessPoolExecutor(max_workers=load_workers) as load_pool:
+        downloads = {download_pool.submit(download, project_path, city): city for city in data}  # 2
+        loads = {}
+        for future in as_completed(downloads):
+            city = downloads[future]
+            try:
+                downloaded = future.result()
+            except Exception as e:
+                print(f"Error when downloading data of {city['city_name']}: {e}")
+                downloaded = None
+            if downloaded is None:
+                results[city['city_name']] = False
+            elif downloaded:
+                loads[load_pool.submit(load_city_with_metrics, project_path, city)] = city  # 3
+            else:
+                print(f"Feed of {city['city_name']} didn't change, skipping")
+                results[city['city_name']] = True
+        for future in as_completed(loads):
+            city = loads[future]
+            try:
+                results[city['city_name']], records = future.result()  # 4
+                metrics.add_records(records)
+            except Exception as e:
+                print(f"Error when loading data of {city['city_name']}: {e}")
+                results[city['city_name']] = False
+            if results[city['city_name']] and conditional_downloads:
+                mark_feed_loaded(project_path, city['city_name'])  # 5
+    return results
 
 
 if __name__ == '__main__':
     set_up(os.getcwd())
-    get_data(os.getcwd(), LIST_OF_TABLES)
-    update_tables(os.getcwd())
+    if PARALLEL_PIPELINE:
+        print(run_parallel_pipeline(os.getcwd()))
+    else:
+        get_data(os.getcwd(), LIST_OF_TABLES, streaming=STREAMING_INGEST)
+        update_tables(os.getcwd(), streaming=STREAMING_INGEST)
+    if METRICS_FILE:
+        metrics.write_textfile(METRICS_FILE)
 
 
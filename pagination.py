@@ -0,0 +1,144 @@
+import base64
+import binascii
+import json
+from psycopg2 import sql
+
+import queries
+
+DEFAULT_PAGE_LIMIT = 1000
+MAX_PAGE_LIMIT = 10000
+
+
+def parse_limit(value: str) -> int:
+    """ Parses *limit* query parameter
+
+    Parameters
+    ----------
+    value
+        Value of the parameter
+
+    Returns
+    -------
+    result
+        Number of rows on a page, at most MAX_PAGE_LIMIT.
+         Raises ValueError if value is not a positive number
+
+    """
+    if value in (None, ''):
+        return DEFAULT_PAGE_LIMIT
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f'Limit has to be positive, got {limit}')
+    return min(limit, MAX_PAGE_LIMIT)
+
+
+def encode_cursor(key_values: list) -> str:
+    """ Encodes key values of the last row on a page into opaque cursor
+
+    Parameters
+    ----------
+    key_values
+        Values of key columns of the last returned row
+
+    Returns
+    -------
+    result
+        url safe string passed back by the client as *after* parameter
+
+    """
+    return base64.urlsafe_b64encode(json.dumps(key_values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str, key_columns: list) -> list:
+    """ Decodes cursor created by *encode_cursor*
+
+    Parameters
+    ----------
+    cursor
+        Value of *after* parameter
+    key_columns
+        Key columns of the paginated table
+
+    Returns
+    -------
+    result
+        List of key values. Raises ValueError if cursor is malformed or its values don't match types of key columns
+
+    """
+    try:
+        key_values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f'Incorrect cursor {cursor}') from e
+    if not isinstance(key_values, list) or len(key_values) != len(key_columns):
+        raise ValueError(f'Incorrect cursor {cursor}')
+    for column, value in zip(key_columns, key_values):
+        # bool is a subclass of int, so types are compared exactly
+        if type(value) is not (int if queries.COLUMN_TYPES.get(column) == 'integer' else str):
+            raise ValueError(f'Incorrect cursor {cursor}')
+    return key_values
+
+
+def build_page_query(table_name: str, columns, key_columns: list, after_values,
+                     conditions: sql.Composable = None) -> sql.Composed:
+    """ Builds keyset pagination query, rows are ordered by key columns
+     and only rows with key greater than *after_values* are returned
+
+    Parameters
+    ----------
+    table_name
+        Name of the table
+    columns
+        List of selected columns, all columns if None
+    key_columns
+        Key columns of the table
+    after_values
+        Key values from the cursor, None for the first page
+    conditions
+        Filter conditions put before key condition, with their own placeholders
+
+    Returns
+    -------
+    result
+        Query with city_id, filter values, key values (if after_values are given) and limit placeholders
+
+    """
+    keys = sql.SQL(', ').join(map(sql.Identifier, key_columns))
+    if after_values is None:
+        after_condition = sql.SQL('')
+    else:
+        after_condition = sql.SQL(queries.AFTER_KEY_CONDITION).format(
+            key_columns=keys, key_values=sql.SQL(', ').join(sql.Placeholder() * len(key_columns)))
+    if conditions is not None:
+        after_condition = sql.Composed([conditions, after_condition])
+    if columns is None:
+        selected = sql.SQL('*')
+    else:
+        selected = sql.SQL(', ').join(map(sql.Identifier, columns))
+    return sql.SQL(queries.GET_TABLE_PAGE).format(columns=selected, table_name=sql.Identifier(table_name),
+                                                  after_condition=after_condition, key_columns=keys)
+
+
+def get_next_cursor(rows: list, column_names: list, key_columns: list, limit: int):
+    """ Returns cursor pointing after the last row, None if page is the last one
+
+    Parameters
+    ----------
+    rows
+        Rows of the page
+    column_names
+        Names of the columns in rows
+    key_columns
+        Key columns of the table
+    limit
+        Requested number of rows on a page
+
+    Returns
+    -------
+    result
+        Cursor for the next page or None
+
+    """
+    if len(rows) < limit:
+        return None
+    positions = [column_names.index(column) for column in key_columns]
+    return encode_cursor([rows[-1][position] for position in positions])
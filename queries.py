@@ -12,6 +12,49 @@ UPDATE_ROUTE_TABLE = """
 
 DELETE_OLD_RECORDS ="DELETE FROM {table_name} where city_id = %s"
 
+COPY_FROM_STDIN = "COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)"
+
+CHECK_TABLE_IS_PARTITIONED = """
+    SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))
+    """
+
+DROP_TABLE_IF_EXISTS = "DROP TABLE IF EXISTS {table_name}"
+
+# indexes are built while rows are copied, so ATTACH PARTITION only attaches them instead of building them under lock
+CREATE_STAGING_PARTITION = "CREATE TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS INCLUDING INDEXES)"
+
+ADD_CITY_CHECK_CONSTRAINT = "ALTER TABLE {staging} ADD CONSTRAINT {constraint} CHECK (city_id = {city_id})"
+
+CREATE_CITY_PARTITION = "CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table_name} FOR VALUES IN ({city_id})"
+
+DETACH_PARTITION = "ALTER TABLE {table_name} DETACH PARTITION {partition}"
+
+ATTACH_PARTITION = "ALTER TABLE {table_name} ATTACH PARTITION {staging} FOR VALUES IN ({city_id})"
+
+RENAME_TABLE = "ALTER TABLE {staging} RENAME TO {partition}"
+
+SET_LOCK_TIMEOUT = "SET LOCAL lock_timeout = {timeout}"
+
+ADVISORY_XACT_LOCK = "SELECT pg_advisory_xact_lock(%s)"
+
+# parents are always locked in the order of their names, so concurrent swaps can't deadlock
+LOCK_TABLES = "LOCK TABLE {table_names} IN ACCESS EXCLUSIVE MODE"
+
+SAVEPOINT_SWAP = "SAVEPOINT swap_partitions"
+
+ROLLBACK_TO_SAVEPOINT_SWAP = "ROLLBACK TO SAVEPOINT swap_partitions"
+
+CHECK_TABLE_EXISTS = "SELECT to_regclass(%s) IS NOT NULL"
+
+CREATE_PARTITIONED_TABLE = "CREATE TABLE {table_name} (LIKE {source} INCLUDING DEFAULTS) PARTITION BY LIST (city_id)"
+
+# holds records without city_id, records of cities are kept in their own partitions
+CREATE_DEFAULT_PARTITION = "CREATE TABLE {partition} PARTITION OF {table_name} DEFAULT"
+
+GET_TABLE_CITY_IDS = "SELECT DISTINCT city_id FROM {table_name} WHERE city_id IS NOT NULL"
+
+COPY_ALL_RECORDS = "INSERT INTO {table_name} SELECT * FROM {source}"
+
 
 INSERT_NEW_RECORDS_ROUTES = """
     INSERT INTO routes(route_id,route_short_name,route_desc,city_id,date)
@@ -42,23 +85,155 @@ INSERT_NEW_RECORDS_TRIPS = """
     WHERE temp_trips.city_id = %s
     """
 
+INSERT_NEW_RECORDS_CALENDAR = """
+    INSERT INTO calendar (service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date,
+        city_id,date)
+    SELECT service_id, monday, tuesday, wednesday, thursday, friday, saturday, sunday, start_date, end_date,
+        city_id, date
+    FROM temp_calendar
+    WHERE temp_calendar.city_id = %s
+    """
+
+INSERT_NEW_RECORDS_CALENDAR_DATES = """
+    INSERT INTO calendar_dates (service_id,exception_date,exception_type,city_id,date)
+    SELECT service_id, exception_date, exception_type, city_id, date
+    FROM temp_calendar_dates
+    WHERE temp_calendar_dates.city_id = %s
+    """
+
+DELETE_OLD_SERVICE_DATES = "DELETE FROM service_dates WHERE city_id = %s"
+
+# dates on which service runs: days of the week between start_date and end_date from calendar,
+# plus dates added (exception_type 1) and minus dates removed (exception_type 2) in calendar_dates
+INSERT_SERVICE_DATES = """
+    INSERT INTO service_dates (city_id, service_id, service_date)
+    (SELECT c.city_id, c.service_id, d::date
+        FROM calendar c,
+        generate_series(to_date(c.start_date, 'YYYYMMDD'), to_date(c.end_date, 'YYYYMMDD'), interval '1 day') d
+        WHERE c.city_id = %(city_id)s
+        AND (ARRAY[c.monday, c.tuesday, c.wednesday, c.thursday, c.friday, c.saturday, c.sunday])
+            [extract(isodow FROM d)::integer] = 1
+    UNION
+    SELECT city_id, service_id, to_date(exception_date, 'YYYYMMDD')
+        FROM calendar_dates
+        WHERE city_id = %(city_id)s AND exception_type = 1)
+    EXCEPT
+    SELECT city_id, service_id, to_date(exception_date, 'YYYYMMDD')
+        FROM calendar_dates
+        WHERE city_id = %(city_id)s AND exception_type = 2
+    """
+
+CREATE_STAGING_TABLE = "CREATE TEMP TABLE {staging} ({column_definitions}) ON COMMIT DROP"
+
+CREATE_DELTA_STAGING_TABLE = "CREATE TEMP TABLE {staging} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+
+ANALYZE_TABLE = "ANALYZE {table_name}"
+
+DELETE_MISSING_RECORDS = """
+    DELETE FROM {table_name} t
+    WHERE t.city_id = %s
+    AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE {key_condition})
+    """
+
+UPDATE_CHANGED_RECORDS = """
+    UPDATE {table_name} t
+    SET {assignments}
+    FROM {staging} s
+    WHERE t.city_id = %s AND {key_condition}
+    AND md5(ROW({target_columns})::text) <> md5(ROW({staging_columns})::text)
+    """
+
+INSERT_MISSING_RECORDS = """
+    INSERT INTO {table_name} ({columns})
+    SELECT {staging_columns} FROM {staging} s
+    WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE t.city_id = %s AND {key_condition})
+    """
+
 GET_ROUTE_TABLE = """
-    SELECT route_id,route_short_name,route_desc FROM routes
-    WHERE city_id = %s
+    SELECT {columns} FROM routes
+    WHERE city_id = %s{conditions}
     """
 
 GET_TRIPS_TABLE = """
-    SELECT * FROM trips
-    WHERE city_id = %s
+    SELECT {columns} FROM trips
+    WHERE city_id = %s{conditions}
     """
 
 GET_STOPS_TABLE = """
-    SELECT * FROM stops
-    WHERE city_id = %s
+    SELECT {columns} FROM stops
+    WHERE city_id = %s{conditions}
     """
 
 GET_STOP_TIMES_TABLE = """
-    SELECT * FROM stop_times
+    SELECT {columns} FROM stop_times
+    WHERE city_id = %s{conditions}
+    """
+
+DECLARE_CURSOR = "DECLARE {cursor_name} NO SCROLL CURSOR FOR {query}"
+
+FETCH_CURSOR = "FETCH FORWARD %s FROM {cursor_name}"
+
+FILTER_CONDITION = " AND {column} {operator} %s"
+
+SERVICE_DATE_CONDITION = """ AND EXISTS (
+    SELECT 1 FROM service_dates sd
+    WHERE sd.city_id = {table_name}.city_id AND sd.service_id = {table_name}.service_id AND sd.service_date = %s)"""
+
+GET_TABLE_PAGE = """
+    SELECT {columns} FROM {table_name}
+    WHERE city_id = %s{after_condition}
+    ORDER BY {key_columns}
+    LIMIT %s
+    """
+
+AFTER_KEY_CONDITION = " AND ({key_columns}) > ({key_values})"
+
+CREATE_FEED_VERSION_TABLE = """
+    CREATE TABLE IF NOT EXISTS feed_version (
+        city_id integer PRIMARY KEY,
+        version bigint NOT NULL,
+        loaded_at timestamptz NOT NULL DEFAULT now())
+    """
+
+BUMP_FEED_VERSION = """
+    INSERT INTO feed_version (city_id, version, loaded_at) VALUES (%s, 1, now())
+    ON CONFLICT (city_id) DO UPDATE SET version = feed_version.version + 1, loaded_at = now()
+    """
+
+GET_FEED_VERSION = """
+    SELECT version, loaded_at FROM feed_version
+    WHERE city_id = %s
+    """
+
+UPSERT_CITY = """
+    INSERT INTO cities (city_id, city_name) VALUES (%s, %s)
+    ON CONFLICT (city_id) DO UPDATE SET city_name = EXCLUDED.city_name
+    """
+
+GET_STOP_LOCATIONS = """
+    SELECT stop_id, stop_code, stop_name, stop_lat::double precision AS stop_lat,
+        stop_lon::double precision AS stop_lon FROM stops
+    WHERE city_id = %s
+    """
+
+# trips after midnight belong to the previous service day and have departure_time over 24:00:00
+GET_DEPARTURES = """
+    SELECT st.departure_time, sd.service_date::text AS service_date, st.stop_sequence,
+        t.trip_id, t.trip_headsign, t.direction_id, r.route_id, r.route_short_name
+    FROM stop_times st
+    JOIN trips t ON t.city_id = st.city_id AND t.trip_id = st.trip_id
+    JOIN routes r ON r.city_id = t.city_id AND r.route_id = t.route_id
+    JOIN service_dates sd ON sd.city_id = t.city_id AND sd.service_id = t.service_id
+    WHERE st.city_id = %(city_id)s AND st.stop_id = %(stop_id)s AND st.departure_time >= %(time)s
+    AND sd.service_date IN (%(date)s::date, %(date)s::date - 1)
+    AND sd.service_date + st.departure_time::interval >= %(date)s::date + %(time)s::interval
+    AND coalesce(st.pickup_type, 0) <> 1
+    ORDER BY sd.service_date + st.departure_time::interval
+    LIMIT %(limit)s
+    """
+
+GET_EXPORT_TABLE = """
+    SELECT * FROM {table_name}
     WHERE city_id = %s
     """
 
@@ -77,6 +252,67 @@ TABLE_LIST = [{'table_name': 'routes', 'insert_query': INSERT_NEW_RECORDS_ROUTES
                'important_columns': ['stop_id', 'stop_code', 'stop_name', 'stop_lat', 'stop_lon', 'city_id', 'date']},
               {'table_name': 'trips', 'insert_query': INSERT_NEW_RECORDS_TRIPS,
                'important_columns': ['route_id', 'service_id', 'trip_id', 'trip_headsign', 'direction_id', 'shape_id',
-                                     'city_id', 'date']}]
+                                     'city_id', 'date']},
+              {'table_name': 'calendar', 'insert_query': INSERT_NEW_RECORDS_CALENDAR,
+               'important_columns': ['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday',
+                                     'saturday', 'sunday', 'start_date', 'end_date', 'city_id', 'date']},
+              {'table_name': 'calendar_dates', 'insert_query': INSERT_NEW_RECORDS_CALENDAR_DATES,
+               'important_columns': ['service_id', 'exception_date', 'exception_type', 'city_id', 'date']}]
+
+# GTFS tables which may be missing from the feed
+OPTIONAL_TABLES = ['calendar', 'calendar_dates']
+
+# natural keys of GTFS tables, used for keyset pagination
+TABLE_KEY_COLUMNS = {'routes': ['route_id'],
+                     'trips': ['trip_id'],
+                     'stops': ['stop_id'],
+                     'stop_times': ['trip_id', 'stop_sequence'],
+                     'calendar': ['service_id'],
+                     'calendar_dates': ['service_id', 'exception_date']}
+
+# columns returned by the API, all columns if table is not listed
+API_TABLE_COLUMNS = {'routes': ['route_id', 'route_short_name', 'route_desc']}
+
+# columns which can be used in API filters and their allowed operators
+EQUALITY_FILTER = ('=',)
+RANGE_FILTER = ('=', '>=', '<=')
+TABLE_FILTERS = {'routes': {'route_id': EQUALITY_FILTER, 'route_short_name': EQUALITY_FILTER},
+                 'trips': {'route_id': EQUALITY_FILTER, 'service_id': EQUALITY_FILTER, 'trip_id': EQUALITY_FILTER,
+                           'direction_id': EQUALITY_FILTER, 'shape_id': EQUALITY_FILTER},
+                 'stops': {'stop_id': EQUALITY_FILTER, 'stop_code': EQUALITY_FILTER},
+                 'stop_times': {'trip_id': EQUALITY_FILTER, 'stop_id': EQUALITY_FILTER, 'stop_sequence': RANGE_FILTER,
+                                'arrival_time': RANGE_FILTER, 'departure_time': RANGE_FILTER}}
+
+CREATE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS calendar (
+        service_id text, monday integer, tuesday integer, wednesday integer, thursday integer, friday integer,
+        saturday integer, sunday integer, start_date text, end_date text, city_id integer, date timestamptz)""",
+    """CREATE TABLE IF NOT EXISTS calendar_dates (
+        service_id text, exception_date text, exception_type integer, city_id integer, date timestamptz)""",
+    """CREATE TABLE IF NOT EXISTS service_dates (
+        city_id integer, service_id text, service_date date, PRIMARY KEY (city_id, service_date, service_id))""",
+]
 
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS routes_city_key_idx ON routes (city_id, route_id)",
+    "CREATE INDEX IF NOT EXISTS trips_city_key_idx ON trips (city_id, trip_id)",
+    "CREATE INDEX IF NOT EXISTS stops_city_key_idx ON stops (city_id, stop_id)",
+    "CREATE INDEX IF NOT EXISTS stop_times_city_key_idx ON stop_times (city_id, trip_id, stop_sequence)",
+    "CREATE INDEX IF NOT EXISTS stop_times_departures_idx ON stop_times (city_id, stop_id, departure_time)",
+    "CREATE INDEX IF NOT EXISTS trips_city_service_idx ON trips (city_id, service_id)",
+    "CREATE INDEX IF NOT EXISTS trips_city_route_idx ON trips (city_id, route_id)",
+    "CREATE INDEX IF NOT EXISTS stops_city_code_idx ON stops (city_id, stop_code)",
+    "CREATE INDEX IF NOT EXISTS calendar_city_key_idx ON calendar (city_id, service_id)",
+    "CREATE INDEX IF NOT EXISTS calendar_dates_city_key_idx ON calendar_dates (city_id, service_id, exception_date)",
+]
 
+# column types of the feed tables, used for staging tables
+COLUMN_TYPES = {'route_id': 'text', 'route_short_name': 'text', 'route_desc': 'text',
+                'service_id': 'text', 'trip_id': 'text', 'trip_headsign': 'text', 'direction_id': 'integer',
+                'shape_id': 'text', 'stop_id': 'text', 'stop_code': 'text', 'stop_name': 'text',
+                'stop_lat': 'double precision', 'stop_lon': 'double precision', 'arrival_time': 'text',
+                'departure_time': 'text', 'stop_sequence': 'integer', 'pickup_type': 'integer',
+                'drop_off_type': 'integer', 'monday': 'integer', 'tuesday': 'integer', 'wednesday': 'integer',
+                'thursday': 'integer', 'friday': 'integer', 'saturday': 'integer', 'sunday': 'integer',
+                'start_date': 'text', 'end_date': 'text', 'exception_date': 'text', 'exception_type': 'integer',
+                'city_id': 'integer', 'date': 'timestamptz'}
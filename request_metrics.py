@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import psycopg2
+import psycopg2.extensions
+from instrumentation import escape_label_value
+
+# instrumentation is opt-in, without API_METRICS=1 cursors aren't wrapped and phases aren't measured
+ENABLED = os.getenv('API_METRICS', '0') == '1'
+# queries running longer than this (execute and fetches together) are logged with their EXPLAIN plan
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 500))
+METRIC_PREFIX = 'api'
+PHASES = ('connection', 'execute', 'fetch', 'serialize', 'compress', 'total')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTES_BUCKETS = (256, 1024, 10240, 102400, 1048576, 10485760, 104857600)
+
+
+class Histogram:
+    """ Cumulative Prometheus histogram, guarded by the lock of RequestMetrics """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_lines(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bucket}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class RequestTimer:
+    """ Time spent in every phase of one request, rows fetched from database and size of the response """
+
+    def __init__(self, route: str):
+        self.route = route
+        self.start = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.rows = 0
+        self.response_bytes = 0
+
+
+_current = ContextVar('request_timer', default=None)
+
+
+def start_request(route: str) -> RequestTimer:
+    timer = RequestTimer(route)
+    _current.set(timer)
+    return timer
+
+
+def get_current() -> RequestTimer:
+    return _current.get()
+
+
+def record_phase(phase: str, seconds: float):
+    timer = _current.get()
+    if timer is not None:
+        timer.phases[phase] += seconds
+
+
+@contextmanager
+def phase(name: str):
+    """ Adds time spent in the block to the phase of current request, does nothing outside of measured request """
+    if _current.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - start)
+
+
+def count_bytes(chunks, timer: RequestTimer):
+    """ Yields chunks of streamed response, adding their size to the timer """
+    for chunk in chunks:
+        timer.response_bytes += len(chunk)
+        yield chunk
+
+
+class RequestMetrics:
+    """ Latency histograms per route and phase, histograms of rows and response bytes per route
+     and counters of requests and slow queries, rendered in Prometheus text format
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.rows = {}
+        self.response_bytes = {}
+        self.requests = {}
+        self.slow_queries = {}
+
+    def observe(self, timer: RequestTimer, status: int):
+        timer.phases['total'] = time.perf_counter() - timer.start
+        with self._lock:
+            for name, seconds in timer.phases.items():
+                self.durations.setdefault((timer.route, name), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.rows.setdefault(timer.route, Histogram(ROWS_BUCKETS)).observe(timer.rows)
+            self.response_bytes.setdefault(timer.route, Histogram(BYTES_BUCKETS)).observe(timer.response_bytes)
+            self.requests[(timer.route, status)] = self.requests.get((timer.route, status), 0) + 1
+
+    def add_slow_query(self, route: str):
+        with self._lock:
+            self.slow_queries[route] = self.slow_queries.get(route, 0) + 1
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            if self.durations:
+                lines.append(f'# TYPE {METRIC_PREFIX}_request_phase_seconds histogram')
+                for (route, name), histogram in self.durations.items():
+                    lines.extend(histogram.to_lines(f'{METRIC_PREFIX}_request_phase_seconds',
+                                                    f'route="{escape_label_value(route)}",phase="{name}"'))
+            for metric, histograms in (('response_rows', self.rows), ('response_bytes', self.response_bytes)):
+                if histograms:
+                    lines.append(f'# TYPE {METRIC_PREFIX}_{metric} histogram')
+                for route, histogram in histograms.items():
+                    lines.extend(histogram.to_lines(f'{METRIC_PREFIX}_{metric}',
+                                                    f'route="{escape_label_value(route)}"'))
+            if self.requests:
+                lines.append(f'# TYPE {METRIC_PREFIX}_requests_total counter')
+            for (route, status), count in self.requests.items():
+                lines.append(f'{METRIC_PREFIX}_requests_total{{route="{escape_label_value(route)}",'
+                             f'status="{status}"}} {count}')
+            if self.slow_queries:
+                lines.append(f'# TYPE {METRIC_PREFIX}_slow_queries_total counter')
+            for route, count in self.slow_queries.items():
+                lines.append(f'{METRIC_PREFIX}_slow_queries_total{{route="{escape_label_value(route)}"}} {count}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+metrics = RequestMetrics()
+
+
+def finish_request(timer: RequestTimer, status: int):
+    """ Records the request, called when response body was sent """
+    metrics.observe(timer, status)
+    if _current.get() is timer:
+        _current.set(None)
+
+
+def render_gauges(prefix: str, stats: dict) -> str:
+    """ Renders numeric values of stats dictionary (pool or cache stats) as Prometheus gauges """
+    lines = []
+    for name, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'# TYPE {METRIC_PREFIX}_{prefix}_{name} gauge')
+            lines.append(f'{METRIC_PREFIX}_{prefix}_{name} {value}')
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def explain(cursor, statement: bytes) -> str:
+    """ Returns EXPLAIN plan of the statement, read in savepoint on connection of the cursor,
+     so failed EXPLAIN doesn't abort the transaction of the request
+    """
+    with cursor.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as explain_cursor:
+        explain_cursor.execute('SAVEPOINT explain_slow_query')
+        try:
+            explain_cursor.execute(b'EXPLAIN ' + statement)
+            return '\n'.join(row[0] for row in explain_cursor.fetchall())
+        except psycopg2.Error as e:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT explain_slow_query')
+            return f'EXPLAIN failed: {e}'
+        finally:
+            explain_cursor.execute('RELEASE SAVEPOINT explain_slow_query')
+
+
+def log_slow_query(cursor, statement: bytes, seconds: float, rows: int):
+    timer = _current.get()
+    route = None if timer is None else timer.route
+    metrics.add_slow_query(route)
+    print(json.dumps({'event': 'slow_query', 'route': route, 'duration_ms': round(seconds * 1000, 2), 'rows': rows,
+                      'query': statement.decode('utf-8', 'replace'), 'plan': explain(cursor, statement)}),
+          flush=True)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """ Cursor adding time of execute and fetch calls and number of fetched rows to current request.
+     When the cursor is closed after queries longer than SLOW_QUERY_MS, the query is logged with its plan
+    """
+    _statement = None
+    _seconds = 0.0
+    _rows = 0
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._add_time('execute', time.perf_counter() - start)
+            self._statement = (query, vars)
+
+    def _add_time(self, name: str, seconds: float):
+        self._seconds += seconds
+        record_phase(name, seconds)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        rows = method(*args)
+        self._add_time('fetch', time.perf_counter() - start)
+        count = len(rows) if isinstance(rows, list) else int(rows is not None)
+        self._rows += count
+        timer = _current.get()
+        if timer is not None:
+            timer.rows += count
+        return rows
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def close(self):
+        if not self.closed and self._statement is not None and self._seconds * 1000 >= SLOW_QUERY_MS:
+            statement = self.mogrify(*self._statement)
+            self._statement = None
+            try:
+                log_slow_query(self, statement, self._seconds, self._rows)
+            except psycopg2.Error as e:
+                print(f'Error when explaining slow query: {e}')
+        super().close()
+
+
+def get_cursor_factory():
+    """ Returns cursor class for connections of the pool, None (default cursor) if metrics are disabled """
+    return TimedCursor if ENABLED else None
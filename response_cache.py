@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_VERSION_TTL = 5
+
+
+class ResponseCache:
+    """ LRU cache of serialized responses bounded by total size of cached bodies.
+     Every entry remembers feed version it was built from, entry built from older version is a miss
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key, version):
+        """ Returns cached body for the key built from given feed version, None on miss """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._remove(key)
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, version, body: bytes):
+        """ Caches body, evicts least recently used entries when cache is over *max_bytes* """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        version, body = self._entries.pop(key)
+        self.size -= len(body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['bytes'] = self.size
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+class FeedVersions:
+    """ Remembers feed version of every city for *ttl* seconds,
+     so database is asked for the version at most once per ttl instead of on every request
+    """
+
+    def __init__(self, loader, ttl: float = DEFAULT_VERSION_TTL):
+        self.loader = loader
+        self.ttl = ttl
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get_fresh(self, city_id: int):
+        """ Returns (found, version), found is False if version of the city wasn't read in the last *ttl* seconds """
+        with self._lock:
+            cached = self._versions.get(city_id)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return True, cached[1]
+        return False, None
+
+    def set(self, city_id: int, version):
+        with self._lock:
+            self._versions[city_id] = (time.monotonic(), version)
+
+    def get(self, city_id: int):
+        """ Returns (version, loaded_at) tuple of the city as returned by loader """
+        found, version = self.get_fresh(city_id)
+        if found:
+            return version
+        version = self.loader(city_id)
+        self.set(city_id, version)
+        return version
@@ -0,0 +1,72 @@
+import datetime
+import decimal
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RECORDS_SHAPE = 'records'
+COLUMNS_SHAPE = 'columns'
+SHAPES = (RECORDS_SHAPE, COLUMNS_SHAPE)
+
+
+def default(value):
+    """ Converts postgres values which json encoder can't encode itself """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, memoryview):
+        return value.hex()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(obj) -> bytes:
+    """ Encodes object to json bytes, with orjson if it is installed """
+    if orjson is not None:
+        return orjson.dumps(obj, default=default)
+    return json.dumps(obj, default=default, separators=(',', ':')).encode('utf-8')
+
+
+def parse_shape(value: str = None) -> str:
+    """ Returns shape of the response, records (list of objects) by default. Raises ValueError for unknown shape """
+    if value is None or value == '':
+        return RECORDS_SHAPE
+    if value not in SHAPES:
+        raise ValueError(f'Incorrect shape {value}, expected one of {", ".join(SHAPES)}')
+    return value
+
+
+def get_columns(description) -> list:
+    return [column[0] for column in description]
+
+
+def rows_to_body(columns: list, rows: list, shape: str = RECORDS_SHAPE, **extra) -> dict:
+    """ Returns rows in given shape, records as {"data": [{column: value}]},
+     columns as {"columns": [column], "rows": [[value]]} with column names written once.
+     *extra* keys are added to the body (for example next page cursor)
+    """
+    if shape == COLUMNS_SHAPE:
+        return dict(columns=columns, rows=rows, **extra)
+    return dict(data=[dict(zip(columns, row)) for row in rows], **extra)
+
+
+def encode_rows(columns: list, rows: list, shape: str = RECORDS_SHAPE) -> bytes:
+    """ Encodes rows fetched from cursor, records as list of objects, columns as {"columns": [], "rows": [[]]} """
+    if shape == COLUMNS_SHAPE:
+        return dumps({'columns': columns, 'rows': rows})
+    return dumps([dict(zip(columns, row)) for row in rows])
+
+
+def encode_rows_chunk(columns: list, rows: list, shape: str = RECORDS_SHAPE, separator: bytes = b',') -> bytes:
+    """ Encodes rows as *separator* joined json values without enclosing brackets, used when streaming """
+    if shape == COLUMNS_SHAPE:
+        return separator.join(dumps(row) for row in rows)
+    return separator.join(dumps(dict(zip(columns, row))) for row in rows)
@@ -0,0 +1,151 @@
+import heapq
+import math
+import threading
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_DEGREE_LAT = 111320
+DEFAULT_CELL_SIZE_DEG = 0.01
+DEFAULT_RADIUS_M = 500
+MAX_RADIUS_M = 5000
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+
+
+def parse_point(lat: str, lon: str) -> tuple:
+    """ Returns (lat, lon) as floats, raises ValueError for non-finite or out of range coordinates """
+    lat, lon = float(lat), float(lon)
+    if not (math.isfinite(lat) and math.isfinite(lon)) or not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise ValueError(f'Incorrect coordinates {lat}, {lon}')
+    return lat, lon
+
+
+def parse_search(radius: str = None, limit: str = None) -> tuple:
+    """ Returns (radius, limit) of nearby search capped at MAX_RADIUS_M and MAX_LIMIT, defaults for missing values.
+     Raises ValueError unless radius is a finite positive number and limit is at least 1
+    """
+    radius = DEFAULT_RADIUS_M if radius is None else float(radius)
+    limit = DEFAULT_LIMIT if limit is None else int(limit)
+    if not (math.isfinite(radius) and radius > 0) or limit < 1:
+        raise ValueError(f'Incorrect radius {radius} or limit {limit}')
+    return min(radius, MAX_RADIUS_M), min(limit, MAX_LIMIT)
+
+
+def haversine_distance(lat_1: float, lon_1: float, lat_2: float, lon_2: float) -> float:
+    """ Returns distance between two points on Earth in meters """
+    phi_1, phi_2 = math.radians(lat_1), math.radians(lat_2)
+    d_phi = phi_2 - phi_1
+    d_lambda = math.radians(lon_2 - lon_1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi_1) * math.cos(phi_2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class StopGridIndex:
+    """ In-memory grid index of stops, stops are put into cells of *cell_size* degrees.
+     Nearest stops search only visits cells overlapping the search radius
+    """
+
+    def __init__(self, stops: list, cell_size: float = DEFAULT_CELL_SIZE_DEG):
+        """
+        Parameters
+        ----------
+        stops
+            List of dictionaries with at least stop_lat and stop_lon keys,
+             stops without coordinates are skipped
+        cell_size
+            Size of the grid cell in degrees
+        """
+        self.cell_size = cell_size
+        self.stops = [stop for stop in stops if stop.get('stop_lat') is not None and stop.get('stop_lon') is not None]
+        self._cells = {}
+        for position, stop in enumerate(self.stops):
+            cell = self._get_cell(float(stop['stop_lat']), float(stop['stop_lon']))
+            self._cells.setdefault(cell, []).append(position)
+
+    def __len__(self):
+        return len(self.stops)
+
+    def _get_cell(self, lat: float, lon: float) -> tuple:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def nearest(self, lat: float, lon: float, radius: float = DEFAULT_RADIUS_M, limit: int = DEFAULT_LIMIT) -> list:
+        """ Returns up to *limit* stops closest to the point within *radius* meters
+
+        Parameters
+        ----------
+        lat
+            Latitude of the point
+        lon
+            Longitude of the point
+        radius
+            Search radius in meters
+        limit
+            Maximum number of returned stops
+
+        Returns
+        -------
+        result
+            List of (distance in meters, stop dictionary) tuples sorted by distance
+
+        """
+        d_lat = radius / METERS_PER_DEGREE_LAT
+        # longitude span grows towards the poles, at 180 degrees the radius covers every longitude
+        d_lon = min(radius / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6)), 180)
+        min_cell = self._get_cell(lat - d_lat, lon - d_lon)
+        max_cell = self._get_cell(lat + d_lat, lon + d_lon)
+        every_lon = d_lon >= 180
+        lon_cells = min(max_cell[1] - min_cell[1] + 1, math.ceil(360 / self.cell_size))
+        if (max_cell[0] - min_cell[0] + 1) * lon_cells > len(self._cells):
+            # fewer occupied cells than cells in range, filter occupied cells instead of visiting the range
+            cells = [cell for cell in self._cells if min_cell[0] <= cell[0] <= max_cell[0] and
+                     (every_lon or min_cell[1] <= cell[1] <= max_cell[1])]
+        else:
+            cells = [(cell_lat, cell_lon) for cell_lat in range(min_cell[0], max_cell[0] + 1)
+                     for cell_lon in range(min_cell[1], max_cell[1] + 1)]
+        candidates = []
+        for cell in cells:
+            for position in self._cells.get(cell, ()):
+                stop = self.stops[position]
+                distance = haversine_distance(lat, lon, float(stop['stop_lat']), float(stop['stop_lon']))
+                if distance <= radius:
+                    candidates.append((distance, position))
+        return [(distance, self.stops[position]) for distance, position in heapq.nsmallest(limit, candidates)]
+
+
+class StopIndexCache:
+    """ Keeps one index per city and builds it again when feed version of the city changes """
+
+    def __init__(self, loader):
+        """
+        Parameters
+        ----------
+        loader
+            Function taking city_id and returning list of stop dictionaries
+        """
+        self.loader = loader
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get_cached(self, city_id: int, version):
+        """ Returns index of the city built from given feed version, None if it wasn't built yet """
+        cached = self._indexes.get(city_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        return None
+
+    def put(self, city_id: int, version, stops: list) -> StopGridIndex:
+        """ Builds index from stops loaded by the caller, used when stops are loaded asynchronously """
+        index = StopGridIndex(stops)
+        with self._lock:
+            self._indexes[city_id] = (version, index)
+        return index
+
+    def get(self, city_id: int, version) -> StopGridIndex:
+        cached = self.get_cached(city_id, version)
+        if cached is not None:
+            return cached
+        with self._lock:
+            cached = self._indexes.get(city_id)
+            if cached is None or cached[0] != version:
+                cached = (version, StopGridIndex(self.loader(city_id)))
+                self._indexes[city_id] = cached
+        return cached[1]
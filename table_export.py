@@ -0,0 +1,112 @@
+import os
+import tempfile
+import threading
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_DIR = 'export_files'
+EXPORT_FORMATS = {'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+                  'parquet': ('.parquet', 'application/vnd.apache.parquet')}
+EXPORT_TABLES = ['routes', 'trips', 'stops', 'stop_times', 'calendar', 'calendar_dates']
+EXPORT_BATCH_SIZE = 50000
+
+# postgres type oids (cursor.description type_code) and matching arrow type names
+ARROW_TYPE_NAMES = {16: 'bool_', 20: 'int64', 21: 'int16', 23: 'int32', 700: 'float32', 701: 'float64',
+                    1700: 'float64', 1082: 'date32', 1114: 'timestamp', 1184: 'timestamp_tz'}
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def is_available() -> bool:
+    return pa is not None
+
+
+def get_arrow_type(type_code: int):
+    """ Returns arrow type of the postgres column, string for types without exact match """
+    type_name = ARROW_TYPE_NAMES.get(type_code)
+    if type_name == 'timestamp':
+        return pa.timestamp('us')
+    if type_name == 'timestamp_tz':
+        return pa.timestamp('us', tz='UTC')
+    if type_name is None:
+        return pa.string()
+    return getattr(pa, type_name)()
+
+
+def get_export_path(project_path: str, city_name: str, table_name: str, version, export_format: str) -> str:
+    """ Returns path of exported table of given feed version """
+    extension = EXPORT_FORMATS[export_format][0]
+    return os.path.join(project_path, EXPORT_DIR, f'{city_name}-{table_name}-v{version}{extension}')
+
+
+def delete_other_versions(project_path: str, city_name: str, table_name: str, path: str):
+    """ Deletes files exported from other feed versions of the table than the version of *path*,
+     files of that version in other formats are kept
+    """
+    export_path = os.path.join(project_path, EXPORT_DIR)
+    prefix = f'{city_name}-{table_name}-v'
+    version = os.path.basename(path)[len(prefix):].split('.')[0]
+    for file in os.listdir(export_path):
+        file_path = os.path.join(export_path, file)
+        if file.startswith(prefix) and file[len(prefix):].split('.')[0] != version and not file.endswith('.tmp'):
+            try:
+                os.remove(file_path)
+            except OSError as e:
+                print(f"Can't remove old export {file_path}: {e}")
+
+
+def to_arrow_values(values, arrow_type) -> list:
+    """ Converts values which arrow doesn't convert itself, like Decimal to float or unknown types to string """
+    if pa.types.is_string(arrow_type):
+        return [None if value is None else str(value) for value in values]
+    if pa.types.is_floating(arrow_type):
+        return [None if value is None else float(value) for value in values]
+    return values
+
+
+def write_export(path: str, description, batches, export_format: str):
+    """ Writes rows to Arrow IPC file or Parquet file, one record batch at a time.
+     File is written under temporary name and renamed, so readers never see partly written file
+
+    Parameters
+    ----------
+    path
+        Path of the exported file
+    description
+        cursor.description of the query
+    batches
+        Iterable of lists of row tuples
+    export_format
+        arrow or parquet
+    """
+    schema = pa.schema([(column[0], get_arrow_type(column[1])) for column in description])
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(handle)
+    try:
+        if export_format == 'parquet':
+            writer = pq.ParquetWriter(tmp_path, schema)
+        else:
+            writer = pa.ipc.new_file(tmp_path, schema)
+        with writer:
+            for rows in batches:
+                columns = list(zip(*rows)) if rows else [[] for _ in schema]
+                arrays = [pa.array(to_arrow_values(values, field.type), type=field.type)
+                          for values, field in zip(columns, schema)]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def get_lock(path: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
@@ -0,0 +1,106 @@
+from psycopg2 import sql
+
+import queries
+
+# query parameters of table endpoints which are not filters
+RESERVED_PARAMETERS = ('limit', 'after', 'stream', 'shape', 'date', 'fields')
+# departure_time>=08:00:00 is parsed as parameter "departure_time>" with value "08:00:00"
+RANGE_SUFFIXES = {'>': '>=', '<': '<='}
+
+
+def get_table_columns(table_name: str) -> list:
+    """ Returns columns of the table which can be returned by the API, raises KeyError for unknown table """
+    columns = queries.API_TABLE_COLUMNS.get(table_name)
+    if columns is not None:
+        return columns
+    for table in queries.TABLE_LIST:
+        if table['table_name'] == table_name:
+            return table['important_columns']
+    raise KeyError(table_name)
+
+
+def parse_fields(value: str, table_name: str):
+    """ Parses *fields* query parameter
+
+    Parameters
+    ----------
+    value
+        Comma separated column names
+    table_name
+        Name of the table
+
+    Returns
+    -------
+    result
+        List of selected columns, default columns of the table (None for all columns) if value is empty.
+         Raises ValueError for columns which are not returned by the API
+
+    """
+    if value in (None, ''):
+        return queries.API_TABLE_COLUMNS.get(table_name)
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    allowed = get_table_columns(table_name)
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise ValueError(f'Incorrect fields {", ".join(unknown) or value}, expected some of {", ".join(allowed)}')
+    return fields
+
+
+def parse_filters(args, table_name: str) -> list:
+    """ Parses filter query parameters, *column=value* for equality and *column>=value*, *column<=value* for ranges
+
+    Parameters
+    ----------
+    args
+        Query parameters of the request (werkzeug MultiDict)
+    table_name
+        Name of the table
+
+    Returns
+    -------
+    result
+        List of (column, operator, value) tuples. Parameters which aren't feed columns (cache busting *_*,
+         tracking parameters) are ignored. Raises ValueError for columns or operators which are not in
+         queries.TABLE_FILTERS
+
+    """
+    allowed = queries.TABLE_FILTERS.get(table_name, {})
+    filters = []
+    for key, value in args.items(multi=True):
+        if key in RESERVED_PARAMETERS:
+            continue
+        column, operator = key, '='
+        if key[-1:] in RANGE_SUFFIXES:
+            column, operator = key[:-1], RANGE_SUFFIXES[key[-1]]
+        if column not in queries.COLUMN_TYPES:
+            continue
+        if operator not in allowed.get(column, ()):
+            raise ValueError(f'Filter {key} is not supported for {table_name}')
+        if queries.COLUMN_TYPES.get(column) == 'integer':
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f'Filter {column} has to be a number, got {value}')
+        filters.append((column, operator, value))
+    return filters
+
+
+def build_conditions(filters: list):
+    """ Returns (conditions, params), conditions are appended to WHERE clause of the query.
+     Column names are quoted with sql.Identifier and operators come from the whitelist, values are passed as params
+    """
+    conditions = sql.Composed([sql.SQL(queries.FILTER_CONDITION).format(column=sql.Identifier(column),
+                                                                       operator=sql.SQL(operator))
+                               for column, operator, _ in filters])
+    return conditions, [value for _, _, value in filters]
+
+
+def get_selected_columns(columns) -> sql.Composable:
+    if columns is None:
+        return sql.SQL('*')
+    return sql.SQL(', ').join(map(sql.Identifier, columns))
+
+
+def build_table_query(query: str, columns, conditions: sql.Composable) -> sql.Composed:
+    """ Fills *columns* and *conditions* of table query from queries module """
+    return sql.SQL(query).format(columns=get_selected_columns(columns), conditions=conditions)
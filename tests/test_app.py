@@ -0,0 +1,163 @@
+import json
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+import app
+import pagination
+import response_cache
+
+
+class TestNearbyStops(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+        patcher = mock.patch('app.get_city_dict', return_value={'city_id': 1, 'city_name': 'Wroclaw'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch('app.stop_indexes')
+    @mock.patch('app.feed_versions')
+    def test_nearby_return_stops_with_distance(self, mock_feed_versions, mock_stop_indexes):
+        mock_feed_versions.get.return_value = (3, None)
+        mock_stop_indexes.get.return_value.nearest.return_value = [(12.34, {'stop_id': '1'})]
+        response = self.client.get('/stops/Wroclaw/nearby?lat=51.1&lon=17.03&radius=300&limit=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{'stop_id': '1', 'distance': 12.3}])
+        mock_stop_indexes.get.return_value.nearest.assert_called_once_with(51.1, 17.03, 300, 5)
+
+    def test_nearby_not_finite_or_not_positive_radius_and_limit_return_400(self):
+        for query in ('radius=nan', 'radius=inf', 'radius=-100', 'radius=0', 'limit=0', 'limit=-1', 'limit=x'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/stops/Wroclaw/nearby?lat=51.1&lon=17.03&{query}')
+                self.assertEqual(response.status_code, 400)
+
+
+
+class TestDepartures(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+        self.city = {'city_id': 1, 'city_name': 'Wroclaw', 'timezone': 'Europe/Warsaw'}
+        patcher = mock.patch('app.get_city_dict', return_value=self.city)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_gtfs_time_pad_time_and_keep_hours_after_midnight(self):
+        self.assertEqual(app.parse_gtfs_time('7:05'), '07:05:00')
+        self.assertEqual(app.parse_gtfs_time('25:10:00'), '25:10:00')
+
+    def test_parse_gtfs_time_incorrect_time_raise_ValueError(self):
+        for value in ('', '7', '7:60', '7:05:60', '-1:00', 'ab:cd', '1:2:3:4'):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    app.parse_gtfs_time(value)
+
+    def test_parse_departures_args_default_to_time_of_the_city(self):
+        now = app.datetime(2026, 3, 1, 23, 30, 15)
+        with mock.patch('app.get_city_now', return_value=now) as mock_now:
+            params = app.parse_departures_args({'limit': '500'}, self.city)
+        mock_now.assert_called_once_with(self.city)
+        self.assertEqual(params, {'time': '23:30:15', 'date': now.date(), 'limit': app.MAX_DEPARTURES_LIMIT})
+
+    def test_parse_departures_args_city_without_timezone_require_date_and_at(self):
+        city = {'city_id': 2, 'city_name': 'Poznan'}
+        with self.assertRaises(ValueError):
+            app.parse_departures_args({'at': '7:00'}, city)
+        params = app.parse_departures_args({'at': '7:00', 'date': '2026-03-01'}, city)
+        self.assertEqual((params['time'], params['limit']), ('07:00:00', app.DEFAULT_DEPARTURES_LIMIT))
+
+    def test_get_city_now_use_timezone_of_the_city(self):
+        self.assertEqual(app.get_city_now(self.city).tzinfo, app.ZoneInfo('Europe/Warsaw'))
+        with self.assertRaises(ValueError):
+            app.get_city_now({'city_name': 'Atlantis', 'timezone': 'Atlantis/Capital'})
+
+    @mock.patch('app.connection_pool.get_pool')
+    def test_departures_incorrect_parameters_return_400(self, mock_get_pool):
+        for query in ('limit=-1', 'limit=0', 'limit=x', 'at=24:61', 'date=2026-13-01', 'shape=table'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/departures/Wroclaw/100?{query}&date=2026-03-01&at=7:00')
+                self.assertEqual(response.status_code, 400)
+        mock_get_pool.assert_not_called()
+
+    @mock.patch('app.connection_pool.get_pool')
+    def test_departures_pass_parameters_to_query(self, mock_get_pool):
+        cursor = mock_get_pool().connection().__enter__().cursor().__enter__()
+        cursor.description = [('departure_time',), ('trip_id',)]
+        cursor.fetchall.return_value = [('25:10:00', 'T1')]
+        response = self.client.get('/departures/Wroclaw/100?date=2026-03-01&at=25:10&limit=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), [{'departure_time': '25:10:00', 'trip_id': 'T1'}])
+        self.assertEqual(cursor.execute.call_args[0][1], {'time': '25:10:00', 'date': app.datetime(2026, 3, 1).date(),
+                                                          'limit': 5, 'city_id': 1, 'stop_id': '100'})
+
+    @mock.patch('app.connection_pool.get_pool')
+    def test_departures_without_service_dates_return_503(self, mock_get_pool):
+        cursor = mock_get_pool().connection().__enter__().cursor().__enter__()
+        cursor.execute.side_effect = app.psycopg2.errors.UndefinedTable('relation "service_dates" does not exist')
+        response = self.client.get('/departures/Wroclaw/100?date=2026-03-01&at=7:00')
+        self.assertEqual(response.status_code, 503)
+
+
+
+class TestTableResponse(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+        self.version = (1, datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc))
+        self.rows = [('1', '101', 'Centrum'), ('2', '102', None)]
+        # versions are read on every request and cached bodies don't leak between tests
+        for patcher in (mock.patch('app.get_city_dict', return_value={'city_id': 1, 'city_name': 'Wroclaw'}),
+                        mock.patch('app.feed_versions', response_cache.FeedVersions(app.load_feed_version, ttl=0)),
+                        mock.patch('app.cache', response_cache.ResponseCache()),
+                        mock.patch('app.connection_pool.get_pool')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cursor = app.connection_pool.get_pool().connection().__enter__().cursor().__enter__()
+        self.cursor.fetchone.side_effect = lambda: self.version
+        self.cursor.description = [('route_id',), ('route_short_name',), ('route_desc',)]
+        self.cursor.fetchall.return_value = self.rows
+
+    def test_matching_etag_return_304_without_reading_table(self):
+        response = self.client.get('/routes/Wroclaw')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()[0], {'route_id': '1', 'route_short_name': '101', 'route_desc': 'Centrum'})
+        etag = response.headers['ETag']
+        response = self.client.get('/routes/Wroclaw', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.cursor.fetchall.assert_called_once()
+
+    def test_feed_version_bump_return_new_etag_and_new_body(self):
+        etag = self.client.get('/routes/Wroclaw').headers['ETag']
+        self.version = (2, datetime(2026, 3, 2, 12, 0, tzinfo=timezone.utc))
+        self.cursor.fetchall.return_value = self.rows[:1]
+        response = self.client.get('/routes/Wroclaw', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(len(response.get_json()), 1)
+        response = self.client.get('/routes/Wroclaw', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_streamed_body_is_valid_json(self):
+        for query, expected in (('stream=1', [{'route_id': '1', 'route_short_name': '101', 'route_desc': 'Centrum'},
+                                              {'route_id': '2', 'route_short_name': '102', 'route_desc': None}]),
+                                ('stream=1&shape=columns', {'columns': ['route_id', 'route_short_name', 'route_desc'],
+                                                            'rows': [['1', '101', 'Centrum'], ['2', '102', None]]})):
+            with self.subTest(query=query):
+                self.cursor.fetchmany.side_effect = [self.rows[:1], self.rows[1:], []]
+                response = self.client.get(f'/routes/Wroclaw?{query}')
+                self.assertTrue(response.is_streamed)
+                self.assertEqual(json.loads(response.get_data()), expected)
+
+    def test_streamed_ndjson_body_is_one_json_object_per_line(self):
+        self.cursor.fetchmany.side_effect = [self.rows[:1], self.rows[1:], []]
+        response = self.client.get('/routes/Wroclaw', headers={'Accept': app.NDJSON_MIMETYPE})
+        self.assertEqual(response.mimetype, app.NDJSON_MIMETYPE)
+        lines = response.get_data().decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['route_id'] for line in lines], ['1', '2'])
+
+    def test_malformed_cursor_return_400(self):
+        after = pagination.encode_cursor([{'route_id': '1'}])
+        response = self.client.get(f'/routes/Wroclaw?limit=1&after={after}')
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
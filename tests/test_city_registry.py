@@ -0,0 +1,36 @@
+import os
+from unittest import mock
+from pyfakefs.fake_filesystem_unittest import TestCase
+import city_registry
+
+
+class TestCityRegistry(TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+        self.fs.create_dir('\\project')
+        self.config_path = os.path.join('\\project', 'cities.json')
+        self.fs.create_file(self.config_path, contents='[{"city_id": 1, "city_name": "Wroclaw", '
+                                                       '"url": "test_url", "direct_link": false}]')
+
+    def test_get_by_name_and_id_return_city(self):
+        registry = city_registry.CityRegistry('\\project')
+        self.assertEqual(registry.get_by_name('Wroclaw')['city_id'], 1)
+        self.assertEqual(registry.get_by_id(1)['city_name'], 'Wroclaw')
+
+    def test_get_by_name_unknown_city_return_None(self):
+        registry = city_registry.CityRegistry('\\project')
+        self.assertIsNone(registry.get_by_name('Unknown'))
+
+    def test_get_by_name_file_not_changed_not_read_again(self):
+        registry = city_registry.CityRegistry('\\project', check_interval=0)
+        with mock.patch('city_registry.dataset_scrapper.read_json') as mock_read:
+            registry.get_by_name('Wroclaw')
+        mock_read.assert_not_called()
+
+    def test_get_by_name_file_changed_reload_config(self):
+        registry = city_registry.CityRegistry('\\project', check_interval=0)
+        with open(self.config_path, 'w') as f:
+            f.write('[{"city_id": 2, "city_name": "Poznan", "url": "test_url", "direct_link": true}]')
+        os.utime(self.config_path, (0, 0))
+        self.assertIsNone(registry.get_by_name('Wroclaw'))
+        self.assertEqual(registry.get_by_name('Poznan')['city_id'], 2)
@@ -0,0 +1,37 @@
+import gzip
+import unittest
+from werkzeug.datastructures import Accept
+import compression
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.body = b'[' + b','.join(b'{"trip_id":"%d","stop_sequence":%d}' % (i, i) for i in range(500)) + b']'
+
+    def test_choose_encoding_return_accepted_encoding(self):
+        self.assertEqual(compression.choose_encoding(Accept([('gzip', 1), ('deflate', 1)])), compression.GZIP)
+
+    def test_choose_encoding_nothing_accepted_return_None(self):
+        self.assertIsNone(compression.choose_encoding(Accept([('deflate', 1)])))
+        self.assertIsNone(compression.choose_encoding(Accept([('gzip', 0)])))
+
+    def test_compress_gzip_return_decompressable_body(self):
+        result = compression.compress(self.body, compression.GZIP)
+        self.assertLess(len(result), len(self.body))
+        self.assertEqual(gzip.decompress(result), self.body)
+
+    def test_compress_stream_gzip_return_decompressable_body(self):
+        chunks = [self.body[:1000], '', self.body[1000:].decode('utf-8')]
+        result = b''.join(compression.compress_stream(chunks, compression.GZIP))
+        self.assertEqual(gzip.decompress(result), self.body)
+
+    @unittest.skipUnless(compression.brotli is not None, 'brotli is not installed')
+    def test_compress_stream_brotli_return_decompressable_body(self):
+        result = b''.join(compression.compress_stream([self.body[:1000], self.body[1000:]], compression.BROTLI))
+        self.assertEqual(compression.brotli.decompress(result), self.body)
+
+    @unittest.skipUnless(compression.zstandard is not None, 'zstandard is not installed')
+    def test_compress_stream_zstd_return_decompressable_body(self):
+        result = b''.join(compression.compress_stream([self.body[:1000], self.body[1000:]], compression.ZSTD))
+        decompressor = compression.zstandard.ZstdDecompressor().decompressobj()
+        self.assertEqual(decompressor.decompress(result), self.body)
@@ -0,0 +1,41 @@
+import unittest
+from unittest import mock
+import connection_pool
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch('connection_pool.pool.ThreadedConnectionPool')
+        self.mock_pool_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_pool = self.mock_pool_class.return_value
+        self.mock_pool._pool = []
+        self.mock_pool._used = {}
+        self.mock_connection = mock.MagicMock(closed=0)
+        self.mock_pool.getconn.return_value = self.mock_connection
+
+    def test_connection_returns_connection_to_pool(self):
+        db_pool = connection_pool.ConnectionPool('dsn', 1, 2)
+        with db_pool.connection() as connection:
+            self.assertIs(connection, self.mock_connection)
+            self.assertEqual(db_pool.stats()['in_use'], 1)
+        self.mock_pool.putconn.assert_called_once_with(self.mock_connection)
+        self.assertEqual(db_pool.stats()['in_use'], 0)
+        self.assertEqual(db_pool.stats()['checkouts'], 1)
+
+    def test_connection_closed_connection_discarded(self):
+        closed_connection = mock.MagicMock(closed=1)
+        self.mock_pool.getconn.side_effect = [closed_connection, self.mock_connection]
+        db_pool = connection_pool.ConnectionPool('dsn', 1, 2)
+        with db_pool.connection() as connection:
+            self.assertIs(connection, self.mock_connection)
+        self.mock_pool.putconn.assert_any_call(closed_connection, close=True)
+        self.assertEqual(db_pool.stats()['discarded'], 1)
+
+    def test_connection_no_free_slot_raise_PoolTimeoutError(self):
+        db_pool = connection_pool.ConnectionPool('dsn', 1, 1, timeout=0.01)
+        with db_pool.connection():
+            with self.assertRaises(connection_pool.PoolTimeoutError):
+                with db_pool.connection():
+                    pass
+        self.assertEqual(db_pool.stats()['timeouts'], 1)
@@ -1,3 +1,5 @@
+import os
+import threading
 import unittest
 import database_updater
 import queries
@@ -55,6 +57,24 @@ class TestUpdater(pyfakefs.fake_filesystem_unittest.TestCase):
             contents = f.read()
         self.assertEqual("\n\n", contents)
 
+    def test_read_csv_rows_return_important_columns_only(self):
+        file_path = os.path.join(os.sep, 'project', 'csv_files', 'Test-stop_times.csv')
+        self.fs.create_file(file_path, contents="trip_id,stop_id,stop_headsign,city_id\nA,1,x,3\nB,2,y,3")
+        with open(file_path, encoding='utf-8-sig', newline='') as read_obj:
+            columns, rows = database_updater.read_csv_rows(read_obj, ['trip_id', 'stop_id', 'city_id'])
+            self.assertListEqual(columns, ['trip_id', 'stop_id', 'city_id'])
+            self.assertListEqual(list(rows), [['A', '1', '3'], ['B', '2', '3']])
+
+    def test_load_csv_through_staging_important_columns_skip_other_columns(self):
+        file_path = os.path.join(os.sep, 'project', 'chunks', 'Test-routes.csv')
+        self.fs.create_file(file_path, contents="route_id,route_type,route_desc\n1,3,Centrum\n")
+        with mock.patch('database_updater.load_city_table_through_staging', return_value=True) as mock_load:
+            result = database_updater.load_csv_through_staging(file_path, 'routes', 1, ['route_id', 'route_desc'])
+        self.assertTrue(result)
+        table_name, city_id, columns, rows = mock_load.call_args.args
+        self.assertListEqual(columns, ['route_id', 'route_desc'])
+        self.assertListEqual(list(rows), [['1', 'Centrum']])
+
     def test_delete_unnecessary_columns_no_file_raise_error(self):
         file_path = '\\project\\csv_files\\Test-example.csv'
         with self.assertRaises(OSError) as cm:
@@ -63,13 +83,6 @@ class TestUpdater(pyfakefs.fake_filesystem_unittest.TestCase):
 
 
 class TestSQLDatabase(unittest.TestCase):
-    def test_create_temp_table(self):
-        test_df = pd.DataFrame({'TEST' : ['value 1', 'value 2', 'value 3']})
-        with mock.patch('database_updater.pd.DataFrame.to_sql') as mock_sql:
-            result = database_updater.create_temp_table(test_df, 'Test_table')
-        mock_sql.assert_called_once_with(name='temp_Test_table', con=mock.ANY, if_exists='replace', index=False)
-        self.assertTrue(result)
-
     def test_get_table_dict_correct_name_return_dict(self):
         correct_name = 'routes'
         result = database_updater.get_table_dict(correct_name)
@@ -85,17 +98,275 @@ class TestSQLDatabase(unittest.TestCase):
 
     # I only test if function correctly calls query, I don't test if query is correct and all data is correct
 
+    def test_csv_row_stream_read_return_csv_text(self):
+        stream = database_updater.CsvRowStream([['value1', 'value 2'], ['value,3', '']])
+        result = ''
+        chunk = stream.read(5)
+        while chunk:
+            result += chunk
+            chunk = stream.read(5)
+        self.assertEqual(result, 'value1,value 2\r\n"value,3",\r\n')
+        self.assertEqual(stream.row_count, 2)
+
+    def test_copy_rows_to_table_return_row_count(self):
+        mock_cursor = mock.MagicMock()
+        result = database_updater.copy_rows_to_table(mock_cursor, 'routes', ['route_id', 'city_id'],
+                                                     [['A', '1'], ['B', '1']])
+        expected_query = sql.SQL(queries.COPY_FROM_STDIN).format(
+            table_name=sql.Identifier('routes'),
+            columns=sql.SQL(', ').join([sql.Identifier('route_id'), sql.Identifier('city_id')]))
+        mock_cursor.copy_expert.assert_called_once_with(expected_query, mock.ANY)
+        self.assertEqual(result, 0)
+
     @mock.patch('database_updater.psycopg2.connect')
-    def test_delete_old_records_from_table_return_True(self, mock_connect):
-        result = database_updater.delete_old_records_from_table('routes', 1)
+    def test_replace_city_records_from_rows_return_True(self, mock_connect):
+        result = database_updater.replace_city_records_from_rows('routes', 1, ['route_id'], [['A']])
         expected_call = mock.call(sql.SQL(queries.DELETE_OLD_RECORDS).format(table_name=sql.Identifier('routes')), (1,))
         mock_connect().__enter__().cursor().__enter__().execute.assert_has_calls([expected_call])
+        mock_connect().__enter__().cursor().__enter__().copy_expert.assert_called_once()
         self.assertTrue(result)
 
+    def test_get_city_partition_name_return_name(self):
+        self.assertEqual(database_updater.get_city_partition_name('stop_times', 1), 'stop_times_city_1')
+
+    def make_connections(self, events: list, partitioned: bool = True):
+        """ Returns connect side effect creating separate mock connections which log statements to events """
+        def connect(*args):
+            connection = mock.MagicMock()
+            name = f'connection_{len(connections)}'
+            cursor = connection.cursor.return_value
+            cursor.__enter__.return_value = cursor
+            cursor.fetchone.return_value = (partitioned,)
+            cursor.execute.side_effect = lambda query, *params: events.append((name, query))
+            cursor.copy_expert.side_effect = lambda query, stream: events.append((name, 'COPY')) or stream.read()
+            connection.commit.side_effect = lambda: events.append((name, 'COMMIT'))
+            connections.append(connection)
+            return connection
+        connections = []
+        return connect, connections
+
+    def get_identifiers(self, table_name: str, city_id: int = 1) -> dict:
+        staging = f'{table_name}_city_{city_id}_staging'
+        return {'table_name': sql.Identifier(table_name), 'partition': sql.Identifier(f'{table_name}_city_{city_id}'),
+                'staging': sql.Identifier(staging), 'constraint': sql.Identifier(staging + '_city_check'),
+                'city_id': sql.Literal(city_id)}
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_city_tables_swap_stage_without_parent_lock_and_swap_in_one_transaction(self, mock_connect):
+        events = []
+        mock_connect.side_effect, connections = self.make_connections(events)
+        with database_updater.CityTablesSwap(1) as swap:
+            self.assertTrue(swap.load('trips', ['trip_id'], [['T']]))
+            self.assertTrue(swap.load('stop_times', ['trip_id'], [['T'], ['U']]))
+            self.assertEqual(swap.row_counts, {'trips': 1, 'stop_times': 2})
+            self.assertTrue(swap.commit())
+        main, staging = connections
+        staging_events = [query for name, query in events if name == 'connection_1']
+        create_trips = sql.SQL(queries.CREATE_STAGING_PARTITION).format(**self.get_identifiers('trips'))
+        # staging table is created in committed transaction before rows are copied
+        self.assertEqual(staging_events[staging_events.index(create_trips) + 1:][:2], ['COMMIT', 'COPY'])
+        main_events = [query for name, query in events if name == 'connection_0']
+        swap_start = main_events.index(queries.SAVEPOINT_SWAP)
+        self.assertTrue(all(isinstance(query, sql.SQL) and query == sql.SQL(queries.CHECK_TABLE_IS_PARTITIONED)
+                            for query in main_events[:swap_start]))
+        self.assertEqual(main_events[swap_start + 2], sql.SQL(queries.ADVISORY_XACT_LOCK))
+        self.assertEqual(main_events[swap_start + 3], sql.SQL(queries.LOCK_TABLES).format(
+            table_names=sql.SQL(', ').join([sql.Identifier('stop_times'), sql.Identifier('trips')])))
+        for table_name in ('trips', 'stop_times'):
+            self.assertIn(sql.SQL(queries.ATTACH_PARTITION).format(**self.get_identifiers(table_name)), main_events)
+        self.assertEqual(main_events[-1], 'COMMIT')
+        self.assertEqual(main_events.count('COMMIT'), 1)
+        main.close.assert_called_once()
+        staging.close.assert_called_once()
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_city_tables_swap_not_partitioned_delete_old_records_in_one_transaction(self, mock_connect):
+        events = []
+        mock_connect.side_effect, connections = self.make_connections(events, partitioned=False)
+        with database_updater.CityTablesSwap(1) as swap:
+            self.assertTrue(swap.load('routes', ['route_id'], [['A']]))
+            self.assertTrue(swap.load('trips', ['trip_id'], [['T']]))
+            self.assertTrue(swap.commit())
+        self.assertEqual(len(connections), 1)
+        self.assertIn(('connection_0', sql.SQL(queries.DELETE_OLD_RECORDS).format(
+            table_name=sql.Identifier('routes'))), events)
+        self.assertEqual([query for name, query in events if query == 'COMMIT'], ['COMMIT'])
+        self.assertEqual(events[-1], ('connection_0', 'COMMIT'))
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_city_tables_swap_failed_table_commit_nothing_and_drop_staging(self, mock_connect):
+        events = []
+        mock_connect.side_effect, connections = self.make_connections(events)
+        with database_updater.CityTablesSwap(1) as swap:
+            self.assertTrue(swap.load('trips', ['trip_id'], [['T']]))
+            connections[1].cursor().copy_expert.side_effect = Exception('copy failed')
+            self.assertFalse(swap.load('stop_times', ['trip_id'], [['T']]))
+            self.assertFalse(swap.load('routes', ['route_id'], [['R']]))
+            self.assertFalse(swap.commit())
+        self.assertNotIn(('connection_0', 'COMMIT'), events)
+        for table_name in ('trips', 'stop_times'):
+            self.assertIn(('connection_1', sql.SQL(queries.DROP_TABLE_IF_EXISTS).format(
+                table_name=self.get_identifiers(table_name)['staging'])), events[-3:])
+
+    @mock.patch('database_updater.time.sleep')
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_city_tables_swap_lock_timeout_retry_from_savepoint(self, mock_connect, mock_sleep):
+        events = []
+        mock_connect.side_effect, connections = self.make_connections(events)
+        lock_query = sql.SQL(queries.LOCK_TABLES).format(table_names=sql.SQL(', ').join([sql.Identifier('trips')]))
+        timeouts = [database_updater.psycopg2.errors.LockNotAvailable('lock timeout')]
+
+        def execute(query, *params):
+            events.append(('connection_0', query))
+            if query == lock_query and timeouts:
+                raise timeouts.pop()
+
+        with database_updater.CityTablesSwap(1, retries=1) as swap:
+            connections[0].cursor().execute.side_effect = execute
+            self.assertTrue(swap.load('trips', ['trip_id'], [['T']]))
+            self.assertTrue(swap.commit())
+        main_events = [query for name, query in events if name == 'connection_0']
+        self.assertEqual(main_events.count(queries.ROLLBACK_TO_SAVEPOINT_SWAP), 1)
+        self.assertEqual(main_events.count(lock_query), 2)
+        self.assertEqual(main_events[-1], 'COMMIT')
+        mock_sleep.assert_called_once()
+
     @mock.patch('database_updater.psycopg2.connect')
-    def test_insert_new_records_to_table_return_True(self, mock_connect):
-        result = database_updater.insert_new_records_to_table('routes', 1)
-        expected_call = mock.call(sql.SQL(queries.INSERT_NEW_RECORDS_ROUTES), (1, ))
+    def test_city_tables_swap_concurrent_cities_swap_one_after_another(self, mock_connect):
+        events = []
+        connect, connections = self.make_connections(events)
+        connect_lock = threading.Lock()
+        advisory_lock = threading.Lock()
+        both_loaded = threading.Barrier(2)
+
+        def locked_connect(*args):
+            with connect_lock:
+                connection = connect(*args)
+                name = f'connection_{len(connections) - 1}'
+                cursor = connection.cursor()
+
+                def execute(query, *params):
+                    if query == sql.SQL(queries.ADVISORY_XACT_LOCK):
+                        advisory_lock.acquire()
+                    events.append((name, query))
+
+                def commit():
+                    events.append((name, 'COMMIT'))
+                    if advisory_lock.locked() and (name, sql.SQL(queries.ADVISORY_XACT_LOCK)) in events:
+                        advisory_lock.release()
+
+                cursor.execute.side_effect = execute
+                connection.commit.side_effect = commit
+            return connection
+
+        mock_connect.side_effect = locked_connect
+        results = {}
+
+        def load_city(city_id: int):
+            with database_updater.CityTablesSwap(city_id) as swap:
+                swap.load('trips', ['trip_id'], [['T']])
+                swap.load('stop_times', ['trip_id'], [['T']])
+                both_loaded.wait(timeout=5)
+                results[city_id] = swap.commit()
+
+        threads = [threading.Thread(target=load_city, args=(city_id,)) for city_id in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+        self.assertEqual(results, {1: True, 2: True})
+        swap_connections = [name for name, query in events if query == sql.SQL(queries.ADVISORY_XACT_LOCK)]
+        self.assertEqual(len(swap_connections), 2)
+        # every swap runs from advisory lock to commit without statements of the other city in between
+        for name in swap_connections:
+            start = events.index((name, sql.SQL(queries.ADVISORY_XACT_LOCK)))
+            end = events.index((name, 'COMMIT'), start)
+            self.assertTrue(all(event_name == name for event_name, query in events[start:end]
+                                if event_name in swap_connections))
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_partition_tables_by_city_move_records_to_city_partitions(self, mock_connect):
+        mock_cursor = mock_connect().__enter__().cursor().__enter__()
+        mock_cursor.fetchone.side_effect = [(True,), (False,)]
+        mock_cursor.fetchall.return_value = [(1,), (2,)]
+        result = database_updater.partition_tables_by_city(['stops'])
+        identifiers = {'table_name': sql.Identifier('stops'), 'source': sql.Identifier('stops_unpartitioned')}
+        expected_calls = [
+            mock.call(sql.SQL(queries.CREATE_PARTITIONED_TABLE).format(**identifiers)),
+            mock.call(sql.SQL(queries.CREATE_CITY_PARTITION).format(table_name=sql.Identifier('stops'),
+                                                                    city_id=sql.Literal(2),
+                                                                    partition=sql.Identifier('stops_city_2'))),
+            mock.call(sql.SQL(queries.COPY_ALL_RECORDS).format(**identifiers)),
+            mock.call(sql.SQL(queries.DROP_TABLE_IF_EXISTS).format(table_name=sql.Identifier('stops_unpartitioned')))]
+        mock_cursor.execute.assert_has_calls(expected_calls, any_order=True)
+        self.assertTrue(result)
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_partition_tables_by_city_already_partitioned_skipped(self, mock_connect):
+        mock_cursor = mock_connect().__enter__().cursor().__enter__()
+        mock_cursor.fetchone.side_effect = [(True,), (True,)]
+        self.assertTrue(database_updater.partition_tables_by_city(['stops']))
+        self.assertEqual(mock_cursor.execute.call_count, 2)
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_bump_feed_version_return_True(self, mock_connect):
+        result = database_updater.bump_feed_version(1)
+        expected_call = mock.call(sql.SQL(queries.BUMP_FEED_VERSION), (1,))
+        mock_connect().__enter__().cursor().__enter__().execute.assert_has_calls([expected_call])
+        self.assertTrue(result)
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_sync_cities_table_return_True(self, mock_connect):
+        result = database_updater.sync_cities_table([{'city_id': 1, 'city_name': 'Wroclaw'}])
+        expected_call = mock.call(sql.SQL(queries.UPSERT_CITY), (1, 'Wroclaw'))
         mock_connect().__enter__().cursor().__enter__().execute.assert_has_calls([expected_call])
         self.assertTrue(result)
 
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_apply_city_delta_from_rows_return_counts(self, mock_connect):
+        mock_cursor = mock_connect().__enter__().cursor().__enter__()
+        mock_cursor.rowcount = 2
+        result = database_updater.apply_city_delta_from_rows('routes', 1, ['route_id', 'route_desc', 'city_id'],
+                                                             [['A', 'desc', '1']])
+        mock_cursor.copy_expert.assert_called_once()
+        self.assertDictEqual(result, {'inserted': 2, 'updated': 2, 'deleted': 2})
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_apply_city_delta_from_rows_error_return_None(self, mock_connect):
+        mock_connect().__enter__().cursor().__enter__().execute.side_effect = Exception('error')
+        result = database_updater.apply_city_delta_from_rows('routes', 1, ['route_id'], [['A']])
+        self.assertIsNone(result)
+
+    def test_get_staging_table_query_return_typed_temp_table(self):
+        result = database_updater.get_staging_table_query('routes')
+        column_definitions = sql.SQL(', ').join(
+            sql.SQL('{} {}').format(sql.Identifier(column), sql.SQL(queries.COLUMN_TYPES[column]))
+            for column in ['route_id', 'route_short_name', 'route_desc', 'city_id', 'date'])
+        expected = sql.SQL(queries.CREATE_STAGING_TABLE).format(staging=sql.Identifier('temp_routes'),
+                                                                column_definitions=column_definitions)
+        self.assertEqual(result, expected)
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_load_city_table_through_staging_return_True(self, mock_connect):
+        result = database_updater.load_city_table_through_staging('routes', 1, ['route_id'], [['A']])
+        mock_cursor = mock_connect().__enter__().cursor().__enter__()
+        mock_cursor.execute.assert_has_calls([mock.call(database_updater.get_staging_table_query('routes')),
+                                              mock.call(sql.SQL(queries.INSERT_NEW_RECORDS_ROUTES), (1,))],
+                                             any_order=True)
+        mock_cursor.copy_expert.assert_called_once()
+        self.assertTrue(result)
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_refresh_service_dates_return_True(self, mock_connect):
+        result = database_updater.refresh_service_dates(1)
+        expected_calls = [mock.call(sql.SQL(queries.DELETE_OLD_SERVICE_DATES), (1,)),
+                          mock.call(sql.SQL(queries.INSERT_SERVICE_DATES), {'city_id': 1})]
+        mock_connect().__enter__().cursor().__enter__().execute.assert_has_calls(expected_calls)
+        self.assertTrue(result)
+
+    @mock.patch('database_updater.psycopg2.connect')
+    def test_create_tables_return_True(self, mock_connect):
+        result = database_updater.create_tables()
+        expected_calls = [mock.call(sql.SQL(table_query)) for table_query in queries.CREATE_TABLES]
+        mock_connect().__enter__().cursor().__enter__().execute.assert_has_calls(expected_calls)
+        self.assertTrue(result)
@@ -3,6 +3,7 @@ import dataset_scrapper
 from unittest import mock
 import unittest
 import os
+import zipfile
 from pyfakefs.fake_filesystem_unittest import TestCase
 from bs4 import BeautifulSoup
 
@@ -356,6 +357,91 @@ class TestDatasetScrapperFiles(TestCase):
         result = dataset_scrapper.save_txt_to_csv_with_city_id_and_date('\\project', test_dict, 'example')
         self.assertFalse(result)
 
+    def test_iter_table_rows_from_zip_return_projected_rows_with_city_id_and_date(self):
+        self.fs.create_dir('\\project\\zip_files')
+        with zipfile.ZipFile('\\project\\zip_files\\test.zip', 'w') as zip_ref:
+            zip_ref.writestr('example.txt', '\ufefftest1,test2,test3\nvalue1,value2,value3\n')
+        result = list(dataset_scrapper.iter_table_rows_from_zip('\\project\\zip_files\\test.zip', 'example',
+                                                                ['test3', 'test1', 'missing', 'city_id', 'date'],
+                                                                50, 'test_date'))
+        self.assertListEqual(result, [['value3', 'value1', '', '50', 'test_date']])
+
+    def test_iter_table_rows_from_zip_calendar_dates_rename_date_column(self):
+        self.fs.create_dir('\\project\\zip_files')
+        with zipfile.ZipFile('\\project\\zip_files\\test.zip', 'w') as zip_ref:
+            zip_ref.writestr('calendar_dates.txt', 'service_id,date,exception_type\n33,20230101,1\n')
+        result = list(dataset_scrapper.iter_table_rows_from_zip(
+            '\\project\\zip_files\\test.zip', 'calendar_dates',
+            ['service_id', 'exception_date', 'exception_type', 'city_id', 'date'], 1, 'test_date'))
+        self.assertListEqual(result, [['33', '20230101', '1', '1', 'test_date']])
+
+    def test_iter_table_rows_from_zip_optional_table_missing_return_no_rows(self):
+        self.fs.create_dir('\\project\\zip_files')
+        with zipfile.ZipFile('\\project\\zip_files\\test.zip', 'w') as zip_ref:
+            zip_ref.writestr('other.txt', 'test1\nvalue1\n')
+        result = list(dataset_scrapper.iter_table_rows_from_zip('\\project\\zip_files\\test.zip', 'example',
+                                                                ['test1'], 50, 'test_date', required=False))
+        self.assertListEqual(result, [])
+
+    def test_iter_table_rows_from_zip_no_table_raise_error(self):
+        self.fs.create_dir('\\project\\zip_files')
+        with zipfile.ZipFile('\\project\\zip_files\\test.zip', 'w') as zip_ref:
+            zip_ref.writestr('other.txt', 'test1\nvalue1\n')
+        with self.assertRaises(OSError):
+            list(dataset_scrapper.iter_table_rows_from_zip('\\project\\zip_files\\test.zip', 'example',
+                                                           ['test1'], 50, 'test_date'))
+
+    def test_download_zip_if_changed_new_feed_return_true_and_save_state(self):
+        self.fs.create_dir('\\project\\zip_files')
+        mock_response = mock.MagicMock(status_code=200, headers={'ETag': '"abc"'})
+        mock_response.iter_content.return_value = [b'zip content']
+        with mock.patch('dataset_scrapper.requests.get') as mock_get:
+            mock_get.return_value.__enter__.return_value = mock_response
+            result = dataset_scrapper.download_zip_if_changed('\\project', 'test_url', 'test')
+        mock_get.assert_called_once_with('test_url', headers={}, stream=True, timeout=mock.ANY)
+        self.assertTrue(result)
+        state = dataset_scrapper.read_feed_state('\\project', 'test')
+        self.assertEqual(state['etag'], '"abc"')
+        self.assertFalse(state['loaded'])
+
+    def test_download_zip_if_changed_loaded_feed_send_conditional_headers_return_false_on_304(self):
+        self.fs.create_dir('\\project\\zip_files')
+        dataset_scrapper.save_feed_state('\\project', 'test', {'etag': '"abc"', 'last_modified': None,
+                                                               'sha256': 'hash', 'loaded': True})
+        with mock.patch('dataset_scrapper.requests.get') as mock_get:
+            mock_get.return_value.__enter__.return_value = mock.MagicMock(status_code=304)
+            result = dataset_scrapper.download_zip_if_changed('\\project', 'test_url', 'test')
+        mock_get.assert_called_once_with('test_url', headers={'If-None-Match': '"abc"'}, stream=True,
+                                         timeout=mock.ANY)
+        self.assertFalse(result)
+
+    def test_download_zip_if_changed_same_content_return_false(self):
+        self.fs.create_dir('\\project\\zip_files')
+        dataset_scrapper.save_feed_state('\\project', 'test', {'etag': None, 'last_modified': None,
+                                                               'sha256': 'hash', 'loaded': True})
+        mock_response = mock.MagicMock(status_code=200, headers={})
+        mock_response.iter_content.return_value = [b'zip content']
+        with mock.patch('dataset_scrapper.hashlib.sha256') as mock_sha:
+            mock_sha.return_value.hexdigest.return_value = 'hash'
+            with mock.patch('dataset_scrapper.requests.get') as mock_get:
+                mock_get.return_value.__enter__.return_value = mock_response
+                result = dataset_scrapper.download_zip_if_changed('\\project', 'test_url', 'test')
+        self.assertFalse(result)
+
+    def test_download_zip_if_changed_empty_link_return_None(self):
+        with mock.patch('dataset_scrapper.requests.get') as mock_get:
+            result = dataset_scrapper.download_zip_if_changed('\\project', '', 'test')
+        mock_get.assert_not_called()
+        self.assertIsNone(result)
+
+    def test_mark_feed_loaded_state_exists_return_true(self):
+        self.fs.create_dir('\\project\\zip_files')
+        dataset_scrapper.save_feed_state('\\project', 'test', {'sha256': 'hash', 'loaded': False})
+        result = dataset_scrapper.mark_feed_loaded('\\project', 'test')
+        self.assertTrue(result)
+        self.assertTrue(dataset_scrapper.read_feed_state('\\project', 'test')['loaded'])
+
+
 
 def mock_json_load(*args):
     return [{
@@ -0,0 +1,83 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+import instrumentation
+
+
+class TestPipelineMetrics(unittest.TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.metrics = instrumentation.PipelineMetrics(stream=self.stream)
+
+    def test_stage_log_json_line_with_counters(self):
+        with self.metrics.stage('load_table', 'Wroclaw', 'stops') as record:
+            list(instrumentation.count_rows(iter([1, 2, 3]), record))
+            record.add('rows_written', 3)
+        line = json.loads(self.stream.getvalue())
+        self.assertEqual(line['event'], 'pipeline_stage')
+        self.assertEqual((line['stage'], line['city'], line['table']), ('load_table', 'Wroclaw', 'stops'))
+        self.assertEqual((line['rows_read'], line['rows_written']), (3, 3))
+        self.assertEqual(line['status'], 'ok')
+        self.assertGreaterEqual(line['duration_seconds'], 0)
+
+    def test_stage_record_rss_delta_of_the_stage(self):
+        with mock.patch('instrumentation.get_current_rss', side_effect=[1000, 4000]):
+            with self.metrics.stage('load_table', 'Wroclaw', 'stops'):
+                pass
+        line = json.loads(self.stream.getvalue())
+        self.assertEqual(line['rss_delta_bytes'], 3000)
+        self.assertIn('gtfs_pipeline_stage_rss_delta_bytes{stage="load_table",city="Wroclaw",table="stops"} 3000',
+                      self.metrics.to_prometheus())
+
+    def test_stage_exception_mark_failed_and_reraise(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.stage('download', 'Wroclaw'):
+                raise ValueError
+        self.assertEqual(self.metrics.records[0].status, 'failed')
+
+    def test_json_logs_disabled_record_without_log(self):
+        metrics = instrumentation.PipelineMetrics(json_logs=False, stream=self.stream)
+        with metrics.stage('set_up'):
+            pass
+        self.assertEqual(self.stream.getvalue(), '')
+        self.assertEqual(len(metrics.records), 1)
+
+    def test_to_prometheus_keep_last_record_of_stage(self):
+        for rows in (5, 7):
+            with self.metrics.stage('load_table', 'Wroclaw', 'stops') as record:
+                record.add('rows_read', rows)
+        text = self.metrics.to_prometheus()
+        self.assertIn('# TYPE gtfs_pipeline_stage_rows_read gauge', text)
+        self.assertIn('gtfs_pipeline_stage_rows_read{stage="load_table",city="Wroclaw",table="stops"} 7\n', text)
+        self.assertNotIn('} 5\n', text)
+        self.assertIn('gtfs_pipeline_stage_success{stage="load_table",city="Wroclaw",table="stops"} 1', text)
+
+    def test_to_prometheus_escape_label_values(self):
+        with self.metrics.stage('download', 'Quote"City'):
+            pass
+        self.assertIn('city="Quote\\"City"', self.metrics.to_prometheus())
+
+    def test_write_textfile_write_metrics(self):
+        with self.metrics.stage('set_up'):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'pipeline.prom')
+            self.assertTrue(self.metrics.write_textfile(path))
+            with open(path, encoding='utf-8') as read_obj:
+                self.assertEqual(read_obj.read(), self.metrics.to_prometheus())
+            self.assertEqual(os.listdir(directory), ['pipeline.prom'])
+
+    def test_get_records_since_return_new_records(self):
+        with self.metrics.stage('set_up'):
+            pass
+        position = len(self.metrics.records)
+        with self.metrics.stage('get_data'):
+            pass
+        self.assertEqual([record.stage for record in self.metrics.get_records_since(position)], ['get_data'])
+
+
+if __name__ == '__main__':
+    unittest.main()
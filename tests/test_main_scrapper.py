@@ -0,0 +1,71 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import main_scrapper
+
+
+class TestRunParallelPipeline(unittest.TestCase):
+    def setUp(self):
+        self.cities = [{'city_id': 1, 'city_name': 'Wroclaw'}, {'city_id': 2, 'city_name': 'Poznan'},
+                       {'city_id': 3, 'city_name': 'Gdansk'}]
+        self.stages = mock.Mock()
+        for name in ('create_tables', 'partition_tables_by_city', 'create_indexes', 'sync_cities_table',
+                     'refresh_city_feed', 'mark_feed_loaded'):
+            patcher = mock.patch(f'main_scrapper.{name}', getattr(self.stages, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.stages.refresh_city_feed.return_value = True
+        # worker processes are replaced by threads, so mocked loads can be inspected
+        for patcher in (mock.patch('main_scrapper.read_json', return_value=self.cities),
+                        mock.patch('main_scrapper.ProcessPoolExecutor', ThreadPoolExecutor),
+                        mock.patch('main_scrapper.SWAP_CITY_PARTITIONS', True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def load_city(self, project_path, city):
+        self.stages.load_city_with_metrics(project_path, city)
+        if city['city_name'] == 'Poznan':
+            raise RuntimeError('worker died')
+        return True, []
+
+    def test_failed_download_and_load_of_one_city_dont_stop_others(self):
+        def download(project_path, city):
+            if city['city_name'] == 'Gdansk':
+                raise OSError('connection reset')
+            return True
+
+        self.stages.refresh_city_feed.side_effect = download
+        with mock.patch('main_scrapper.load_city_with_metrics', side_effect=self.load_city):
+            result = main_scrapper.run_parallel_pipeline('/project', download_workers=3, load_workers=2)
+        self.assertEqual(result, {'Wroclaw': True, 'Poznan': False, 'Gdansk': False})
+        self.stages.load_city_with_metrics.assert_has_calls(
+            [mock.call('/project', self.cities[0]), mock.call('/project', self.cities[1])], any_order=True)
+        self.stages.mark_feed_loaded.assert_called_once_with('/project', 'Wroclaw')
+
+    def test_unchanged_feed_skipped_and_not_loaded(self):
+        self.stages.refresh_city_feed.side_effect = lambda project_path, city: city['city_name'] != 'Wroclaw'
+        with mock.patch('main_scrapper.load_city_with_metrics', side_effect=self.load_city):
+            result = main_scrapper.run_parallel_pipeline('/project')
+        self.assertTrue(result['Wroclaw'])
+        self.assertNotIn(mock.call('/project', self.cities[0]), self.stages.load_city_with_metrics.call_args_list)
+
+    def test_tables_prepared_before_download_and_load_before_marking_feed(self):
+        with mock.patch('main_scrapper.load_city_with_metrics', side_effect=self.load_city):
+            main_scrapper.run_parallel_pipeline('/project')
+        names = [name for name, args, kwargs in self.stages.mock_calls]
+        self.assertEqual(names[:4], ['create_tables', 'partition_tables_by_city', 'create_indexes',
+                                     'sync_cities_table'])
+        for city in ('Wroclaw', 'Gdansk'):
+            calls = [name for name, args, kwargs in self.stages.mock_calls[4:] if city in str(args)]
+            self.assertEqual(calls,
+                             ['refresh_city_feed', 'load_city_with_metrics', 'mark_feed_loaded'])
+
+    def test_results_of_worker_merged_into_metrics(self):
+        with mock.patch('main_scrapper.load_city_with_metrics', return_value=(True, ['record'])), \
+                mock.patch.object(main_scrapper.metrics, 'add_records') as mock_add_records:
+            main_scrapper.run_parallel_pipeline('/project')
+        self.assertEqual(mock_add_records.call_args_list, [mock.call(['record'])] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from psycopg2 import sql
+import pagination
+import queries
+
+
+class TestPagination(unittest.TestCase):
+    def test_encode_decode_cursor_return_key_values(self):
+        cursor = pagination.encode_cursor(['2_4575487^+', 5])
+        result = pagination.decode_cursor(cursor, ['trip_id', 'stop_sequence'])
+        self.assertListEqual(result, ['2_4575487^+', 5])
+
+    def test_decode_cursor_incorrect_cursor_raise_ValueError(self):
+        with self.assertRaises(ValueError):
+            pagination.decode_cursor('not a cursor', ['trip_id'])
+
+    def test_decode_cursor_wrong_number_of_keys_raise_ValueError(self):
+        cursor = pagination.encode_cursor(['A'])
+        with self.assertRaises(ValueError):
+            pagination.decode_cursor(cursor, ['trip_id', 'stop_sequence'])
+
+    def test_decode_cursor_values_of_wrong_type_raise_ValueError(self):
+        for key_values in ([{'trip_id': 'A'}, 1], [['A'], 1], ['A', '1'], ['A', True], [None, 1], ['A', 1.5]):
+            with self.subTest(key_values=key_values):
+                with self.assertRaises(ValueError):
+                    pagination.decode_cursor(pagination.encode_cursor(key_values), ['trip_id', 'stop_sequence'])
+        with self.assertRaises(ValueError):
+            pagination.decode_cursor(pagination.encode_cursor({'trip_id': 'A'}), ['trip_id'])
+
+    def test_parse_limit_return_limit_capped(self):
+        self.assertEqual(pagination.parse_limit('10'), 10)
+        self.assertEqual(pagination.parse_limit(None), pagination.DEFAULT_PAGE_LIMIT)
+        self.assertEqual(pagination.parse_limit('1000000'), pagination.MAX_PAGE_LIMIT)
+        with self.assertRaises(ValueError):
+            pagination.parse_limit('0')
+
+    def test_build_page_query_after_values_return_key_condition(self):
+        result = pagination.build_page_query('stop_times', None, ['trip_id', 'stop_sequence'], ['A', 1])
+        keys = sql.SQL(', ').join([sql.Identifier('trip_id'), sql.Identifier('stop_sequence')])
+        expected = sql.SQL(queries.GET_TABLE_PAGE).format(
+            columns=sql.SQL('*'), table_name=sql.Identifier('stop_times'),
+            after_condition=sql.SQL(queries.AFTER_KEY_CONDITION).format(
+                key_columns=keys, key_values=sql.SQL(', ').join([sql.Placeholder(), sql.Placeholder()])),
+            key_columns=keys)
+        self.assertEqual(result, expected)
+
+    def test_get_next_cursor_full_page_return_cursor_of_last_row(self):
+        rows = [('A', 1, 'x'), ('A', 2, 'y')]
+        result = pagination.get_next_cursor(rows, ['trip_id', 'stop_sequence', 'other'],
+                                            ['trip_id', 'stop_sequence'], 2)
+        self.assertEqual(pagination.decode_cursor(result, ['trip_id', 'stop_sequence']), ['A', 2])
+
+    def test_get_next_cursor_last_page_return_None(self):
+        result = pagination.get_next_cursor([('A',)], ['trip_id'], ['trip_id'], 2)
+        self.assertIsNone(result)
+
+    def test_build_page_query_conditions_put_before_key_condition(self):
+        conditions = sql.SQL(queries.FILTER_CONDITION).format(column=sql.Identifier('stop_id'), operator=sql.SQL('='))
+        result = pagination.build_page_query('stop_times', None, ['trip_id', 'stop_sequence'], None, conditions)
+        keys = sql.SQL(', ').join([sql.Identifier('trip_id'), sql.Identifier('stop_sequence')])
+        expected = sql.SQL(queries.GET_TABLE_PAGE).format(
+            columns=sql.SQL('*'), table_name=sql.Identifier('stop_times'),
+            after_condition=sql.Composed([conditions, sql.SQL('')]), key_columns=keys)
+        self.assertEqual(result, expected)
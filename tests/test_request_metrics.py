@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+import request_metrics
+
+
+class TestRequestMetrics(unittest.TestCase):
+    def tearDown(self):
+        request_metrics._current.set(None)
+
+    def test_histogram_observe_count_value_in_its_bucket(self):
+        histogram = request_metrics.Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        lines = histogram.to_lines('rows', 'route="/mpk/"')
+        self.assertIn('rows_bucket{route="/mpk/",le="10"} 3', lines)
+        self.assertIn('rows_bucket{route="/mpk/",le="+Inf"} 4', lines)
+        self.assertIn('rows_count{route="/mpk/"} 4', lines)
+
+    def test_phase_add_time_to_current_request(self):
+        timer = request_metrics.start_request('/mpk/')
+        with mock.patch('request_metrics.time.perf_counter', side_effect=[1.0, 1.25]):
+            with request_metrics.phase('serialize'):
+                pass
+        self.assertEqual(timer.phases['serialize'], 0.25)
+
+    def test_phase_outside_request_do_nothing(self):
+        with request_metrics.phase('serialize'):
+            pass
+        self.assertIsNone(request_metrics.get_current())
+
+    def test_finish_request_record_histograms_and_clear_current(self):
+        metrics = request_metrics.RequestMetrics()
+        timer = request_metrics.start_request('/routes/<string:city_name>')
+        timer.rows = 20
+        self.assertEqual(list(request_metrics.count_bytes([b'[1,', b'2]'], timer)), [b'[1,', b'2]'])
+        with mock.patch('request_metrics.metrics', metrics):
+            request_metrics.finish_request(timer, 200)
+        self.assertIsNone(request_metrics.get_current())
+        text = metrics.to_prometheus()
+        self.assertIn('api_requests_total{route="/routes/<string:city_name>",status="200"} 1', text)
+        self.assertIn('api_response_rows_sum{route="/routes/<string:city_name>"} 20', text)
+        self.assertIn('api_response_bytes_sum{route="/routes/<string:city_name>"} 5', text)
+        self.assertIn('api_request_phase_seconds_count{route="/routes/<string:city_name>",phase="total"} 1', text)
+
+    def test_render_gauges_skip_not_numeric_values(self):
+        text = request_metrics.render_gauges('db_pool', {'in_use': 2, 'name': 'pool', 'closed': False})
+        self.assertEqual(text, '# TYPE api_db_pool_in_use gauge\napi_db_pool_in_use 2\n')
+
+    def test_get_cursor_factory_disabled_return_None(self):
+        with mock.patch('request_metrics.ENABLED', False):
+            self.assertIsNone(request_metrics.get_cursor_factory())
+        with mock.patch('request_metrics.ENABLED', True):
+            self.assertIs(request_metrics.get_cursor_factory(), request_metrics.TimedCursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
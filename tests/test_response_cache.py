@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+import response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_get_same_version_return_body(self):
+        cache = response_cache.ResponseCache(100)
+        cache.put(('routes', 1, ()), 1, b'body')
+        self.assertEqual(cache.get(('routes', 1, ()), 1), b'body')
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_get_newer_version_return_None_and_remove_entry(self):
+        cache = response_cache.ResponseCache(100)
+        cache.put(('routes', 1, ()), 1, b'body')
+        self.assertIsNone(cache.get(('routes', 1, ()), 2))
+        self.assertEqual(cache.size, 0)
+
+    def test_put_over_max_bytes_evict_least_recently_used(self):
+        cache = response_cache.ResponseCache(10)
+        cache.put('first', 1, b'12345')
+        cache.put('second', 1, b'12345')
+        cache.get('first', 1)
+        cache.put('third', 1, b'12345')
+        self.assertIsNone(cache.get('second', 1))
+        self.assertEqual(cache.get('first', 1), b'12345')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_put_body_bigger_than_cache_not_cached(self):
+        cache = response_cache.ResponseCache(3)
+        cache.put('key', 1, b'12345')
+        self.assertIsNone(cache.get('key', 1))
+
+
+class TestFeedVersions(unittest.TestCase):
+    def test_get_within_ttl_call_loader_once(self):
+        loader = mock.Mock(return_value=(1, None))
+        versions = response_cache.FeedVersions(loader, ttl=100)
+        versions.get(1)
+        result = versions.get(1)
+        loader.assert_called_once_with(1)
+        self.assertEqual(result, (1, None))
+
+    def test_get_after_ttl_call_loader_again(self):
+        loader = mock.Mock(side_effect=[(1, None), (2, None)])
+        versions = response_cache.FeedVersions(loader, ttl=0)
+        versions.get(1)
+        self.assertEqual(versions.get(1), (2, None))
+
+    def test_get_fresh_return_version_set_within_ttl(self):
+        versions = response_cache.FeedVersions(None, ttl=60)
+        self.assertEqual(versions.get_fresh(1), (False, None))
+        versions.set(1, (2, None))
+        self.assertEqual(versions.get_fresh(1), (True, (2, None)))
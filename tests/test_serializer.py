@@ -0,0 +1,48 @@
+import datetime
+import decimal
+import json
+import unittest
+from unittest import mock
+import serializer
+
+
+class TestSerializer(unittest.TestCase):
+    def setUp(self):
+        self.columns = ['stop_id', 'stop_lat', 'date']
+        self.rows = [('1', decimal.Decimal('52.5'), datetime.datetime(2023, 1, 10, 12, 30)),
+                     ('2', None, None)]
+
+    def test_encode_rows_records_shape(self):
+        result = json.loads(serializer.encode_rows(self.columns, self.rows))
+        self.assertListEqual(result, [{'stop_id': '1', 'stop_lat': 52.5, 'date': '2023-01-10T12:30:00'},
+                                      {'stop_id': '2', 'stop_lat': None, 'date': None}])
+
+    def test_encode_rows_columns_shape(self):
+        result = json.loads(serializer.encode_rows(self.columns, self.rows, serializer.COLUMNS_SHAPE))
+        self.assertDictEqual(result, {'columns': self.columns,
+                                      'rows': [['1', 52.5, '2023-01-10T12:30:00'], ['2', None, None]]})
+
+    def test_encode_rows_without_orjson_same_result(self):
+        expected = json.loads(serializer.encode_rows(self.columns, self.rows))
+        with mock.patch.object(serializer, 'orjson', None):
+            self.assertListEqual(json.loads(serializer.encode_rows(self.columns, self.rows)), expected)
+
+    def test_encode_rows_chunk_ndjson(self):
+        chunk = serializer.encode_rows_chunk(self.columns, self.rows, serializer.COLUMNS_SHAPE, b'\n')
+        self.assertListEqual([json.loads(line) for line in chunk.split(b'\n')],
+                             [['1', 52.5, '2023-01-10T12:30:00'], ['2', None, None]])
+
+    def test_rows_to_body_adds_extra_keys(self):
+        body = serializer.rows_to_body(self.columns, self.rows[1:], next='abc')
+        self.assertDictEqual(body, {'data': [{'stop_id': '2', 'stop_lat': None, 'date': None}], 'next': 'abc'})
+
+    def test_parse_shape(self):
+        self.assertEqual(serializer.parse_shape(None), serializer.RECORDS_SHAPE)
+        self.assertEqual(serializer.parse_shape('columns'), serializer.COLUMNS_SHAPE)
+        with self.assertRaises(ValueError):
+            serializer.parse_shape('table')
+
+    def test_dumps_unknown_type_raises_type_error(self):
+        with mock.patch.object(serializer, 'orjson', None):
+            with self.assertRaises(TypeError):
+                serializer.dumps({'value': object()})
@@ -0,0 +1,98 @@
+import unittest
+from unittest import mock
+import spatial_index
+
+
+class TestStopGridIndex(unittest.TestCase):
+    def setUp(self):
+        self.stops = [{'stop_id': '1', 'stop_lat': 52.3696700000, 'stop_lon': 16.9488400000},
+                      {'stop_id': '2', 'stop_lat': 52.3700000000, 'stop_lon': 16.9490000000},
+                      {'stop_id': '3', 'stop_lat': 52.3953542600, 'stop_lon': 16.8623584000},
+                      {'stop_id': '4', 'stop_lat': None, 'stop_lon': None}]
+
+    def test_haversine_distance_return_meters(self):
+        result = spatial_index.haversine_distance(52.0, 16.0, 52.0 + 1 / 111.195, 16.0)
+        self.assertAlmostEqual(result, 1000, delta=1)
+
+    def test_nearest_return_stops_within_radius_sorted_by_distance(self):
+        index = spatial_index.StopGridIndex(self.stops)
+        result = index.nearest(52.3700000000, 16.9490000000, radius=500, limit=10)
+        self.assertListEqual([stop['stop_id'] for distance, stop in result], ['2', '1'])
+        self.assertEqual(result[0][0], 0)
+
+    def test_nearest_return_at_most_limit_stops(self):
+        index = spatial_index.StopGridIndex(self.stops)
+        result = index.nearest(52.3700000000, 16.9490000000, radius=10000, limit=1)
+        self.assertEqual(len(result), 1)
+
+    def test_nearest_stops_in_neighbouring_cells_found(self):
+        index = spatial_index.StopGridIndex(self.stops, cell_size=0.0001)
+        result = index.nearest(52.3696700000, 16.9488400000, radius=100, limit=10)
+        self.assertListEqual([stop['stop_id'] for distance, stop in result], ['1', '2'])
+
+    def test_stops_without_coordinates_skipped(self):
+        index = spatial_index.StopGridIndex(self.stops)
+        self.assertEqual(len(index), 3)
+
+    def test_nearest_at_pole_visit_only_occupied_cells(self):
+        index = spatial_index.StopGridIndex(self.stops + [{'stop_id': '5', 'stop_lat': 89.99, 'stop_lon': -170.0}])
+        lookups = []
+
+        class CountingDict(dict):
+            def get(self, key, default=None):
+                lookups.append(key)
+                return super().get(key, default)
+
+        index._cells = CountingDict(index._cells)
+        result = index.nearest(90.0, 16.9, radius=5000, limit=10)
+        self.assertListEqual([stop['stop_id'] for distance, stop in result], ['5'])
+        self.assertLessEqual(len(lookups), len(index._cells))
+
+    def test_nearest_near_pole_find_stop_across_longitudes(self):
+        index = spatial_index.StopGridIndex([{'stop_id': '1', 'stop_lat': 89.9999, 'stop_lon': 170.0}])
+        result = index.nearest(89.9999, -10.0, radius=5000, limit=10)
+        self.assertListEqual([stop['stop_id'] for distance, stop in result], ['1'])
+
+    def test_parse_point_return_floats(self):
+        self.assertEqual(spatial_index.parse_point('52.37', '-16.9'), (52.37, -16.9))
+
+    def test_parse_point_non_finite_or_out_of_range_raise_ValueError(self):
+        for lat, lon in (('nan', '0'), ('0', 'inf'), ('-inf', '0'), ('90.1', '0'), ('0', '-180.5'), ('x', '0')):
+            with self.subTest(lat=lat, lon=lon):
+                with self.assertRaises(ValueError):
+                    spatial_index.parse_point(lat, lon)
+
+    def test_parse_search_return_defaults_and_cap_values(self):
+        self.assertEqual(spatial_index.parse_search(), (spatial_index.DEFAULT_RADIUS_M, spatial_index.DEFAULT_LIMIT))
+        self.assertEqual(spatial_index.parse_search('1e9', '1000'),
+                         (spatial_index.MAX_RADIUS_M, spatial_index.MAX_LIMIT))
+
+    def test_parse_search_not_positive_or_non_finite_raise_ValueError(self):
+        for radius, limit in (('nan', '5'), ('inf', '5'), ('-inf', '5'), ('-10', '5'), ('0', '5'), ('100', '0'),
+                              ('100', '-1'), ('100', 'x')):
+            with self.subTest(radius=radius, limit=limit):
+                with self.assertRaises(ValueError):
+                    spatial_index.parse_search(radius, limit)
+
+
+class TestStopIndexCache(unittest.TestCase):
+    def test_get_same_version_build_index_once(self):
+        loader = mock.Mock(return_value=[])
+        cache = spatial_index.StopIndexCache(loader)
+        first = cache.get(1, 1)
+        second = cache.get(1, 1)
+        loader.assert_called_once_with(1)
+        self.assertIs(first, second)
+
+    def test_get_new_version_build_index_again(self):
+        loader = mock.Mock(return_value=[])
+        cache = spatial_index.StopIndexCache(loader)
+        cache.get(1, 1)
+        cache.get(1, 2)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_put_return_index_cached_for_version(self):
+        cache = spatial_index.StopIndexCache(None)
+        index = cache.put(1, 1, [{'stop_id': '1', 'stop_lat': 51.1, 'stop_lon': 17.0}])
+        self.assertIs(cache.get_cached(1, 1), index)
+        self.assertIsNone(cache.get_cached(1, 2))
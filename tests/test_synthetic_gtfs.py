@@ -0,0 +1,36 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from benchmarks import synthetic_gtfs
+
+
+class TestSyntheticGtfs(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.zip_path = os.path.join(self.directory.name, 'Benchmark.zip')
+
+    def read_table(self, table_name: str) -> list:
+        with zipfile.ZipFile(self.zip_path) as zip_file:
+            with zip_file.open(table_name + '.txt') as raw:
+                return list(csv.reader(io.TextIOWrapper(raw, encoding='utf-8')))
+
+    def test_generate_feed_write_requested_number_of_stop_times(self):
+        size = synthetic_gtfs.generate_feed(self.zip_path, 1000, stops_per_trip=30)
+        stop_times = self.read_table('stop_times')
+        self.assertEqual(size['stop_times'], 1000)
+        self.assertEqual(len(stop_times) - 1, 1000)
+        self.assertListEqual(stop_times[0], synthetic_gtfs.COLUMNS['stop_times'])
+        self.assertEqual(len(self.read_table('trips')) - 1, size['trips'])
+
+    def test_generate_feed_same_seed_same_feed(self):
+        synthetic_gtfs.generate_feed(self.zip_path, 100, seed=1)
+        first = self.read_table('stop_times')
+        synthetic_gtfs.generate_feed(self.zip_path, 100, seed=1)
+        self.assertListEqual(self.read_table('stop_times'), first)
+
+    def test_format_gtfs_time_after_midnight(self):
+        self.assertEqual(synthetic_gtfs.format_gtfs_time(25 * 3600 + 61), '25:01:01')
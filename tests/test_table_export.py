@@ -0,0 +1,53 @@
+import datetime
+import decimal
+import os
+import tempfile
+import unittest
+import table_export
+
+
+@unittest.skipUnless(table_export.is_available(), 'pyarrow is not installed')
+class TestTableExport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.description = [('stop_id', 25), ('stop_lat', 1700), ('stop_sequence', 23), ('date', 1184)]
+        self.batches = [[('1', decimal.Decimal('52.36967'), 1,
+                          datetime.datetime(2023, 1, 10, tzinfo=datetime.timezone.utc))],
+                        [('2', None, 2, None)]]
+
+    def test_write_export_arrow_file_readable(self):
+        path = table_export.get_export_path(self.directory.name, 'Test', 'stops', 1, 'arrow')
+        table_export.write_export(path, self.description, self.batches, 'arrow')
+        with table_export.pa.memory_map(path) as source:
+            table = table_export.pa.ipc.open_file(source).read_all()
+        self.assertEqual(table.num_rows, 2)
+        self.assertListEqual(table.column('stop_lat').to_pylist(), [52.36967, None])
+        self.assertEqual(table.schema.field('stop_sequence').type, table_export.pa.int32())
+
+    def test_write_export_parquet_file_readable(self):
+        path = table_export.get_export_path(self.directory.name, 'Test', 'stops', 1, 'parquet')
+        table_export.write_export(path, self.description, self.batches, 'parquet')
+        table = table_export.pq.read_table(path)
+        self.assertListEqual(table.column('stop_id').to_pylist(), ['1', '2'])
+
+    def test_delete_other_versions_keep_current_version(self):
+        old_path = table_export.get_export_path(self.directory.name, 'Test', 'stops', 1, 'arrow')
+        new_path = table_export.get_export_path(self.directory.name, 'Test', 'stops', 2, 'arrow')
+        table_export.write_export(old_path, self.description, self.batches, 'arrow')
+        table_export.write_export(new_path, self.description, self.batches, 'arrow')
+        table_export.delete_other_versions(self.directory.name, 'Test', 'stops', new_path)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(new_path))
+
+    def test_delete_other_versions_keep_current_version_in_other_format(self):
+        old_path = table_export.get_export_path(self.directory.name, 'Test', 'stops', 2, 'arrow')
+        arrow_path = table_export.get_export_path(self.directory.name, 'Test', 'stops', 3, 'arrow')
+        parquet_path = table_export.get_export_path(self.directory.name, 'Test', 'stops', 3, 'parquet')
+        table_export.write_export(old_path, self.description, self.batches, 'arrow')
+        table_export.write_export(arrow_path, self.description, self.batches, 'arrow')
+        table_export.write_export(parquet_path, self.description, self.batches, 'parquet')
+        table_export.delete_other_versions(self.directory.name, 'Test', 'stops', parquet_path)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(arrow_path))
+        self.assertTrue(os.path.exists(parquet_path))
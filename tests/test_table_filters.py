@@ -0,0 +1,48 @@
+import unittest
+from psycopg2 import sql
+from werkzeug.datastructures import MultiDict
+import queries
+import table_filters
+
+
+class TestTableFilters(unittest.TestCase):
+    def test_parse_fields_empty_return_default_columns(self):
+        self.assertIsNone(table_filters.parse_fields(None, 'trips'))
+        self.assertListEqual(table_filters.parse_fields('', 'routes'), queries.API_TABLE_COLUMNS['routes'])
+
+    def test_parse_fields_return_unique_fields(self):
+        result = table_filters.parse_fields('trip_id, route_id,trip_id', 'trips')
+        self.assertListEqual(result, ['trip_id', 'route_id'])
+
+    def test_parse_fields_column_not_returned_by_api_raise_ValueError(self):
+        with self.assertRaises(ValueError):
+            table_filters.parse_fields('route_type', 'routes')
+
+    def test_parse_filters_return_equality_and_range_filters(self):
+        args = MultiDict([('stop_id', '12'), ('departure_time>', '08:00:00'), ('stop_sequence<', '5'),
+                          ('limit', '10'), ('fields', 'trip_id')])
+        result = table_filters.parse_filters(args, 'stop_times')
+        self.assertListEqual(result, [('stop_id', '=', '12'), ('departure_time', '>=', '08:00:00'),
+                                      ('stop_sequence', '<=', 5)])
+
+    def test_parse_filters_not_whitelisted_raise_ValueError(self):
+        with self.assertRaises(ValueError):
+            table_filters.parse_filters(MultiDict([('trip_headsign', 'Centrum')]), 'trips')
+        with self.assertRaises(ValueError):
+            table_filters.parse_filters(MultiDict([('route_id>', '1')]), 'trips')
+
+    def test_parse_filters_not_column_parameters_ignored(self):
+        args = MultiDict([('_', '1718000000'), ('utm_source', 'newsletter'), ('route_id', '1')])
+        self.assertListEqual(table_filters.parse_filters(args, 'trips'), [('route_id', '=', '1')])
+
+    def test_parse_filters_integer_column_incorrect_value_raise_ValueError(self):
+        with self.assertRaises(ValueError):
+            table_filters.parse_filters(MultiDict([('direction_id', 'north')]), 'trips')
+
+    def test_build_conditions_return_identifiers_and_params(self):
+        conditions, params = table_filters.build_conditions([('route_id', '=', '1'), ('direction_id', '=', 0)])
+        expected = sql.Composed([
+            sql.SQL(queries.FILTER_CONDITION).format(column=sql.Identifier('route_id'), operator=sql.SQL('=')),
+            sql.SQL(queries.FILTER_CONDITION).format(column=sql.Identifier('direction_id'), operator=sql.SQL('='))])
+        self.assertEqual(conditions, expected)
+        self.assertListEqual(params, ['1', 0])